@@ -0,0 +1,35 @@
+-- access_log 쿠키에서 식별값을 컬럼으로 분리 (수집 시점에 Controller.add_access_log 가 채움)
+-- 기존 row 는 scheduler access_log cookie_backfill 로 채움 (job_watermark 'access_log_cookie_columns')
+--   python main.py scheduler access_log cookie_backfill -1
+-- 주의: cookies 를 jsonb 로 바꾸는 ALTER ... TYPE 은 access_log 전체를 다시 쓰고 인덱스도 다시 만듦
+--   끝날 때까지 ACCESS EXCLUSIVE 잠금이 걸려 수집(INSERT)과 조회가 모두 멈추므로
+--   점검 시간에 실행하고, 테이블 크기만큼의 디스크 여유 공간을 확보한 뒤 실행
+-- CREATE INDEX CONCURRENTLY 는 트랜잭션 안에서 실행할 수 없으므로 psql 등으로 한 문장씩 실행
+-- API 조회는 cookie_backfill 이 끝날 때까지(job_watermark closed_until) cookies 식으로 찾으므로
+--   마지막 DROP INDEX 는 cookie_backfill 이 끝난 뒤 실행 (먼저 실행하면 그동안 조회가 느려짐)
+
+ALTER TABLE access_log ADD COLUMN IF NOT EXISTS md_uuid VARCHAR(100);
+ALTER TABLE access_log ADD COLUMN IF NOT EXISTS login_id VARCHAR(100);
+ALTER TABLE access_log ADD COLUMN IF NOT EXISTS member_id VARCHAR(100);
+ALTER TABLE access_log ADD COLUMN IF NOT EXISTS ga_id VARCHAR(100);
+ALTER TABLE access_log ADD COLUMN IF NOT EXISTS clck VARCHAR(200);
+
+ALTER TABLE access_log ALTER COLUMN cookies TYPE JSONB USING cookies::jsonb;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_access_log_md_uuid_col
+ON access_log (md_uuid, idx);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_access_log_login_id
+ON access_log (login_id, idx) WHERE login_id IS NOT NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_access_log_member_id
+ON access_log (member_id, idx) WHERE member_id IS NOT NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_access_log_ga_id
+ON access_log (ga_id) WHERE ga_id IS NOT NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_access_log_clck
+ON access_log (clck) WHERE clck IS NOT NULL;
+
+-- cookie_backfill 이 끝난 뒤 실행 (md_uuid 컬럼 인덱스로 대체됨)
+DROP INDEX CONCURRENTLY IF EXISTS idx_access_log_md_uuid_idx;
@@ -0,0 +1,9 @@
+-- 방문자 타임라인 조회용 인덱스 (Model.get_visitor_timeline)
+-- ip / _mdUUID 로 최근 row 부터 idx 역순으로 limit 만큼 읽을 때 사용
+-- cookies->>'_mdUUID' 는 조회 조건과 같은 식으로 만들어야 인덱스를 탐
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_access_log_ip_idx
+ON access_log (ip, idx);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_access_log_md_uuid_idx
+ON access_log ((cookies->>'_mdUUID'), idx);
@@ -0,0 +1,18 @@
+-- 주문 기여도를 모델별 / 날짜별 / utm 별로 나눈 결과 (scheduler access_log attribution 이 갱신)
+-- model : last_touch / first_touch / linear / time_decay
+-- 주문 전 ATTRIBUTION_LOOKBACK_DAYS 안의 utm 유입 세션(visit_session)이 없는 주문은 utm 이 모두 '' 인 row 로 들어감
+-- order_attribution_snapshot 에 주문 금액이 없는 주문은 전환 수 / 매출 모두에서 빠짐 (실행 로그에 제외 건수를 남김)
+-- 실행할 때마다 계산한 기간의 row 를 지우고 다시 넣음
+
+CREATE TABLE IF NOT EXISTS campaign_attribution (
+    order_date DATE NOT NULL,
+    model VARCHAR(20) NOT NULL,
+    utm_source TEXT NOT NULL DEFAULT '',
+    utm_medium TEXT NOT NULL DEFAULT '',
+    utm_campaign TEXT NOT NULL DEFAULT '',
+    utm_content TEXT NOT NULL DEFAULT '',
+    conversions DOUBLE PRECISION NOT NULL,
+    revenue DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (order_date, model, utm_source, utm_medium, utm_campaign, utm_content)
+);
@@ -0,0 +1,7 @@
+-- 클래리티 impressions 미수집 세션 조회용 부분 인덱스
+-- clarity/add_runtime 이 impressions 가 비어 있는 세션만 session_idx 순서로 읽을 때 사용
+-- 수집이 끝난 세션은 인덱스에서 빠지므로 이력이 쌓여도 인덱스 크기는 미수집 세션 수만큼만 유지됨
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_clarity_session_data_pending
+ON clarity_session_data (session_idx)
+WHERE impressions IS NULL;
@@ -0,0 +1,17 @@
+-- 방문자 식별값 연결 (scheduler access_log identity_graph 가 갱신)
+-- node 는 '<종류>:<값>' (uuid / member / ga / clarity), root 는 같은 방문자로 묶인 집합의 대표 node
+-- 다른 식별값과 연결된 node 만 저장하고, 저장되지 않은 node 는 자기 자신이 root
+-- 집합을 합칠 때 작은 쪽 node 의 root 를 모두 바꾸므로 root 는 항상 한 번에 찾을 수 있음
+
+CREATE TABLE IF NOT EXISTS identity_node (
+    node VARCHAR(300) PRIMARY KEY,
+    root VARCHAR(300) NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_identity_node_root
+ON identity_node (root);
+
+-- 서버가 바뀐 node 만 다시 읽을 때 사용
+CREATE INDEX IF NOT EXISTS idx_identity_node_updated_at
+ON identity_node (updated_at);
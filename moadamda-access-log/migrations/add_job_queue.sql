@@ -0,0 +1,26 @@
+-- Postgres 작업 대기열 (core/job_queue.py)
+-- (queue, job_key) 가 같은 작업은 한 번만 들어감 (예: 슬랙 이벤트 ts)
+-- worker 는 FOR UPDATE SKIP LOCKED 로 가져가고, 실패하면 run_at 을 늦춰 다시 시도함
+-- running 인 채로 stale 시간이 지나면 다시 가져가고, 시도 횟수를 다 썼으면 failed 로 남김
+-- complete / fail 은 claim 때의 locked_at 이 같을 때만 바꿈 (다시 가져간 worker 의 상태를 덮어쓰지 않음)
+
+CREATE TABLE IF NOT EXISTS job_queue (
+    idx BIGSERIAL PRIMARY KEY,
+    queue VARCHAR(50) NOT NULL,
+    job_key VARCHAR(200) NOT NULL,
+    payload JSONB NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending', -- pending / running / done / failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    locked_at TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    UNIQUE (queue, job_key)
+);
+
+-- 처리할 작업만 들어가는 부분 인덱스
+CREATE INDEX IF NOT EXISTS idx_job_queue_ready
+ON job_queue (queue, run_at)
+WHERE status IN ('pending', 'running');
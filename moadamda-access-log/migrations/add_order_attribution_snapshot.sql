@@ -0,0 +1,10 @@
+-- 주문별 유입 분석 결과 (Controller._get_order_info)
+-- 슬랙 알림 때 계산한 결과를 슬랙 재시도 / 다음날 구매 통계에서 다시 사용
+-- 다시 계산해야 하면 DELETE /attribution/{order_id} 로 지움
+
+CREATE TABLE IF NOT EXISTS order_attribution_snapshot (
+    order_id VARCHAR(50) PRIMARY KEY,
+    data JSONB NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,13 @@
+-- 서버 워커별 상위 url / referer / 광고 url 스케치 (common.topk 가 TRAFFIC_FLUSH_SECONDS 마다 덮어씀)
+-- dimension : url / referer / campaign_url, window_start : TOPK_WINDOW_MINUTES 단위 구간의 시작
+-- data 는 Space-Saving 스케치 {capacity, counters : {값 : [count, error]}}
+-- 읽을 때 같은 (dimension, window_start) 의 워커 row 를 합침
+
+CREATE TABLE IF NOT EXISTS topk_snapshot (
+    dimension VARCHAR(20) NOT NULL,
+    window_start TIMESTAMP NOT NULL,
+    worker_id VARCHAR(100) NOT NULL,
+    data JSONB NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (dimension, window_start, worker_id)
+);
@@ -0,0 +1,18 @@
+-- 서버 워커별 실시간 유입 카운터 (common.traffic_counter 가 TRAFFIC_FLUSH_SECONDS 마다 덮어씀)
+-- granularity : minute / hour, bucket : 그 분 / 시간의 시작
+-- uniques 는 _mdUUID HyperLogLog 레지스터 (precision 11, 2048 byte)
+-- 워커별 누적값을 덮어쓰므로 읽을 때 같은 (bucket, utm) 의 워커 row 를 합침 (count 합, uniques 는 레지스터 최댓값)
+
+CREATE TABLE IF NOT EXISTS traffic_counter (
+    granularity VARCHAR(10) NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    utm_source TEXT NOT NULL DEFAULT '',
+    utm_medium TEXT NOT NULL DEFAULT '',
+    utm_campaign TEXT NOT NULL DEFAULT '',
+    utm_content TEXT NOT NULL DEFAULT '',
+    worker_id VARCHAR(100) NOT NULL,
+    count BIGINT NOT NULL,
+    uniques BYTEA NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (granularity, bucket, utm_source, utm_medium, utm_campaign, utm_content, worker_id)
+);
@@ -0,0 +1,27 @@
+-- utm 유입 시간별 집계 (scheduler access_log utm_rollup 이 갱신)
+-- /log 는 닫힌 시간(closed_until 이전)은 utm_hourly_rollup 에서, 나머지는 access_log 에서 읽음
+
+-- 증분 작업이 마지막으로 처리한 위치
+CREATE TABLE IF NOT EXISTS job_watermark (
+    name VARCHAR(100) PRIMARY KEY,
+    last_idx BIGINT NOT NULL DEFAULT 0,
+    closed_until TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- 이미 센 유입 (fbclid, 없으면 ip + url 의 md5) 과 처음 들어온 시간
+CREATE TABLE IF NOT EXISTS utm_traffic_seen (
+    dedup_key VARCHAR(32) PRIMARY KEY,
+    access_hour TIMESTAMP NOT NULL
+);
+
+-- 값이 없는 utm 은 '' 로 저장 (기본키에 NULL 을 넣을 수 없음)
+CREATE TABLE IF NOT EXISTS utm_hourly_rollup (
+    access_hour TIMESTAMP NOT NULL,
+    utm_source TEXT NOT NULL DEFAULT '',
+    utm_campaign TEXT NOT NULL DEFAULT '',
+    utm_medium TEXT NOT NULL DEFAULT '',
+    utm_content TEXT NOT NULL DEFAULT '',
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (access_hour, utm_source, utm_campaign, utm_medium, utm_content)
+);
@@ -0,0 +1,29 @@
+-- access_log 를 _mdUUID 별 방문(세션)으로 묶은 결과 (scheduler access_log sessionize 가 갱신)
+-- 앞 페이지와 SESSION_GAP_MINUTES 넘게 떨어지거나 다른 utm 으로 들어오면 새 세션
+-- 처리한 위치는 job_watermark 'visit_session'
+
+CREATE TABLE IF NOT EXISTS visit_session (
+    idx BIGSERIAL PRIMARY KEY,
+    md_uuid VARCHAR(100) NOT NULL,
+    start_log_idx BIGINT NOT NULL UNIQUE,
+    end_log_idx BIGINT NOT NULL,
+    started_at TIMESTAMP NOT NULL,
+    ended_at TIMESTAMP NOT NULL,
+    page_count INTEGER NOT NULL DEFAULT 1,
+    entry_url TEXT,
+    exit_url TEXT,
+    utm_source TEXT,
+    utm_medium TEXT,
+    utm_campaign TEXT,
+    utm_content TEXT,
+    ip VARCHAR(100),
+    device VARCHAR(100)
+);
+
+-- 방문자별 최근 세션 (이어 붙일 세션 찾기, 주문 분석)
+CREATE INDEX IF NOT EXISTS idx_visit_session_md_uuid_started_at
+ON visit_session (md_uuid, started_at);
+
+-- 기간별 분석
+CREATE INDEX IF NOT EXISTS idx_visit_session_started_at
+ON visit_session (started_at);
@@ -1 +1,4 @@
-from . import clarity_content
\ No newline at end of file
+from . import clarity_content
+from . import impression_benchmark
+from . import purchase_image_benchmark
+from . import utm_session
@@ -0,0 +1,37 @@
+import random
+import time
+from scheduler.clarity import impression_metrics
+
+EVENT_TYPES = ['Page hidden', 'Page visible', 'Click', 'Scroll', 'Resize']
+EVENT_WEIGHTS = [1, 1, 6, 10, 2]
+
+
+def make_sessions(session_count, seed=0):
+    rand = random.Random(seed)
+    sessions = []
+    for _ in range(session_count):
+        page_list = []
+        for _ in range(rand.randint(0, 8)):
+            duration = rand.randint(0, 600000)
+            starts = sorted(rand.randint(0, duration) for _ in range(rand.randint(0, 40)))
+            page_list.append({
+                'duration' : duration,
+                'timelineEvents' : [
+                    {'start' : start, 'eventtype' : event_type}
+                    for start, event_type in zip(starts, rand.choices(EVENT_TYPES, EVENT_WEIGHTS, k=len(starts)))
+                ]
+            })
+        sessions.append(page_list)
+    return sessions
+
+
+async def run():
+    """compute_metrics 처리 시간 측정 (결과 검증은 tests/test_impression_metrics.py)"""
+    sessions = make_sessions(20000)
+
+    start_time = time.time()
+    impression_metrics.compute_metrics(sessions)
+    elapsed = time.time() - start_time
+
+    page_count = sum(len(page_list) for page_list in sessions)
+    print(f'세션 {len(sessions)}개 / 페이지 {page_count}개 : {elapsed:.3f}초')
@@ -0,0 +1,69 @@
+import random
+import time
+import traceback
+from datetime import datetime, timedelta
+from common import purchase_image
+
+RUN_COUNT = 20
+
+
+def make_sections(seed=0):
+    """주문 한 건 분량의 구매 정보 표 (운영에서 나오는 크기와 비슷하게)"""
+    rand = random.Random(seed)
+    base_date = datetime(2025, 1, 1, 12)
+    order_history = [['날짜','상품명','금액']]
+    for i in range(rand.randint(2, 6)):
+        order_history.append([
+            (base_date - timedelta(days=30*i)).strftime('%Y-%m-%d %H:%M'),
+            ', '.join(['[반값특가] 건강을 모아담다'] * rand.randint(1, 3)),
+            "{:,}".format(rand.randint(1, 20) * 5500)
+        ])
+    campaign_history = [['날짜','캠페인 명']]
+    for i in range(rand.randint(3, 10)):
+        campaign_history.append([
+            (base_date - timedelta(hours=i*7)).strftime('%Y-%m-%d %H:%M:%S'),
+            f'meta/{rand.randint(100000,999999)}_전환캠페인/{rand.randint(100000,999999)}_소재_{i}'
+        ])
+    page_move_history = [['날짜','페이지','체류시간(초)']]
+    for i in range(rand.randint(20, 60)):
+        page_move_history.append([
+            (base_date + timedelta(seconds=i*40)).strftime('%Y-%m-%d %H:%M:%S'),
+            rand.choice(['/', '/product/detail.html', '/order/orderform.html', '/order/order_result.html']),
+            rand.choice(['', rand.randint(1, 400) + 0.5])
+        ])
+    return {
+        "구매 정보": [
+            ["구매 날짜", base_date],
+            ["아이피", '127.0.0.1'],
+            ["환경", 'mobile'],
+            ["구매 금액", '55,000']
+        ],
+        "과거 구매 기록": order_history,
+        "동일 쿠키 유입 기록": campaign_history,
+        "동일 아이피 유입 기록": campaign_history,
+        "페이지 이동 경로": page_move_history
+    }
+
+
+async def run():
+    sections_list = [make_sections(seed) for seed in range(RUN_COUNT)]
+    for name, renderer in purchase_image.RENDERERS.items():
+        elapsed_list = []
+        size_list = []
+        try:
+            for sections in sections_list:
+                start_time = time.time()
+                image = renderer(sections)
+                elapsed_list.append(time.time() - start_time)
+                size_list.append(len(image))
+        except Exception:
+            traceback.print_exc()
+            print(f'{name} 실행 실패')
+            continue
+        elapsed_list.sort()
+        print(
+            f'{name} : 평균 {sum(elapsed_list)/len(elapsed_list)*1000:.1f}ms, '
+            f'p95 {elapsed_list[int(len(elapsed_list)*0.95)-1]*1000:.1f}ms, '
+            f'첫 실행 포함 최대 {elapsed_list[-1]*1000:.1f}ms, '
+            f'평균 크기 {sum(size_list)//len(size_list)} bytes'
+        )
@@ -0,0 +1,54 @@
+from core.postgres import connection
+from datetime import datetime,timedelta
+from common import utils
+
+async def run():
+    """visit_session 으로 utm 별 유입 세션 수 / 이탈율 / 세션당 페이지 수 / 평균 체류시간을 계산합니다."""
+    end_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start_date = end_date - timedelta(days=7)
+    async with connection() as conn:
+        rows = await conn.fetch(
+            """
+                SELECT
+                    utm_source, utm_medium, utm_campaign, utm_content,
+                    count(*) AS total,
+                    avg(page_count) AS average_page_count,
+                    avg(extract(epoch FROM ended_at - started_at)) AS average_duration,
+                    count(*) FILTER (WHERE page_count = 1 AND ended_at - started_at <= interval '5 second') AS under_5,
+                    count(*) FILTER (WHERE page_count = 1 AND ended_at - started_at <= interval '10 second') AS under_10,
+                    count(*) FILTER (WHERE page_count = 1 AND ended_at - started_at <= interval '15 second') AS under_15,
+                    count(*) FILTER (WHERE page_count = 1 AND ended_at - started_at <= interval '30 second') AS under_30
+                FROM visit_session
+                WHERE started_at >= $1 AND started_at < $2
+                AND utm_source IS NOT NULL
+                GROUP BY 1, 2, 3, 4
+                ORDER BY total DESC
+            """,start_date,end_date
+        )
+    columns = {
+        'utm_source' : 'utm_source',
+        'utm_medium' : 'utm_medium',
+        'utm_campaign' : 'utm_campaign',
+        'utm_content' : 'utm_content',
+        'under_5' : '5초내 이탈율',
+        'under_10' : '10초내 이탈율',
+        'under_15' : '15초내 이탈율',
+        'under_30' : '30초내 이탈율',
+        'average_page_count' : '세션당 페이지 수',
+        'average_duration' : '평균 체류시간(초)',
+        'total' : '전체 유입수'
+    }
+    headers = '\t'.join(list(columns.values()))
+    csv = [headers]
+    for row in rows:
+        data = {}
+        for key in ['utm_source','utm_medium','utm_campaign','utm_content']:
+            data[key] = utils.ununquote(row[key] or '')
+        for key in ['under_5','under_10','under_15','under_30']:
+            data[key] = str(round(row[key]/row['total'],2))
+        data['average_page_count'] = str(round(float(row['average_page_count']),2))
+        data['average_duration'] = str(round(float(row['average_duration']),2))
+        data['total'] = str(row['total'])
+        csv.append('\t'.join([data[key] for key in columns.keys()]))
+    with open(f'./output/utm_session.csv','wt') as f:
+        f.write('\n'.join(csv))
@@ -0,0 +1,50 @@
+import hashlib
+import numpy as np
+
+
+class HyperLogLog:
+    """고유 값 수를 근사하는 HyperLogLog 스케치
+
+    2^precision 개의 1byte 레지스터를 쓰고 오차는 약 1.04 / sqrt(2^precision) 입니다 (precision 11 이면 2KB, 약 2.3%).
+    같은 precision 끼리 merge 하면 두 집합의 합집합을 센 것과 같습니다.
+    """
+    def __init__(self, precision=11, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.value_bits = 64 - precision
+        self.value_mask = (1 << self.value_bits) - 1
+        if registers is None:
+            registers = np.zeros(self.size, dtype=np.uint8)
+        self.registers = registers
+
+    def add(self, value):
+        hashed = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+        index = hashed >> self.value_bits
+        rank = self.value_bits - (hashed & self.value_mask).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError('precision 이 다른 HyperLogLog 는 합칠 수 없습니다.')
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        # 값이 적을 때는 빈 레지스터 수로 계산 (linear counting)
+        if estimate <= 2.5 * self.size and zeros:
+            estimate = self.size * np.log(self.size / zeros)
+        return int(round(estimate))
+
+    def copy(self):
+        return HyperLogLog(self.precision, self.registers.copy())
+
+    def to_bytes(self):
+        return self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data, precision=11):
+        return cls(precision, np.frombuffer(data, dtype=np.uint8).copy())
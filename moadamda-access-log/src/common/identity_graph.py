@@ -0,0 +1,155 @@
+import asyncio
+import time
+from datetime import timedelta
+from conf.settings import settings
+
+REFRESH_LOOKBACK = timedelta(minutes=1) # 늦게 커밋된 변경을 놓치지 않도록 앞쪽을 겹쳐서 읽음
+
+
+def make_node(kind, value):
+    """식별값을 identity_node.node 형태로 바꿉니다. 값이 없으면 None"""
+    if not value:
+        return None
+    if kind == 'ga':
+        # GA1.1.123.456 → 123.456 (GA4 client_id 와 같은 형태)
+        value = '.'.join(value.split('.')[-2:])
+    elif kind == 'clarity':
+        # _clck 의 첫 값이 clarity 사용자 id
+        value = value.split('|')[0]
+    if not value:
+        return None
+    return f'{kind}:{value}'
+
+
+class IdentityGraph:
+    """같은 방문자로 묶인 식별값(uuid / member / ga / clarity)을 union-find 로 관리합니다.
+
+    root_dict 에는 각 node 의 root 를 바로 넣어 두므로 find 는 dict 조회 한 번입니다.
+    union 은 작은 집합의 node 들을 큰 집합의 root 로 옮기고, 바뀐 node 는 dirty 에 모아 flush 로 저장합니다.
+    identity_node 에 쓰는 것은 scheduler access_log identity_graph 하나뿐이고,
+    서버는 IDENTITY_REFRESH_SECONDS 마다 바뀐 node 만 다시 읽습니다.
+    """
+    def __init__(self):
+        self.root_dict = {}
+        self.members = {}
+        self.dirty = {}
+        self.loaded_until = None
+        self.refreshed_at = 0
+        self.lock = None
+
+    def clear(self):
+        self.root_dict = {}
+        self.members = {}
+        self.dirty = {}
+        self.loaded_until = None
+        self.refreshed_at = 0
+
+    async def refresh(self, conn):
+        """identity_node 에서 마지막으로 읽은 뒤 바뀐 node 를 읽어 반영합니다."""
+        now = await conn.fetchval("""SELECT now()::timestamp""")
+        rows = await conn.fetch(
+            """
+                SELECT node, root FROM identity_node
+                WHERE $1::timestamp IS NULL OR updated_at >= $1
+            """,self.loaded_until
+        )
+        for row in rows:
+            self._set_root(row['node'], row['root'])
+        self.loaded_until = now - REFRESH_LOOKBACK
+        self.refreshed_at = time.monotonic()
+        return len(rows)
+
+    async def refresh_if_stale(self, conn):
+        if time.monotonic() - self.refreshed_at < settings.IDENTITY_REFRESH_SECONDS:
+            return
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if time.monotonic() - self.refreshed_at >= settings.IDENTITY_REFRESH_SECONDS:
+                await self.refresh(conn)
+
+    def _set_root(self, node, root):
+        old_root = self.root_dict.get(node, node)
+        if old_root == root and node in self.root_dict:
+            return
+        if old_root in self.members:
+            self.members[old_root].discard(node)
+            if not self.members[old_root]:
+                del self.members[old_root]
+        self.root_dict[node] = root
+        self.members.setdefault(root, set()).add(node)
+
+    def find(self, node):
+        return self.root_dict.get(node, node)
+
+    def size(self, node):
+        return len(self.members.get(self.find(node), ())) or 1
+
+    def get_members(self, node):
+        root = self.find(node)
+        return sorted(self.members.get(root, {root}))
+
+    def union(self, a, b, max_size=None):
+        """a 와 b 의 집합을 합치고 합쳐졌는지 리턴합니다.
+
+        :param max_size: 합친 집합이 이보다 커지면 합치지 않음 (ip + ua 처럼 약한 연결에 사용)
+        """
+        root_a = self.find(a)
+        root_b = self.find(b)
+        if root_a == root_b:
+            return False
+        size_a = self.size(root_a)
+        size_b = self.size(root_b)
+        if max_size is not None and size_a + size_b > max_size:
+            return False
+        if size_a < size_b:
+            root_a, root_b = root_b, root_a
+        for node in self.get_members(root_b):
+            self._set_root(node, root_a)
+            self.dirty[node] = root_a
+        if root_a not in self.root_dict:
+            self._set_root(root_a, root_a)
+            self.dirty[root_a] = root_a
+        return True
+
+    async def flush(self, conn):
+        """union 으로 바뀐 node 를 identity_node 에 저장합니다. 트랜잭션 안에서 호출합니다."""
+        if not self.dirty:
+            return 0
+        nodes = list(self.dirty.keys())
+        await conn.execute(
+            """
+                INSERT INTO identity_node (node, root, updated_at)
+                SELECT node, root, now() FROM unnest($1::text[], $2::text[]) AS t(node, root)
+                ON CONFLICT(node)
+                DO UPDATE SET root = excluded.root, updated_at = excluded.updated_at
+            """,nodes,[self.dirty[node] for node in nodes]
+        )
+        self.dirty = {}
+        return len(nodes)
+
+    async def resolve(self, conn, kind, value):
+        """식별값이 속한 방문자(root node)를 리턴합니다."""
+        node = make_node(kind, value)
+        if node is None:
+            return None
+        await self.refresh_if_stale(conn)
+        return self.find(node)
+
+    async def resolve_members(self, conn, kind, value, member_kind=None):
+        """식별값과 같은 방문자로 묶인 node 목록을 리턴합니다.
+
+        :param member_kind: 주면 이 종류의 값만 (prefix 없이) 리턴
+        """
+        node = make_node(kind, value)
+        if node is None:
+            return []
+        await self.refresh_if_stale(conn)
+        members = self.get_members(node)
+        if member_kind is None:
+            return members
+        prefix = f'{member_kind}:'
+        return [member[len(prefix):] for member in members if member.startswith(prefix)]
+
+
+graph = IdentityGraph()
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import os
+import socket
+import time
+import traceback
+from collections import Counter, deque
+from datetime import datetime
+from common.traffic_counter import parse_utm
+from conf.settings import settings
+from core.postgres import connection, listen_connection
+
+CHANNEL = 'live_feed'
+EMIT_DELAY = 3 # 다른 워커의 프레임이 도착할 때까지 기다리는 시간(초)
+PUBLISH_OFFSET = 0.05 # 초가 바뀐 직후 닫힌 초를 보냄 (초 경계에서 이만큼 뒤)
+MAX_URL_LENGTH = 200
+MAX_PAYLOAD_BYTES = 8000 # NOTIFY payload 최대 크기 (이보다 작아질 때까지 목록을 줄임)
+
+
+def make_path(url):
+    return url.replace('https://m.moadamda.com','').replace('https://moadamda.com','').split('?')[0][:MAX_URL_LENGTH]
+
+
+def empty_frame():
+    return {'events' : Counter(), 'urls' : Counter(), 'utm_content' : Counter(), 'errors' : 0, 'orders' : set()}
+
+
+class LiveFeed:
+    """수집 / 오류 / 주문을 초 단위로 모아 SSE 구독자에게 보냅니다.
+
+    수집 경로에서는 현재 초의 dict 만 갱신하고, run() 이 매초 닫힌 초를 pg_notify 로 모든 워커에 보냅니다.
+    각 워커는 LISTEN 으로 받은 프레임을 초 별로 합쳐 EMIT_DELAY 초 뒤에 ring buffer 에 넣고 구독자 queue 에 나눠 줍니다.
+    구독자 queue 가 가득 차면 가장 오래된 프레임을 버리므로 느린 구독자가 있어도 수집과 다른 구독자는 기다리지 않습니다.
+    """
+    def __init__(self):
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.local = {} # 초 : 이 워커의 프레임
+        self.pending = {} # 초 : 모든 워커에서 받은 프레임을 합친 값
+        self.frames = deque(maxlen=settings.LIVE_FEED_HISTORY_SECONDS)
+        self.subscribers = {} # queue : 버린 프레임 수
+        self.emitted_second = None
+
+    def _frame(self):
+        second = int(time.time())
+        frame = self.local.get(second)
+        if frame is None:
+            frame = self.local[second] = empty_frame()
+        return frame
+
+    def record_access(self, log_type, url):
+        frame = self._frame()
+        frame['events'][log_type] += 1
+        if log_type != 'enter':
+            return
+        frame['urls'][make_path(url)] += 1
+        utm_content = parse_utm(url)[3]
+        if utm_content:
+            frame['utm_content'][utm_content[:MAX_URL_LENGTH]] += 1
+        if 'order_result' in url and 'order_id=' in url:
+            frame['orders'].add(url.split('order_id=')[1].split('&')[0])
+
+    def record_error(self):
+        self._frame()['errors'] += 1
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=settings.LIVE_FEED_QUEUE_SIZE)
+        self.subscribers[queue] = 0
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.pop(queue, None)
+
+    def broadcast(self, frame):
+        for queue in list(self.subscribers.keys()):
+            if queue.full():
+                queue.get_nowait()
+                self.subscribers[queue] += 1
+            queue.put_nowait({**frame, 'dropped' : self.subscribers[queue]})
+
+    def on_notify(self, conn, pid, channel, payload):
+        data = json.loads(payload)
+        second = data['second']
+        if self.emitted_second is not None and second <= self.emitted_second:
+            return
+        frame = self.pending.get(second)
+        if frame is None:
+            frame = self.pending[second] = empty_frame()
+        for key in ['events', 'urls', 'utm_content']:
+            frame[key].update(dict(data[key]))
+        frame['errors'] += data['errors']
+        frame['orders'].update(data['orders'])
+
+    def make_payload(self, second, frame):
+        """NOTIFY payload. MAX_PAYLOAD_BYTES 보다 크면 url / utm_content / 주문 목록을 반씩 줄입니다."""
+        top_n = settings.LIVE_FEED_TOP_N * 2 # 워커마다 조금 더 보내서 합친 뒤 상위 N 개를 고름
+        data = {
+            'worker_id' : self.worker_id,
+            'second' : second,
+            'events' : dict(frame['events']),
+            'urls' : frame['urls'].most_common(top_n),
+            'utm_content' : frame['utm_content'].most_common(top_n),
+            'errors' : frame['errors'],
+            'orders' : sorted(frame['orders']),
+        }
+        while True:
+            payload = json.dumps(data, ensure_ascii=False)
+            if len(payload.encode()) < MAX_PAYLOAD_BYTES:
+                return payload
+            longest = max(['urls', 'utm_content', 'orders'], key=lambda key: len(data[key]))
+            if not data[longest]:
+                # 목록을 다 비워도 크면 이벤트 종류 수만 남김
+                data['events'] = {}
+                return json.dumps(data, ensure_ascii=False)
+            data[longest] = data[longest][:len(data[longest]) // 2]
+
+    def emit(self, second):
+        frame = self.pending.pop(second, None) or empty_frame()
+        result = {
+            'second' : second,
+            'time' : datetime.fromtimestamp(second).strftime('%Y-%m-%d %H:%M:%S'),
+            'events' : dict(frame['events']),
+            'events_per_second' : sum(frame['events'].values()),
+            'top_urls' : frame['urls'].most_common(settings.LIVE_FEED_TOP_N),
+            'top_utm_content' : frame['utm_content'].most_common(settings.LIVE_FEED_TOP_N),
+            'errors' : frame['errors'],
+            'orders' : sorted(frame['orders']),
+        }
+        self.frames.append(result)
+        self.emitted_second = second
+        self.broadcast(result)
+
+    async def publish(self):
+        """이 워커의 닫힌 초 프레임을 매초 경계 직후 pg_notify 로 보냅니다.
+
+        프레임마다 따로 보내고, 보내지 못한 프레임은 EMIT_DELAY 안이면 다음 초에 다시 보냅니다.
+        """
+        while True:
+            await asyncio.sleep(1 - time.time() % 1 + PUBLISH_OFFSET)
+            now = int(time.time())
+            for second in [second for second in sorted(self.local) if second < now - EMIT_DELAY]:
+                # 이미 내보낸 초라 늦게 보내도 버려짐
+                del self.local[second]
+            closed = [second for second in sorted(self.local) if second < now]
+            if not closed:
+                continue
+            try:
+                async with connection() as conn:
+                    for second in closed:
+                        try:
+                            await conn.execute(
+                                """SELECT pg_notify($1, $2)""",CHANNEL,self.make_payload(second, self.local[second])
+                            )
+                            del self.local[second]
+                        except Exception:
+                            traceback.print_exc()
+            except Exception:
+                traceback.print_exc()
+
+    async def listen(self):
+        """live_feed 채널을 LISTEN 하고, 연결이 끊기면 다시 연결합니다."""
+        while True:
+            try:
+                async with listen_connection() as conn:
+                    await conn.add_listener(CHANNEL, self.on_notify)
+                    while not conn.is_closed():
+                        await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                traceback.print_exc()
+                await asyncio.sleep(5)
+
+    async def tick(self):
+        """매초 EMIT_DELAY 초 전의 프레임을 합친 값으로 내보냅니다 (수집이 없던 초는 0 으로)."""
+        while True:
+            await asyncio.sleep(1 - time.time() % 1)
+            second = int(time.time()) - EMIT_DELAY
+            start_second = second if self.emitted_second is None else self.emitted_second + 1
+            for emit_second in range(max(start_second, second - EMIT_DELAY), second + 1):
+                self.emit(emit_second)
+            for old_second in [key for key in self.pending if key <= second]:
+                del self.pending[old_second]
+
+    async def run(self):
+        await asyncio.gather(self.publish(), self.listen(), self.tick())
+
+    async def stream(self, request):
+        """SSE 스트림. 최근 LIVE_FEED_HISTORY_SECONDS 초를 먼저 보내고 이후 매초 프레임을 보냅니다."""
+        queue = self.subscribe()
+        try:
+            for frame in list(self.frames):
+                yield f'id: {frame["second"]}\ndata: {json.dumps({**frame, "dropped" : 0}, ensure_ascii=False)}\n\n'
+            while not await request.is_disconnected():
+                try:
+                    frame = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f'id: {frame["second"]}\ndata: {json.dumps(frame, ensure_ascii=False)}\n\n'
+        finally:
+            self.unsubscribe(queue)
+
+
+feed = LiveFeed()
@@ -0,0 +1,112 @@
+import threading
+import time
+from contextlib import contextmanager
+
+REGISTRY = {}
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join([f'{name}="{value}"' for name, value in pairs]) + '}'
+
+
+class Counter:
+    """누적 값 (프로세스 단위)"""
+    kind = 'counter'
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY[name] = self
+
+    def inc(self, value=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def collect(self):
+        with self.lock:
+            return [f'{self.name}{_format_labels(key)} {value}' for key, value in self.values.items()]
+
+
+class Gauge:
+    """현재 값 (프로세스 단위)"""
+    kind = 'gauge'
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY[name] = self
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+    def collect(self):
+        with self.lock:
+            return [f'{self.name}{_format_labels(key)} {value}' for key, value in self.values.items()]
+
+
+class Histogram:
+    """구간별 개수 / 합계 / 개수 (프로세스 단위)"""
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.values = {} # label : [구간별 개수..., 합계, 개수]
+        self.lock = threading.Lock()
+        REGISTRY[name] = self
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            row = self.values.get(key)
+            if row is None:
+                row = self.values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def collect(self):
+        res = []
+        with self.lock:
+            for key, row in self.values.items():
+                for bound, count in zip(self.buckets, row):
+                    res.append(f'{self.name}_bucket{_format_labels(key, [("le", bound)])} {count}')
+                res.append(f'{self.name}_bucket{_format_labels(key, [("le", "+Inf")])} {row[-1]}')
+                res.append(f'{self.name}_sum{_format_labels(key)} {row[-2]}')
+                res.append(f'{self.name}_count{_format_labels(key)} {row[-1]}')
+        return res
+
+
+def render():
+    """등록된 지표를 Prometheus text 형식으로 리턴합니다."""
+    lines = []
+    for name, metric in REGISTRY.items():
+        lines.append(f'# HELP {name} {metric.description}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,81 @@
+import asyncio
+import traceback
+
+_DONE = object()
+
+
+async def run_pipeline(items, worker, concurrency, on_batch=None, batch_size=100):
+    """items 를 concurrency 개의 worker 로 병렬 처리합니다.
+
+    생산자가 items(일반/async iterable)를 큐에 넣고 소비자들이 worker(item) 를 실행합니다.
+    결과는 (item, result) 형태로 모아서 batch_size 단위로 on_batch 에 넘기며,
+    on_batch 는 한 번에 하나씩만 실행됩니다.
+    worker 에서 예외가 난 item 은 로그만 남기고 결과에서 빠집니다.
+
+    :param items: 처리할 대상 목록
+    :param worker: item 하나를 받아 결과를 리턴하는 코루틴 함수
+    :param concurrency: 동시에 실행할 worker 수
+    :param on_batch: 결과 batch 를 받는 코루틴 함수, 없으면 결과 목록을 입력 순서대로 리턴
+    :param batch_size: on_batch 에 넘길 결과 수
+    """
+    concurrency = max(1, concurrency)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    result_queue = asyncio.Queue(maxsize=batch_size * 2)
+    collected = []
+
+    async def produce():
+        index = 0
+        if hasattr(items, '__aiter__'):
+            async for item in items:
+                await queue.put((index, item))
+                index += 1
+        else:
+            for item in items:
+                await queue.put((index, item))
+                index += 1
+        for _ in range(concurrency):
+            await queue.put(_DONE)
+
+    async def consume():
+        while True:
+            job = await queue.get()
+            if job is _DONE:
+                return
+            index, item = job
+            try:
+                result = await worker(item)
+            except Exception:
+                traceback.print_exc()
+                continue
+            await result_queue.put((index, item, result))
+
+    async def emit(batch):
+        if on_batch is None:
+            collected.extend(batch)
+        else:
+            await on_batch([(item, result) for _, item, result in batch])
+
+    async def write():
+        batch = []
+        while True:
+            job = await result_queue.get()
+            if job is _DONE:
+                break
+            batch.append(job)
+            if len(batch) >= batch_size:
+                await emit(batch)
+                batch = []
+        if batch:
+            await emit(batch)
+
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(produce())
+        tg.create_task(write())
+        async with asyncio.TaskGroup() as workers:
+            for _ in range(concurrency):
+                workers.create_task(consume())
+        await result_queue.put(_DONE)
+
+    if on_batch is None:
+        collected.sort(key=lambda row: row[0])
+        return [(item, result) for _, item, result in collected]
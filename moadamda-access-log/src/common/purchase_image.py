@@ -0,0 +1,214 @@
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import imgkit
+import pandas as pd
+from PIL import Image, ImageDraw, ImageFont
+
+from common import metrics
+from conf.settings import settings
+
+RENDER_SECONDS = metrics.Histogram(
+    'purchase_image_render_seconds', '구매 정보 이미지 생성 시간(초)'
+)
+RENDER_WAIT_SECONDS = metrics.Histogram(
+    'purchase_image_render_wait_seconds', '구매 정보 이미지 생성 요청부터 완료까지 걸린 시간(초)'
+)
+HTML_STYLE = "<html><head><style>body {font-family: 'Nanum Gothic', 'Noto Sans CJK KR', sans-serif;} table {border-collapse: collapse; width: 100%; word-wrap: break-word;} th, td {border: 1px solid black; padding: 8px; text-align: left;} th {background-color: #f2f2f2;}</style></head><body>"
+
+PAGE_WIDTH = 1024
+PAGE_MARGIN = 8
+CELL_PADDING = 8
+FONT_SIZE = 16
+TITLE_FONT_SIZE = 24
+LINE_SPACING = 4
+
+_executor = None
+
+
+def get_executor():
+    # wkhtmltoimage 는 별도 프로세스로 실행되므로 스레드 풀로 동시 실행 수만 제한
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.RENDER_WORKER_COUNT,
+            thread_name_prefix='purchase-image'
+        )
+    return _executor
+
+
+def render_with_imgkit(sections):
+    """{제목 : 표 row 목록} 을 wkhtmltoimage 로 그려 PNG bytes 로 리턴합니다."""
+    html = HTML_STYLE
+    for title, rows in sections.items():
+        df = pd.DataFrame(rows)
+        html += f"<h2>{title}</h2>"
+        html += df.to_html(index=False, header=False)
+    html += "</body></html>"
+
+    img = imgkit.from_string(html, False)
+    image = Image.open(io.BytesIO(img))
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+@lru_cache(maxsize=None)
+def get_font(size, bold=False):
+    path = settings.RENDER_FONT_PATH
+    if bold and os.path.exists(settings.RENDER_BOLD_FONT_PATH):
+        path = settings.RENDER_BOLD_FONT_PATH
+    return ImageFont.truetype(path, size, layout_engine=ImageFont.Layout.BASIC)
+
+
+@lru_cache(maxsize=65536)
+def char_width(char, size, bold=False):
+    return get_font(size, bold).getlength(char)
+
+
+@lru_cache(maxsize=65536)
+def get_glyph(char, size, bold=False):
+    """글자 하나의 (mask 이미지 또는 None, offset) - FreeType 렌더링은 글자당 한 번만"""
+    mask, offset = get_font(size, bold).getmask2(char, mode='L')
+    if not mask.size[0] or not mask.size[1]:
+        return None, offset
+    return Image.frombytes('L', mask.size, bytes(mask)), offset
+
+
+def draw_text(draw, xy, text, size, bold=False):
+    """ImageDraw.text 대신 캐시된 글자 mask 를 찍습니다 (한 줄, char_width 와 같은 간격)."""
+    x, y = xy
+    for char in text:
+        glyph, offset = get_glyph(char, size, bold)
+        if glyph is not None:
+            draw.bitmap((int(x + offset[0]), int(y + offset[1])), glyph, fill=0)
+        x += char_width(char, size, bold)
+
+
+def text_width(text, size, bold=False):
+    # 글자 폭을 캐시해서 더함 (커닝은 무시, 표 레이아웃에는 충분)
+    return sum([char_width(char, size, bold) for char in text])
+
+
+def wrap_text(text, width, size, bold=False):
+    """width 안에 들어가도록 글자 단위로 줄을 나눕니다."""
+    lines = []
+    for paragraph in text.split('\n'):
+        line = ''
+        line_width = 0
+        for char in paragraph:
+            w = char_width(char, size, bold)
+            if line and line_width + w > width:
+                lines.append(line)
+                line = ''
+                line_width = 0
+            line += char
+            line_width += w
+        lines.append(line)
+    return lines
+
+
+def column_widths(natural_widths, table_width):
+    """html table(width: 100%) 처럼 내용 폭 기준으로 열 너비를 나눕니다.
+
+    다 들어가면 남는 폭을 내용 폭 비율로 나누고, 넘치면 좁은 열은 그대로 두고 넓은 열끼리 남은 폭을 나눕니다.
+    """
+    total = sum(natural_widths)
+    if total <= table_width:
+        return [table_width * w / total if total else table_width / len(natural_widths) for w in natural_widths]
+    widths = [0] * len(natural_widths)
+    remaining = table_width
+    rest = sorted(range(len(natural_widths)), key=lambda i: natural_widths[i])
+    while rest:
+        share = remaining / len(rest)
+        if natural_widths[rest[0]] > share:
+            for i in rest:
+                widths[i] = share
+            break
+        i = rest.pop(0)
+        widths[i] = natural_widths[i]
+        remaining -= natural_widths[i]
+    return widths
+
+
+def layout_table(rows):
+    """표 row 목록을 (열 너비, [(row 높이, [셀 줄 목록, ...]), ...]) 로 배치합니다."""
+    rows = [['' if col is None else str(col) for col in row] for row in rows]
+    column_count = max([len(row) for row in rows])
+    rows = [row + [''] * (column_count - len(row)) for row in rows]
+    natural_widths = [
+        max([max([text_width(line, FONT_SIZE) for line in row[i].split('\n')]) for row in rows]) + CELL_PADDING * 2
+        for i in range(column_count)
+    ]
+    widths = column_widths(natural_widths, PAGE_WIDTH - PAGE_MARGIN * 2)
+    line_height = FONT_SIZE + LINE_SPACING
+    laid_rows = []
+    for row in rows:
+        cells = [wrap_text(text, width - CELL_PADDING * 2, FONT_SIZE) for text, width in zip(row, widths)]
+        height = max([len(lines) for lines in cells]) * line_height + CELL_PADDING * 2
+        laid_rows.append((height, cells))
+    return widths, laid_rows
+
+
+def render_with_pillow(sections):
+    """render_with_imgkit 과 같은 구성의 표를 Pillow 로 직접 그려 PNG bytes 로 리턴합니다."""
+    title_height = TITLE_FONT_SIZE + PAGE_MARGIN * 2
+    laid_sections = []
+    height = PAGE_MARGIN
+    for title, rows in sections.items():
+        table = layout_table(rows) if rows else ([], [])
+        laid_sections.append((title, table))
+        height += title_height + sum([row_height for row_height, _ in table[1]]) + PAGE_MARGIN
+    image = Image.new('L', (PAGE_WIDTH, int(height)), 255) # 흑백만 쓰므로 회색조
+    draw = ImageDraw.Draw(image)
+    line_height = FONT_SIZE + LINE_SPACING
+    y = PAGE_MARGIN
+    for title, (widths, laid_rows) in laid_sections:
+        y += PAGE_MARGIN
+        draw_text(draw, (PAGE_MARGIN, y), title, TITLE_FONT_SIZE, True)
+        y += TITLE_FONT_SIZE + PAGE_MARGIN
+        for row_height, cells in laid_rows:
+            x = PAGE_MARGIN
+            for width, lines in zip(widths, cells):
+                box = (int(x), int(y), int(x + width), int(y + row_height))
+                draw.rectangle(box, outline=0)
+                for line_no, line in enumerate(lines):
+                    draw_text(draw, (x + CELL_PADDING, y + CELL_PADDING + line_no * line_height), line, FONT_SIZE)
+                x += width
+            y += row_height
+        y += PAGE_MARGIN
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+RENDERERS = {
+    'imgkit' : render_with_imgkit,
+    'pillow' : render_with_pillow,
+}
+
+
+def get_renderer_name():
+    name = settings.PURCHASE_IMAGE_RENDERER
+    if name == 'pillow' and not os.path.exists(settings.RENDER_FONT_PATH):
+        return 'imgkit' # 한글 폰트가 없으면 기존 방식으로
+    return name
+
+
+def _render(name, sections):
+    with RENDER_SECONDS.time(renderer=name):
+        return RENDERERS[name](sections)
+
+
+async def render(sections):
+    """이벤트 루프를 막지 않도록 렌더링 풀에서 이미지를 만들고 PNG bytes 를 리턴합니다.
+
+    PURCHASE_IMAGE_RENDERER 설정으로 imgkit(wkhtmltoimage) / pillow 중 선택합니다.
+    """
+    loop = asyncio.get_running_loop()
+    name = get_renderer_name()
+    with RENDER_WAIT_SECONDS.time(renderer=name):
+        return await loop.run_in_executor(get_executor(), _render, name, sections)
@@ -0,0 +1,66 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import orjson
+
+
+class ResponseCache:
+    """직렬화된(orjson) 응답 bytes 를 key 별로 보관하는 프로세스 내 LRU 캐시
+
+    같은 key 를 동시에 요청하면 처음 요청만 계산하고 나머지는 그 결과를 같이 기다립니다.
+    계산이 실패하면 기다리던 요청도 같은 예외를 받고, 캐시에는 남기지 않습니다.
+    """
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self.entries = OrderedDict() # key : (만료 시각 또는 None(만료 없음), bytes)
+        self.inflight = {}
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, body = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return body
+
+    def put(self, key, body, ttl=None):
+        """:param ttl: 초 단위 유효 시간, None 이면 밀려날 때까지 보관"""
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        self.entries[key] = (expires_at, body)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get_or_compute(self, key, compute, ttl=None):
+        """캐시된 bytes 를 리턴하고, 없으면 compute() 결과를 직렬화해서 저장한 뒤 리턴합니다.
+
+        :param compute: 응답 객체를 리턴하는 코루틴 함수
+        """
+        body = self.get(key)
+        if body is not None:
+            return body
+        future = self.inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            body = orjson.dumps(await compute())
+            self.put(key, body, ttl)
+            future.set_result(body)
+        except Exception as e:
+            future.set_exception(e)
+            future.exception() # 기다리는 요청이 없을 때 경고가 남지 않도록 확인 처리
+            raise
+        finally:
+            del self.inflight[key]
+            if not future.done(): # 계산 중 취소됨
+                future.cancel()
+        return body
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,265 @@
+import bisect
+import glob
+import gzip
+import json
+import mmap
+import os
+import struct
+
+
+class SegmentStore:
+    """정수 key 로 찾을 수 있는 append-only 로컬 레코드 저장소
+
+    <path>/segment-00001.ndjson.gz
+        레코드를 한 줄씩 JSON 으로 쓰고 BLOCK_RECORDS 줄마다 gzip member 하나로 압축합니다.
+        gzip member 를 이어붙인 파일이라 gzip.open 으로 처음부터 끝까지 그대로 읽을 수 있습니다.
+    <path>/segment-00001.idx
+        (key, block offset, block 길이, block 안의 줄 번호) 를 key 순으로 정렬한 고정 길이 인덱스.
+        segment 를 닫을 때 만들어집니다.
+    <path>/segment-00001.part
+        닫히지 않은 segment 의 인덱스 journal. block 을 쓰고 fsync 한 뒤 그 block 의 항목을 덧붙입니다.
+        쓰다가 멈춘 segment 는 journal 에 있는 block 까지 읽을 수 있고,
+        다음 writer 가 journal 뒤의 잘린 block 만 버리고 이어서 씁니다.
+    <path>/meta.json
+        작업 진행 상태 등 자유 형식의 값
+    """
+    BLOCK_RECORDS = 500
+    SEGMENT_RECORDS = 50000
+    INDEX_ENTRY = struct.Struct('<qQII')
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._indexes = {}
+        self._segments = None
+        self._block_cache = (None, None)
+
+    def segment_path(self, segment_no):
+        return f'{self.path}/segment-{segment_no:05d}.ndjson.gz'
+
+    def index_path(self, segment_no):
+        return f'{self.path}/segment-{segment_no:05d}.idx'
+
+    def journal_path(self, segment_no):
+        return f'{self.path}/segment-{segment_no:05d}.part'
+
+    def segments(self):
+        """인덱스나 journal 이 있는 segment 번호 목록 (닫히지 않은 segment 포함)"""
+        if self._segments is None:
+            res = set()
+            for filename in glob.glob(f'{self.path}/segment-*.idx') + glob.glob(f'{self.path}/segment-*.part'):
+                res.add(int(filename.split('segment-')[-1].split('.')[0]))
+            self._segments = sorted(res)
+        return self._segments
+
+    def is_sealed(self, segment_no):
+        return os.path.exists(self.index_path(segment_no))
+
+    def read_journal(self, segment_no):
+        """닫히지 않은 segment 의 journal 항목 (쓴 순서, 끝에 덜 쓰인 항목은 버림)"""
+        try:
+            with open(self.journal_path(segment_no),'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        entry_size = self.INDEX_ENTRY.size
+        data = data[:len(data) - len(data) % entry_size]
+        return list(self.INDEX_ENTRY.iter_unpack(data))
+
+    def _invalidate(self, segment_no):
+        """writer 가 segment 를 바꾼 뒤 캐시된 인덱스 / block 을 버립니다."""
+        index = self._indexes.pop(segment_no, None)
+        if index and isinstance(index, mmap.mmap):
+            index.close()
+        if self._block_cache[0] and self._block_cache[0][0] == segment_no:
+            self._block_cache = (None, None)
+        self._segments = None
+
+    def get_meta(self):
+        try:
+            with open(f'{self.path}/meta.json','rt') as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return {}
+
+    def set_meta(self, meta):
+        tmp_path = f'{self.path}/meta.json.tmp'
+        with open(tmp_path,'wt') as f:
+            f.write(json.dumps(meta,ensure_ascii=False))
+        os.replace(tmp_path, f'{self.path}/meta.json')
+
+    def writer(self):
+        return SegmentWriter(self)
+
+    def _get_index(self, segment_no):
+        if segment_no not in self._indexes and not self.is_sealed(segment_no):
+            entries = sorted(self.read_journal(segment_no), key=lambda entry: entry[0])
+            self._indexes[segment_no] = b''.join(self.INDEX_ENTRY.pack(*entry) for entry in entries)
+        if segment_no not in self._indexes:
+            with open(self.index_path(segment_no),'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    self._indexes[segment_no] = b''
+                else:
+                    self._indexes[segment_no] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._indexes[segment_no]
+
+    def _find(self, key):
+        entry_size = self.INDEX_ENTRY.size
+        for segment_no in reversed(self.segments()): # 같은 key 는 나중 segment 가 우선
+            index = self._get_index(segment_no)
+            count = len(index) // entry_size
+            pos = bisect.bisect_left(
+                range(count), key,
+                key=lambda i: self.INDEX_ENTRY.unpack_from(index, i * entry_size)[0]
+            )
+            if pos < count:
+                entry = self.INDEX_ENTRY.unpack_from(index, pos * entry_size)
+                if entry[0] == key:
+                    return segment_no, entry
+        return None
+
+    def __contains__(self, key):
+        return self._find(int(key)) is not None
+
+    def get(self, key, default=None):
+        found = self._find(int(key))
+        if found is None:
+            return default
+        segment_no, (_, offset, length, line_no) = found
+        block_key = (segment_no, offset)
+        cached_key, lines = self._block_cache
+        if cached_key != block_key:
+            with open(self.segment_path(segment_no),'rb') as f:
+                f.seek(offset)
+                lines = gzip.decompress(f.read(length)).split(b'\n')
+            self._block_cache = (block_key, lines)
+        return json.loads(lines[line_no])
+
+    def keys(self):
+        entry_size = self.INDEX_ENTRY.size
+        for segment_no in self.segments():
+            index = self._get_index(segment_no)
+            for i in range(len(index) // entry_size):
+                yield self.INDEX_ENTRY.unpack_from(index, i * entry_size)[0]
+
+    def scan(self):
+        """레코드를 쓴 순서대로 한 번에 하나씩 읽습니다. 닫히지 않은 segment 는 journal 에 있는 block 까지 읽습니다."""
+        for segment_no in self.segments():
+            if self.is_sealed(segment_no):
+                with gzip.open(self.segment_path(segment_no),'rb') as f:
+                    for line in f:
+                        if line.strip():
+                            yield json.loads(line)
+                continue
+            blocks = sorted({(offset, length) for _, offset, length, _ in self.read_journal(segment_no)})
+            with open(self.segment_path(segment_no),'rb') as f:
+                for offset, length in blocks:
+                    f.seek(offset)
+                    for line in gzip.decompress(f.read(length)).split(b'\n'):
+                        if line.strip():
+                            yield json.loads(line)
+
+    def close(self):
+        for index in self._indexes.values():
+            if index and isinstance(index, mmap.mmap):
+                index.close()
+        self._indexes = {}
+        self._block_cache = (None, None)
+
+
+class SegmentWriter:
+    """SegmentStore 에 레코드를 덧붙입니다.
+
+    block 이 찰 때마다 journal 에 기록되므로 중간에 멈춰도 마지막 block 까지만 잃고,
+    다음 writer 는 닫히지 않은 마지막 segment 를 이어서 씁니다.
+    checkpoint() 를 부르면 덜 찬 block 도 바로 기록합니다. with 블록이 끝나야 마지막 segment 가 닫힙니다.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.file = None
+        self.journal = None
+        self.segment_no = None
+        self.entries = []
+        self.lines = []
+        self.keys = []
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _open_segment(self):
+        segments = self.store.segments()
+        if segments and not self.store.is_sealed(segments[-1]):
+            # 닫히지 않은 segment 는 journal 에 기록된 block 뒤를 잘라내고 이어서 씀
+            self.segment_no = segments[-1]
+            self.entries = self.store.read_journal(self.segment_no)
+            end = max((offset + length for _, offset, length, _ in self.entries), default=0)
+            self.file = open(self.store.segment_path(self.segment_no),'r+b')
+            self.file.truncate(end)
+            self.file.seek(end)
+            self.journal = open(self.store.journal_path(self.segment_no),'r+b')
+            self.journal.truncate(len(self.entries) * self.store.INDEX_ENTRY.size)
+            self.journal.seek(0, os.SEEK_END)
+        else:
+            self.segment_no = (segments[-1] if segments else 0) + 1
+            self.file = open(self.store.segment_path(self.segment_no),'wb') # journal 없이 남은 파일은 덮어씀
+            self.journal = open(self.store.journal_path(self.segment_no),'wb')
+            self.entries = []
+            self.store._segments = None
+        self.count = len(self.entries)
+
+    def append(self, key, record):
+        if self.file is None:
+            self._open_segment()
+        self.keys.append(int(key))
+        self.lines.append(json.dumps(record,ensure_ascii=False))
+        self.count += 1
+        if len(self.lines) >= self.store.BLOCK_RECORDS:
+            self._flush_block()
+        if self.count >= self.store.SEGMENT_RECORDS:
+            self._seal()
+
+    def _flush_block(self):
+        if not self.lines:
+            return
+        data = gzip.compress(('\n'.join(self.lines) + '\n').encode())
+        offset = self.file.tell()
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        entries = [(key, offset, len(data), line_no) for line_no, key in enumerate(self.keys)]
+        self.journal.write(b''.join(self.store.INDEX_ENTRY.pack(*entry) for entry in entries))
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.entries.extend(entries)
+        self.lines = []
+        self.keys = []
+        self.store._invalidate(self.segment_no)
+
+    def checkpoint(self):
+        """덜 찬 block 까지 기록합니다. fetch batch 마다 불러 멈췄을 때 잃는 레코드를 줄입니다."""
+        if self.file is not None:
+            self._flush_block()
+
+    def _seal(self):
+        self._flush_block()
+        self.file.close()
+        self.file = None
+        self.entries.sort(key=lambda entry: entry[0])
+        tmp_path = self.store.index_path(self.segment_no) + '.tmp'
+        with open(tmp_path,'wb') as f:
+            for entry in self.entries:
+                f.write(self.store.INDEX_ENTRY.pack(*entry))
+        os.replace(tmp_path, self.store.index_path(self.segment_no))
+        self.journal.close()
+        self.journal = None
+        os.remove(self.store.journal_path(self.segment_no))
+        self.store._invalidate(self.segment_no)
+        self.entries = []
+
+    def close(self):
+        if self.file is not None:
+            self._seal()
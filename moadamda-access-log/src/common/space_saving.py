@@ -0,0 +1,77 @@
+import heapq
+
+
+class SpaceSaving:
+    """많이 나온 값 상위 k 개를 capacity 개의 카운터로 근사하는 Space-Saving 스케치
+
+    capacity 개가 다 차면 가장 작은 카운터의 값을 새 값으로 바꾸고 (count = 최소값 + 1, error = 최소값),
+    실제 횟수는 count - error 이상 count 이하입니다.
+    전체 N 개 중 N / capacity 번보다 많이 나온 값은 항상 남아 있습니다.
+    """
+    def __init__(self, capacity=200):
+        self.capacity = capacity
+        self.counters = {} # 값 : [count, error]
+        self.heap = [] # (count, 값), 오래된 count 는 꺼낼 때 건너뜀
+
+    def add(self, item, weight=1):
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += weight
+        elif len(self.counters) < self.capacity:
+            counter = self.counters[item] = [weight, 0]
+        else:
+            min_count, min_item = self._pop_min()
+            del self.counters[min_item]
+            counter = self.counters[item] = [min_count + weight, min_count]
+        heapq.heappush(self.heap, (counter[0], item))
+        if len(self.heap) > self.capacity * 4:
+            self._rebuild_heap()
+
+    def _pop_min(self):
+        while True:
+            count, item = heapq.heappop(self.heap)
+            counter = self.counters.get(item)
+            if counter is not None and counter[0] == count:
+                return count, item
+
+    def _rebuild_heap(self):
+        self.heap = [(counter[0], item) for item, counter in self.counters.items()]
+        heapq.heapify(self.heap)
+
+    def min_count(self):
+        """다 찼을 때 빠진 값이 가질 수 있는 최대 횟수 (안 찼으면 0)"""
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def merge(self, other):
+        """다른 스케치를 합칩니다. 한쪽에만 있는 값은 다른 쪽의 min_count 를 count / error 에 더합니다."""
+        self_min = self.min_count()
+        other_min = other.min_count()
+        merged = {}
+        for item in self.counters.keys() | other.counters.keys():
+            count_a, error_a = self.counters.get(item, (self_min, self_min))
+            count_b, error_b = other.counters.get(item, (other_min, other_min))
+            merged[item] = [count_a + count_b, error_a + error_b]
+        top = heapq.nlargest(self.capacity, merged.items(), key=lambda row: row[1][0])
+        self.counters = dict(top)
+        self._rebuild_heap()
+        return self
+
+    def top(self, limit):
+        """[(값, count, error), ...] count 내림차순"""
+        top = heapq.nlargest(limit, self.counters.items(), key=lambda row: row[1][0])
+        return [(item, count, error) for item, (count, error) in top]
+
+    def to_dict(self):
+        return {'capacity' : self.capacity, 'counters' : self.counters}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['capacity'])
+        sketch.counters = {item : list(counter) for item, counter in data['counters'].items()}
+        sketch._rebuild_heap()
+        return sketch
+
+    def copy(self):
+        return SpaceSaving.from_dict(self.to_dict())
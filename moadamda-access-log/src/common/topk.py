@@ -0,0 +1,140 @@
+import asyncio
+import json
+import os
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+from common.space_saving import SpaceSaving
+from common.traffic_counter import parse_utm
+from conf.settings import settings
+from core.postgres import connection
+
+DIMENSIONS = ['url', 'referer', 'campaign_url']
+MEMORY_WINDOWS = 2 # 워커 메모리에 남겨 두는 구간 수 (현재 + 직전)
+DB_RETENTION = timedelta(days=7) # topk_snapshot 에 남겨 두는 기간
+CLEANUP_INTERVAL = 3600 # 오래된 topk_snapshot row 를 지우는 간격(초)
+MAX_VALUE_LENGTH = 300
+
+
+def strip_query(url):
+    return url.split('?')[0].split('#')[0][:MAX_VALUE_LENGTH]
+
+
+def make_values(url, referer):
+    """dimension 별 값. 광고 url 은 utm 이 있는 유입만 (경로 + utm_source / utm_campaign / utm_content)"""
+    values = {'url' : strip_query(url)}
+    if referer:
+        values['referer'] = strip_query(referer)
+    utm_source, _, utm_campaign, utm_content = parse_utm(url)
+    if utm_source:
+        values['campaign_url'] = f'{strip_query(url)}?utm_source={utm_source}&utm_campaign={utm_campaign}&utm_content={utm_content}'[:MAX_VALUE_LENGTH]
+    return values
+
+
+class TopKTracker:
+    """dimension 별로 TOPK_WINDOW_MINUTES 구간마다 Space-Saving 스케치를 하나씩 두고 유입을 셉니다.
+
+    워커마다 구간별 스케치를 topk_snapshot 에 덮어쓰고 (traffic_counter 와 같은 방식),
+    조회할 때 다른 워커의 스케치와 이 워커의 메모리 스케치를 합칩니다.
+    """
+    def __init__(self):
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.sketches = {} # (dimension, window_start) : SpaceSaving
+        self.dirty = set()
+        self.cleaned_at = None
+
+    def window_start(self, date):
+        minutes = settings.TOPK_WINDOW_MINUTES
+        start = date.replace(second=0, microsecond=0)
+        return start - timedelta(minutes=(start.hour * 60 + start.minute) % minutes)
+
+    def record(self, url, referer, now=None):
+        window_start = self.window_start(now or datetime.now())
+        for dimension, value in make_values(url, referer).items():
+            key = (dimension, window_start)
+            sketch = self.sketches.get(key)
+            if sketch is None:
+                sketch = self.sketches[key] = SpaceSaving(settings.TOPK_CAPACITY)
+            sketch.add(value)
+            self.dirty.add(key)
+
+    async def flush(self, conn):
+        """바뀐 스케치를 topk_snapshot 에 덮어쓰고 지난 구간을 메모리에서 정리합니다."""
+        keys = self.dirty
+        self.dirty = set()
+        try:
+            if keys:
+                await conn.executemany(
+                    """
+                        INSERT INTO topk_snapshot (dimension, window_start, worker_id, data, updated_at)
+                        VALUES ($1, $2, $3, $4, now())
+                        ON CONFLICT(dimension, window_start, worker_id)
+                        DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+                    """,[
+                        (key[0], key[1], self.worker_id, json.dumps(self.sketches[key].to_dict(), ensure_ascii=False))
+                        for key in keys
+                    ]
+                )
+        except:
+            self.dirty |= keys
+            raise
+        expire_date = self.window_start(datetime.now()) - timedelta(minutes=settings.TOPK_WINDOW_MINUTES * (MEMORY_WINDOWS - 1))
+        for key in list(self.sketches.keys()):
+            if key[1] < expire_date and key not in self.dirty:
+                del self.sketches[key]
+        if self.cleaned_at is None or time.monotonic() - self.cleaned_at >= CLEANUP_INTERVAL:
+            await conn.execute(
+                """
+                    DELETE FROM topk_snapshot WHERE window_start < $1
+                """,datetime.now() - DB_RETENTION
+            )
+            self.cleaned_at = time.monotonic()
+
+    async def run(self):
+        """서버 워커마다 하나씩 실행하는 flush 루프 (종료할 때 한 번 더 flush)"""
+        try:
+            while True:
+                await asyncio.sleep(settings.TRAFFIC_FLUSH_SECONDS)
+                try:
+                    async with connection() as conn:
+                        await self.flush(conn)
+                except Exception:
+                    traceback.print_exc()
+        finally:
+            if self.dirty:
+                try:
+                    async with connection() as conn:
+                        await self.flush(conn)
+                except Exception:
+                    traceback.print_exc()
+
+    async def query(self, conn, dimension, start_date, end_date):
+        """[start_date, end_date) 구간의 스케치를 모든 워커에 걸쳐 합칩니다.
+
+        이 워커의 row 도 읽되, 메모리에 남아 있는 구간은 flush 전 값까지 있는 메모리 스케치로 대신합니다.
+        메모리에서 정리된 지난 구간은 topk_snapshot 의 row 를 씁니다.
+        """
+        rows = await conn.fetch(
+            """
+                SELECT worker_id, window_start, data::text AS data FROM topk_snapshot
+                WHERE dimension = $1 AND window_start >= $2 AND window_start < $3
+            """,dimension,start_date,end_date
+        )
+        sketches = [
+            SpaceSaving.from_dict(json.loads(row['data']))
+            for row in rows
+            if row['worker_id'] != self.worker_id or (dimension, row['window_start']) not in self.sketches
+        ]
+        sketches += [
+            sketch
+            for (key_dimension, window_start), sketch in self.sketches.items()
+            if key_dimension == dimension and start_date <= window_start < end_date
+        ]
+        merged = SpaceSaving(settings.TOPK_CAPACITY)
+        for sketch in sketches:
+            merged.merge(sketch)
+        return merged
+
+
+tracker = TopKTracker()
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import re
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+from common.hyperloglog import HyperLogLog
+from conf.settings import settings
+from core.postgres import connection
+
+UTM_KEYS = ['utm_source', 'utm_medium', 'utm_campaign', 'utm_content']
+UTM_PATTERNS = [re.compile(f'{key}=([^&]+)') for key in UTM_KEYS]
+GRANULARITIES = ['minute', 'hour']
+MEMORY_RETENTION = {'minute' : timedelta(hours=2), 'hour' : timedelta(days=1)} # 워커 메모리에 남겨 두는 기간
+DB_RETENTION = {'minute' : timedelta(days=1), 'hour' : timedelta(days=7)} # traffic_counter 에 남겨 두는 기간
+CLEANUP_INTERVAL = 3600 # 오래된 traffic_counter row 를 지우는 간격(초)
+
+
+def parse_utm(url):
+    """url 의 (utm_source, utm_medium, utm_campaign, utm_content). 없는 값은 '' (utm_hourly_rollup 과 같은 기준)"""
+    values = []
+    for pattern in UTM_PATTERNS:
+        match = pattern.search(url)
+        values.append(match.group(1) if match else '')
+    values[3] = values[3].replace('+', ' ')
+    return tuple(values)
+
+
+def truncate(date, granularity):
+    if granularity == 'minute':
+        return date.replace(second=0, microsecond=0)
+    return date.replace(minute=0, second=0, microsecond=0)
+
+
+class TrafficCounter:
+    """access_log 유입을 워커 메모리에서 분 / 시간 단위, utm 별로 세고 _mdUUID 고유 수를 HyperLogLog 로 셉니다.
+
+    TRAFFIC_FLUSH_SECONDS 마다 워커별 누적값을 traffic_counter 에 덮어쓰고,
+    조회할 때 다른 워커의 row 와 이 워커의 메모리 값을 합칩니다.
+    """
+    def __init__(self):
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.buckets = {} # (granularity, bucket, utm) : [count, HyperLogLog]
+        self.dirty = set()
+        self.cleaned_at = None
+
+    def record(self, url, md_uuid, now=None):
+        utm = parse_utm(url)
+        now = now or datetime.now()
+        for granularity in GRANULARITIES:
+            key = (granularity, truncate(now, granularity), utm)
+            entry = self.buckets.get(key)
+            if entry is None:
+                entry = self.buckets[key] = [0, HyperLogLog()]
+            entry[0] += 1
+            if md_uuid:
+                entry[1].add(md_uuid)
+            self.dirty.add(key)
+
+    async def flush(self, conn):
+        """바뀐 bucket 을 traffic_counter 에 덮어쓰고 오래된 bucket 을 정리합니다."""
+        keys = self.dirty
+        self.dirty = set()
+        try:
+            if keys:
+                await conn.executemany(
+                    """
+                        INSERT INTO traffic_counter
+                        (granularity, bucket, utm_source, utm_medium, utm_campaign, utm_content, worker_id, count, uniques, updated_at)
+                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, now())
+                        ON CONFLICT(granularity, bucket, utm_source, utm_medium, utm_campaign, utm_content, worker_id)
+                        DO UPDATE SET count = excluded.count, uniques = excluded.uniques, updated_at = excluded.updated_at
+                    """,[
+                        (key[0], key[1], *key[2], self.worker_id, self.buckets[key][0], self.buckets[key][1].to_bytes())
+                        for key in keys
+                    ]
+                )
+        except:
+            self.dirty |= keys
+            raise
+        now = datetime.now()
+        for key in list(self.buckets.keys()):
+            if key[1] < now - MEMORY_RETENTION[key[0]] and key not in self.dirty:
+                del self.buckets[key]
+        if self.cleaned_at is None or time.monotonic() - self.cleaned_at >= CLEANUP_INTERVAL:
+            for granularity in GRANULARITIES:
+                await conn.execute(
+                    """
+                        DELETE FROM traffic_counter WHERE granularity = $1 AND bucket < $2
+                    """,granularity,now - DB_RETENTION[granularity]
+                )
+            self.cleaned_at = time.monotonic()
+
+    async def run(self):
+        """서버 워커마다 하나씩 실행하는 flush 루프 (종료할 때 한 번 더 flush)"""
+        try:
+            while True:
+                await asyncio.sleep(settings.TRAFFIC_FLUSH_SECONDS)
+                try:
+                    async with connection() as conn:
+                        await self.flush(conn)
+                except Exception:
+                    traceback.print_exc()
+        finally:
+            if self.dirty:
+                try:
+                    async with connection() as conn:
+                        await self.flush(conn)
+                except Exception:
+                    traceback.print_exc()
+
+    async def query(self, conn, granularity, start_date, end_date):
+        """[start_date, end_date) bucket 을 모든 워커에 걸쳐 utm 별로 합칩니다.
+
+        :return: {utm : [count, HyperLogLog]}
+        """
+        rows = await conn.fetch(
+            """
+                SELECT utm_source, utm_medium, utm_campaign, utm_content, count, uniques
+                FROM traffic_counter
+                WHERE granularity = $1 AND bucket >= $2 AND bucket < $3 AND worker_id <> $4
+            """,granularity,start_date,end_date,self.worker_id
+        )
+        merged = {}
+        items = [
+            (
+                (row['utm_source'], row['utm_medium'], row['utm_campaign'], row['utm_content']),
+                row['count'],
+                HyperLogLog.from_bytes(row['uniques'])
+            )
+            for row in rows
+        ]
+        # 이 워커는 flush 전 값까지 있는 메모리 값을 씀
+        items += [
+            (utm, entry[0], entry[1])
+            for (key_granularity, bucket, utm), entry in self.buckets.items()
+            if key_granularity == granularity and start_date <= bucket < end_date
+        ]
+        for utm, count, uniques in items:
+            entry = merged.get(utm)
+            if entry is None:
+                merged[utm] = [count, uniques.copy()]
+            else:
+                entry[0] += count
+                entry[1].merge(uniques)
+        return merged
+
+
+counter = TrafficCounter()
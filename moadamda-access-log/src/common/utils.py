@@ -1,4 +1,5 @@
 import hashlib
+import json
 from urllib.parse import unquote,unquote_plus
 
 
@@ -15,25 +16,21 @@ def md5(text):
     enc_text = enc.hexdigest()
     return enc_text
 
-async def add_ad(conn, utm_source, utm_medium, utm_campaign, utm_content, utm_term,utm_id):
-    if utm_id:
-        hashed = md5(f'{utm_source}{utm_id}')
-    else:
-        hashed = md5(f'{utm_source}{utm_medium}{utm_campaign}{utm_content}{utm_term}')
-    already_exist = await conn.fetchrow(
-        """
-            SELECT idx FROM ad_utm_info WHERE hash = $1
-        """,hashed
+def parse_cookies(cookies):
+    """access_log 쿠키 JSON 문자열을 dict 와 식별값 (md_uuid, login_id, member_id, ga_id, clck) 으로 나눕니다."""
+    try:
+        cookies_dict = json.loads(cookies) if cookies else {}
+    except ValueError:
+        cookies_dict = {}
+    if not isinstance(cookies_dict, dict):
+        cookies_dict = {}
+    login_provider = cookies_dict.get('login_provider_1')
+    member_id = login_provider.get('member_id') if isinstance(login_provider, dict) else None
+    identity = (
+        cookies_dict.get('_mdUUID') or None,
+        cookies_dict.get('_LOGINID') or None,
+        member_id or None,
+        cookies_dict.get('_ga') or None,
+        cookies_dict.get('_clck') or None,
     )
-    if already_exist:
-        return already_exist['idx']
-    res = await conn.fetchrow(
-        """
-            INSERT INTO ad_utm_info
-            (utm_source, utm_campaign, utm_medium, utm_term, utm_content,utm_id, hash)
-            VALUES
-            ($1,$2,$3,$4,$5,$6,$7)
-            RETURNING idx
-        """,utm_source, utm_campaign, utm_medium, utm_term, utm_content,utm_id, hashed
-    )
-    return res['idx']
\ No newline at end of file
+    return cookies_dict, tuple([str(value) if value is not None else None for value in identity])
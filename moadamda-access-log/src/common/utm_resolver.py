@@ -0,0 +1,81 @@
+from common import utils
+
+
+def make_hash(utm_source, utm_medium, utm_campaign, utm_content, utm_term, utm_id):
+    """ad_utm_info.hash 계산 (utm_id 가 있으면 utm_source + utm_id 기준)"""
+    if utm_id:
+        return utils.md5(f'{utm_source}{utm_id}')
+    return utils.md5(f'{utm_source}{utm_medium}{utm_campaign}{utm_content}{utm_term}')
+
+
+class UtmResolver:
+    """ad_utm_info 의 hash → idx 를 프로세스 안에서 공유합니다.
+
+    처음 쓸 때 한 번 전체를 읽고, 이후에는 마지막으로 읽은 idx 보다 큰 row 만 읽어 갱신합니다.
+    없는 utm 은 INSERT ... ON CONFLICT (hash) DO NOTHING RETURNING 한 번으로 모아서 등록하고,
+    다른 프로세스가 먼저 넣어 RETURNING 에 안 나온 hash 는 hash 로 다시 조회합니다.
+    utm 은 (utm_source, utm_medium, utm_campaign, utm_content, utm_term, utm_id) 튜플입니다.
+    """
+    def __init__(self):
+        self.hash_dict = {}
+        self.max_idx = 0
+
+    async def refresh(self, conn):
+        rows = await conn.fetch(
+            """
+                SELECT idx, hash FROM ad_utm_info WHERE idx > $1
+            """,self.max_idx
+        )
+        for row in rows:
+            self.hash_dict[row['hash']] = row['idx']
+            self.max_idx = max(self.max_idx, row['idx'])
+        return self.hash_dict
+
+    async def resolve_many(self, conn, utm_list):
+        """utm 목록의 ad_utm_info.idx 를 입력 순서대로 리턴합니다."""
+        hashes = [make_hash(*utm) for utm in utm_list]
+        missing = {
+            hashed : utm
+            for hashed, utm in zip(hashes, utm_list)
+            if hashed not in self.hash_dict
+        }
+        if missing:
+            await self.refresh(conn)
+            missing = {
+                hashed : utm
+                for hashed, utm in missing.items()
+                if hashed not in self.hash_dict
+            }
+        if missing:
+            columns = list(zip(*missing.values()))
+            rows = await conn.fetch(
+                """
+                    INSERT INTO ad_utm_info
+                    (utm_source, utm_medium, utm_campaign, utm_content, utm_term, utm_id, hash)
+                    SELECT * FROM unnest($1::text[], $2::text[], $3::text[], $4::text[], $5::text[], $6::text[], $7::text[])
+                    ON CONFLICT(hash)
+                    DO NOTHING
+                    RETURNING idx, hash
+                """,*[list(column) for column in columns],list(missing.keys())
+            )
+            for row in rows:
+                self.hash_dict[row['hash']] = row['idx']
+            conflict_hashes = [hashed for hashed in missing if hashed not in self.hash_dict]
+            if conflict_hashes:
+                rows = await conn.fetch(
+                    """
+                        SELECT idx, hash FROM ad_utm_info WHERE hash = ANY($1::text[])
+                    """,conflict_hashes
+                )
+                for row in rows:
+                    self.hash_dict[row['hash']] = row['idx']
+        return [self.hash_dict[hashed] for hashed in hashes]
+
+    async def resolve(self, conn, utm_source, utm_medium, utm_campaign, utm_content, utm_term, utm_id):
+        res = await self.resolve_many(
+            conn, [(utm_source, utm_medium, utm_campaign, utm_content, utm_term, utm_id)]
+        )
+        return res[0]
+
+
+resolver = UtmResolver()
@@ -11,17 +11,46 @@ class Settings(BaseSettings):
     POSTGRES_HOSTNAME: str
 
     SLACK_BOT_TOKEN: str
+    SLACK_QUEUE_SIZE: int = 100 # 슬랙 전송 대기열 크기
+    SLACK_WORKER_COUNT: int = 2 # 슬랙에 동시에 보내는 수
+    SLACK_JOB_CONCURRENCY: int = 4 # 워커 프로세스마다 동시에 처리하는 주문 알림 수
     CAFE24_AUTH_KEY: str
 
     SLACK_STATUS_CHANNEL_ID: str
     SESSION_OPTION_NAME: str
+    REPORT_WORKER_COUNT: int = 4 # 구매 통계에서 동시에 조회하는 주문 수
+    VISITOR_TIMELINE_DAYS: int = 90 # 주문 분석에서 보는 방문 기록 기간(일)
+    VISITOR_TIMELINE_LIMIT: int = 500 # 주문 분석에서 보는 ip / uuid 별 최대 방문 기록 수
+    SESSION_GAP_MINUTES: int = 30 # 이 시간 넘게 페이지 이동이 없으면 새 방문(세션)
+    ATTRIBUTION_DAYS: int = 30 # 기여도를 다시 계산하는 최근 주문 기간(일)
+    ATTRIBUTION_LOOKBACK_DAYS: int = 30 # 주문 전 몇 일 안의 utm 유입까지 기여도를 나누는지
+    ATTRIBUTION_HALF_LIFE_HOURS: int = 168 # time_decay 모델에서 기여도가 절반이 되는 시간
+    IDENTITY_REFRESH_SECONDS: int = 60 # 서버가 identity_node 변경을 다시 읽는 간격(초)
+    IDENTITY_IPUA_WINDOW_MINUTES: int = 30 # 같은 ip + user_agent 를 같은 방문자로 보는 간격(분)
+    IDENTITY_MAX_IPUA_COMPONENT: int = 20 # ip + user_agent 연결로 만들 수 있는 최대 식별값 수
+
+    TRAFFIC_FLUSH_SECONDS: int = 10 # 워커별 실시간 유입 카운터를 traffic_counter 에 저장하는 간격(초)
+    LIVE_FEED_HISTORY_SECONDS: int = 60 # /live 에 처음 연결할 때 보내는 최근 프레임 수(초)
+    LIVE_FEED_QUEUE_SIZE: int = 30 # 구독자별로 쌓아 두는 프레임 수 (넘으면 오래된 프레임부터 버림)
+    LIVE_FEED_TOP_N: int = 10 # 프레임별 상위 url / utm_content 수
+    TOPK_WINDOW_MINUTES: int = 60 # 상위 url / referer 를 따로 세는 구간(분)
+    TOPK_CAPACITY: int = 200 # dimension / 구간별 Space-Saving 카운터 수
+    LOG_CACHE_TTL: int = 60 # 오늘이 포함된 /log 응답 캐시 시간(초)
+    LOG_CACHE_MAX_ENTRIES: int = 128
+    EXPORT_POOL_SIZE: int = 2 # 동시에 실행할 수 있는 access_log export 수
+    RENDER_WORKER_COUNT: int = 2 # 구매 정보 이미지를 동시에 만드는 수
+    PURCHASE_IMAGE_RENDERER: str = 'pillow' # pillow / imgkit
+    RENDER_FONT_PATH: str = '/usr/share/fonts/truetype/nanum/NanumGothic.ttf'
+    RENDER_BOLD_FONT_PATH: str = '/usr/share/fonts/truetype/nanum/NanumGothicBold.ttf'
 
     GA4_MEASUREMENT_ID: str
     GA4_API_SECRET: str
+    GA4_MAX_ATTEMPTS: int = 8 # 구매 이벤트 전송 최대 시도 횟수
 
     CLARITY_COOKIE: str
     CLARITY_CSRF: str
     CLARITY_ID: str
+    CLARITY_WORKER_COUNT: int = 4
 
     META_APP_ID: str
     META_APP_SECRET: str
@@ -7,7 +7,64 @@ import asyncio
 from conf.settings import settings
 from core.postgres import connection
 
+class AdaptiveLimiter:
+    """클래리티 요청의 동시 실행 수를 429 응답에 맞춰 조절합니다.
+
+    429 를 받으면 동시 실행 수를 절반으로 줄이고 Retry-After(없으면 지수 증가하는 대기 시간) 동안
+    모든 요청을 멈춥니다. 성공이 recover_after 번 이어지면 동시 실행 수를 하나씩 되돌립니다.
+    """
+    def __init__(self, max_concurrency=1, min_delay=5, max_delay=300, recover_after=20):
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = self.max_concurrency
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.recover_after = recover_after
+        self.delay = min_delay
+        self.active = 0
+        self.success_count = 0
+        self.resume_at = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            while True:
+                wait = self.resume_at - time.monotonic()
+                if wait > 0:
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if self.active < self.concurrency:
+                    self.active += 1
+                    return
+                await self._cond.wait()
+
+    async def release(self, throttled=False, retry_after=None):
+        async with self._cond:
+            self.active -= 1
+            now = time.monotonic()
+            if throttled:
+                self.success_count = 0
+                if now >= self.resume_at: # 이미 쉬는 중에 들어온 429 는 한 번만 반영
+                    self.concurrency = max(1, self.concurrency // 2)
+                    self.resume_at = now + (retry_after or self.delay)
+                    self.delay = min(self.delay * 2, self.max_delay)
+                    print(f'clarity 429 - 동시 요청 {self.concurrency}개, {self.resume_at - now:.0f}초 대기')
+            else:
+                self.success_count += 1
+                if self.success_count >= self.recover_after:
+                    self.success_count = 0
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+                    self.delay = max(self.min_delay, self.delay // 2)
+            self._cond.notify_all()
+
+
 class Clarity:
+    def __init__(self, concurrency=1):
+        self.limiter = AdaptiveLimiter(concurrency)
+        self.session = None
+
     async def get_header(self):
         return {
             'accept': '*/*',
@@ -24,35 +81,51 @@ class Clarity:
             'sec-fetch-mode': 'cors',
             'sec-fetch-site': 'same-origin',
         }
+
+    async def get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
     async def call(self,url,method='get',**kwargs):
         headers = kwargs.pop('headers',{})
         headers.update(await self.get_header())
         for i in range(10):
+            await self.limiter.acquire()
+            throttled = False
+            retry_after = None
             try:
-                async with aiohttp.ClientSession() as session:
-                    if method == 'get':
-                        _method = session.get
-                    elif method == 'put':
-                        _method = session.put
-                    elif method == 'post':
-                        _method = session.post
-                    async with _method(
-                        url,
-                        headers=headers,
-                        **kwargs
-                    ) as resp:
-                        if resp.status != 200:
-                            print(resp.headers)
-                            print(await resp.text())
-                            print(resp.status)
-                            if resp.status == 429:
-                                await asyncio.sleep(300)
-                            else:
-                                await asyncio.sleep((i+1)*5)
-                            continue
+                session = await self.get_session()
+                if method == 'get':
+                    _method = session.get
+                elif method == 'put':
+                    _method = session.put
+                elif method == 'post':
+                    _method = session.post
+                async with _method(
+                    url,
+                    headers=headers,
+                    **kwargs
+                ) as resp:
+                    if resp.status == 429:
+                        throttled = True
+                        if resp.headers.get('Retry-After','').isdigit():
+                            retry_after = int(resp.headers['Retry-After'])
+                        continue
+                    if resp.status == 200:
                         return await resp.json()
+                    print(resp.headers)
+                    print(await resp.text())
+                    print(resp.status)
             except Exception as e:
                 print(e)
+            finally:
+                await self.limiter.release(throttled, retry_after)
+            await asyncio.sleep((i+1)*5)
 
     async def get_session_list(self,start_date, end_date, filters=[], start=0, limit=5000, sort=None):
         start_date = start_date - timedelta(hours=9) # yyyy mm dd 로 바꾸기 위해 9시간 뺌
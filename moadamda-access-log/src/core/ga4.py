@@ -1,30 +1,56 @@
+import asyncio
 import datetime
+import time
+import traceback
 import aiohttp
+from collections import defaultdict
+from common import metrics
 from conf.settings import settings
+from core import job_queue
 from core.postgres import connection
 
+GA4_QUEUE = 'ga4'
+MAX_BATCH_EVENTS = 25 # Measurement Protocol 요청 하나에 넣을 수 있는 최대 이벤트 수
+
+QUEUE_DEPTH = metrics.Gauge('ga4_queue_depth', 'GA4 전송 대기 중인 이벤트 수')
+DELIVERY_SECONDS = metrics.Histogram(
+    'ga4_delivery_seconds', 'GA4 이벤트를 넣은 시점부터 전송 완료까지 걸린 시간(초)',
+    buckets=(1, 5, 10, 30, 60, 300, 900, 3600)
+)
+REQUEST_SECONDS = metrics.Histogram('ga4_request_seconds', 'GA4 Measurement Protocol 요청 시간(초)')
+EVENT_TOTAL = metrics.Counter('ga4_event_total', 'GA4 이벤트 처리 결과별 수')
+
+
 class GA4:
     def __init__(self):
         self.measurement_id = settings.GA4_MEASUREMENT_ID
         self.api_secret = settings.GA4_API_SECRET
+        self.session = None
+
+    async def get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
 
     async def call(self,url,method='post',**kwargs):
-        async with aiohttp.ClientSession() as session:
-
-            if method == 'get':
-                _method = session.get
-            elif method == 'put':
-                _method = session.put
-            elif method == 'post':
-                _method = session.post
-            async with _method(
-                url,
-                **kwargs
-            ) as resp:
-                return await resp.text()
+        session = await self.get_session()
+        if method == 'get':
+            _method = session.get
+        elif method == 'put':
+            _method = session.put
+        elif method == 'post':
+            _method = session.post
+        async with _method(
+            url,
+            **kwargs
+        ) as resp:
+            return resp.status, await resp.text()
 
-    async def send_purchase_info(self,ga_id,event_name,order_info):
-        client_id = ga_id.split('.')[-2] + '.' + ga_id.split('.')[-1]
+    def make_purchase_event(self,event_name,order_info):
         order_items = []
         for item in order_info['items']:
             order_items.append(
@@ -41,7 +67,7 @@ class GA4:
                     'item_category4' : '',
                 }
             )
-        event_obj = {
+        return {
             'name' : event_name,
             'params' : {
                 'currency' : order_info['currency'],
@@ -51,13 +77,111 @@ class GA4:
                 'shipping' : 0, #TODO. 배송비 넣어야함
             }
         }
-        return await self.call(
-            f'https://www.google-analytics.com/mp/collect?measurement_id={self.measurement_id}&api_secret={self.api_secret}',
-            method='post',
-            json={
-                'client_id' : client_id,
-                'events' : [
-                    event_obj
-                ]
-            }
-        )
\ No newline at end of file
+
+    async def send_purchase_info(self,ga_id,event_name,order_info):
+        """구매 이벤트를 ga4 대기열에 넣습니다. 같은 transaction_id 는 한 번만 들어갑니다.
+
+        실제 전송은 GA4Dispatcher 가 합니다.
+        """
+        client_id = ga_id.split('.')[-2] + '.' + ga_id.split('.')[-1]
+        async with connection() as conn:
+            return await job_queue.enqueue(
+                conn,
+                GA4_QUEUE,
+                order_info['order_id'],
+                {
+                    'client_id' : client_id,
+                    'event' : self.make_purchase_event(event_name,order_info)
+                },
+                max_attempts=settings.GA4_MAX_ATTEMPTS
+            )
+
+    async def send_events(self,client_id,events):
+        """client_id 하나의 이벤트를 한 번의 요청으로 보냅니다. 5xx / 429 / 연결 오류는 다시 시도합니다."""
+        for i in range(3):
+            start_time = time.perf_counter()
+            try:
+                status, text = await self.call(
+                    f'https://www.google-analytics.com/mp/collect?measurement_id={self.measurement_id}&api_secret={self.api_secret}',
+                    method='post',
+                    json={
+                        'client_id' : client_id,
+                        'events' : events
+                    }
+                )
+                REQUEST_SECONDS.observe(time.perf_counter() - start_time, status=status)
+                if status < 300:
+                    return
+                if status != 429 and status < 500:
+                    raise Exception(f'GA4 {status} {text}')
+                error = Exception(f'GA4 {status} {text}')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                REQUEST_SECONDS.observe(time.perf_counter() - start_time, status='error')
+                error = e
+            if i < 2: # 마지막 실패 뒤에는 기다리지 않고 job_queue.fail 의 재시도 간격에 맡김
+                await asyncio.sleep(2 ** i)
+        raise error
+
+
+class GA4Dispatcher:
+    """ga4 대기열의 이벤트를 client_id 별로 MAX_BATCH_EVENTS 개씩 묶어서 보냅니다.
+
+    실패한 이벤트는 job_queue.fail 로 뒤로 미뤄 다시 보내고, GA4_MAX_ATTEMPTS 번 실패하면 failed 로 남깁니다.
+    """
+    def __init__(self, claim_size=100, poll_interval=2, stale_seconds=300):
+        self.ga4 = GA4()
+        self.claim_size = claim_size
+        self.poll_interval = poll_interval
+        self.stale_seconds = stale_seconds
+
+    async def run(self):
+        try:
+            while True:
+                try:
+                    count = await self.dispatch()
+                    if count < self.claim_size:
+                        await asyncio.sleep(self.poll_interval)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    traceback.print_exc()
+                    await asyncio.sleep(self.poll_interval)
+        finally:
+            await self.ga4.close()
+
+    async def dispatch(self):
+        """대기열에서 이벤트를 한 번 가져와 보내고 가져온 수를 리턴합니다."""
+        async with connection() as conn:
+            jobs = await job_queue.claim(conn, GA4_QUEUE, self.claim_size, self.stale_seconds)
+            QUEUE_DEPTH.set(await job_queue.pending_count(conn, GA4_QUEUE))
+        if not jobs:
+            return 0
+        jobs_by_client = defaultdict(list)
+        for job in jobs:
+            jobs_by_client[job['payload']['client_id']].append(job)
+        batches = []
+        for client_id, client_jobs in jobs_by_client.items():
+            for i in range(0, len(client_jobs), MAX_BATCH_EVENTS):
+                batches.append((client_id, client_jobs[i:i+MAX_BATCH_EVENTS]))
+        await asyncio.gather(*[self.send_batch(client_id, batch) for client_id, batch in batches])
+        return len(jobs)
+
+    async def send_batch(self, client_id, jobs):
+        try:
+            await self.ga4.send_events(client_id, [job['payload']['event'] for job in jobs])
+        except Exception as e:
+            print(f'GA4 전송 실패 {client_id} {len(jobs)}건 - {e}')
+            async with connection() as conn:
+                for job in jobs:
+                    status = await job_queue.fail(conn, job, repr(e))
+                    EVENT_TOTAL.inc(status=status or 'reclaimed')
+            return
+        now = datetime.datetime.now()
+        async with connection() as conn:
+            for job in jobs:
+                if not await job_queue.complete(conn, job):
+                    # stale 로 다른 dispatcher 가 다시 가져간 이벤트 (그쪽에서 결과를 남김)
+                    EVENT_TOTAL.inc(status='reclaimed')
+                    continue
+                EVENT_TOTAL.inc(status='done')
+                DELIVERY_SECONDS.observe((now - job['created_at']).total_seconds())
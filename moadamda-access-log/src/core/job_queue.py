@@ -0,0 +1,162 @@
+import asyncio
+import json
+import traceback
+
+from core.postgres import connection
+
+RETRY_BASE_SECONDS = 10
+RETRY_MAX_SECONDS = 3600
+
+
+async def enqueue(conn, queue, job_key, payload, max_attempts=5, delay=0):
+    """작업을 넣습니다. 같은 (queue, job_key) 가 이미 있으면 넣지 않고 False 를 리턴합니다."""
+    idx = await conn.fetchval(
+        """
+            INSERT INTO job_queue
+            (queue, job_key, payload, max_attempts, run_at)
+            VALUES
+            ($1, $2, $3, $4, now() + $5 * interval '1 second')
+            ON CONFLICT(queue, job_key)
+            DO NOTHING
+            RETURNING idx
+        """,queue,str(job_key),json.dumps(payload,ensure_ascii=False),max_attempts,delay
+    )
+    return idx is not None
+
+
+async def claim(conn, queue, limit, stale_seconds):
+    """실행할 작업을 limit 개까지 running 으로 바꾸고 가져옵니다.
+
+    running 인 채로 stale_seconds 가 지난 작업(worker 가 죽은 경우)도 다시 가져오고,
+    그중 시도 횟수를 다 쓴 작업은 계속 worker 를 죽이지 않도록 failed 로 남깁니다.
+    돌려주는 locked_at 은 complete / fail 에서 이 worker 가 아직 작업을 가지고 있는지 확인할 때 씁니다.
+    """
+    await conn.execute(
+        """
+            UPDATE job_queue
+            SET status = 'failed', locked_at = null, updated_at = now(),
+                last_error = coalesce(last_error || E'\n', '') || 'stale: 시도 횟수를 다 쓸 때까지 worker 가 끝내지 못함'
+            WHERE queue = $1
+            AND status = 'running'
+            AND locked_at < now() - $2 * interval '1 second'
+            AND attempts >= max_attempts
+        """,queue,stale_seconds
+    )
+    rows = await conn.fetch(
+        """
+            UPDATE job_queue
+            SET status = 'running', attempts = attempts + 1, locked_at = now(), updated_at = now()
+            WHERE idx IN (
+                SELECT idx FROM job_queue
+                WHERE queue = $1
+                AND (
+                    (status = 'pending' AND run_at <= now())
+                    OR (
+                        status = 'running' AND locked_at < now() - $3 * interval '1 second'
+                        AND attempts < max_attempts
+                    )
+                )
+                ORDER BY run_at
+                LIMIT $2
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING idx, job_key, payload, attempts, max_attempts, locked_at, created_at
+        """,queue,limit,stale_seconds
+    )
+    return [
+        {**dict(row), 'payload' : json.loads(row['payload'])}
+        for row in rows
+    ]
+
+
+async def pending_count(conn, queue):
+    return await conn.fetchval(
+        """
+            SELECT count(*) FROM job_queue
+            WHERE queue = $1 AND status IN ('pending', 'running')
+        """,queue
+    )
+
+
+async def complete(conn, job):
+    """작업을 done 으로 바꿉니다. 그 사이 다른 worker 가 다시 가져간 작업이면 바꾸지 않고 False 를 리턴합니다."""
+    res = await conn.execute(
+        """
+            UPDATE job_queue
+            SET status = 'done', locked_at = null, last_error = null, updated_at = now()
+            WHERE idx = $1 AND status = 'running' AND locked_at = $2
+        """,job['idx'],job['locked_at']
+    )
+    return res != 'UPDATE 0'
+
+
+async def fail(conn, job, error):
+    """시도 횟수가 남았으면 지수 증가하는 시간 뒤로 미루고, 아니면 failed 로 남깁니다.
+
+    그 사이 다른 worker 가 다시 가져간 작업이면 바꾸지 않고 None 을 리턴합니다.
+    """
+    if job['attempts'] >= job['max_attempts']:
+        status = 'failed'
+        delay = 0
+    else:
+        status = 'pending'
+        delay = min(RETRY_BASE_SECONDS * 2 ** (job['attempts'] - 1), RETRY_MAX_SECONDS)
+    res = await conn.execute(
+        """
+            UPDATE job_queue
+            SET status = $2, locked_at = null, last_error = $3,
+                run_at = now() + $4 * interval '1 second', updated_at = now()
+            WHERE idx = $1 AND status = 'running' AND locked_at = $5
+        """,job['idx'],status,error,delay,job['locked_at']
+    )
+    if res == 'UPDATE 0':
+        return None
+    return status
+
+
+class JobWorker:
+    """queue 의 작업을 concurrency 개까지 동시에 handler(payload) 로 처리합니다.
+
+    여러 프로세스에서 같은 queue 의 worker 를 띄워도 SKIP LOCKED 로 작업이 나뉩니다.
+    handler 에서 예외가 나면 fail() 로 재시도 일정을 잡습니다.
+    """
+    def __init__(self, queue, handler, concurrency=2, poll_interval=1, stale_seconds=600):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.stale_seconds = stale_seconds
+        self.running = set()
+
+    async def run(self):
+        while True:
+            try:
+                free = self.concurrency - len(self.running)
+                jobs = []
+                if free > 0:
+                    async with connection() as conn:
+                        jobs = await claim(conn, self.queue, free, self.stale_seconds)
+                for job in jobs:
+                    task = asyncio.create_task(self._process(job))
+                    self.running.add(task)
+                    task.add_done_callback(self.running.discard)
+                if not jobs or len(self.running) >= self.concurrency:
+                    await asyncio.sleep(self.poll_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                traceback.print_exc()
+                await asyncio.sleep(self.poll_interval)
+
+    async def _process(self, job):
+        try:
+            await self.handler(job['payload'])
+        except Exception as e:
+            traceback.print_exc()
+            async with connection() as conn:
+                status = await fail(conn, job, repr(e))
+            print(f'{self.queue} 작업 {job["job_key"]} 실패 ({job["attempts"]}/{job["max_attempts"]}) - {status or "다른 worker 가 다시 가져감"}')
+            return
+        async with connection() as conn:
+            if not await complete(conn, job):
+                print(f'{self.queue} 작업 {job["job_key"]} 완료했지만 stale 로 다른 worker 가 다시 가져감')
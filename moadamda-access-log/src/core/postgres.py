@@ -10,6 +10,7 @@ from asyncpg.pool import Pool
 from conf.settings import settings
 
 POOL = None
+EXPORT_POOL = None
 
 DATABASES = {}
 
@@ -28,10 +29,27 @@ async def init_pool() -> Pool:
     return POOL
 
 
+async def init_export_pool() -> Pool:
+    # 대용량 export 전용 풀. 오래 잡고 있는 커서가 수집(/access) 용 풀의 연결을 쓰지 않도록 분리
+    global EXPORT_POOL
+    if EXPORT_POOL is None:
+        EXPORT_POOL = await asyncpg.create_pool(
+            host=settings.POSTGRES_HOSTNAME,
+            password=settings.POSTGRES_PASSWORD,
+            user=settings.POSTGRES_USER,
+            database=settings.POSTGRES_DB,
+            min_size=0,
+            max_size=settings.EXPORT_POOL_SIZE,
+        )
+    return EXPORT_POOL
+
+
 async def release_pool():
-    global POOL
+    global POOL, EXPORT_POOL
     if POOL:
         await POOL.close()
+    if EXPORT_POOL:
+        await EXPORT_POOL.close()
 
 
 @asynccontextmanager
@@ -41,6 +59,28 @@ async def connection():
         yield session
 
 
+@asynccontextmanager
+async def export_connection():
+    pool = await init_export_pool()
+    async with pool.acquire() as session:
+        yield session
+
+
+@asynccontextmanager
+async def listen_connection():
+    # LISTEN 은 연결을 계속 잡고 있어야 하므로 풀 밖에서 따로 연결
+    conn = await asyncpg.connect(
+        host=settings.POSTGRES_HOSTNAME,
+        password=settings.POSTGRES_PASSWORD,
+        user=settings.POSTGRES_USER,
+        database=settings.POSTGRES_DB,
+    )
+    try:
+        yield conn
+    finally:
+        await conn.close()
+
+
 async def return_connection():
     pool = await init_pool()
     conn = await pool.acquire()
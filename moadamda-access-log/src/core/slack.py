@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+import aiohttp
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+
+from common import metrics
+from conf.settings import settings
+
+DELIVERY_SECONDS = metrics.Histogram(
+    'slack_delivery_seconds', '슬랙 전송 요청부터 완료까지 걸린 시간(초, 대기열 포함)'
+)
+RETRY_TOTAL = metrics.Counter('slack_retry_total', '슬랙 전송 재시도 횟수')
+QUEUE_DEPTH = metrics.Histogram(
+    'slack_queue_depth', '전송 요청 시점의 슬랙 대기열 길이', buckets=(0, 1, 5, 10, 50, 100)
+)
+
+
+class SlackSender:
+    """슬랙 메시지 / 파일 업로드를 비동기로 보냅니다.
+
+    하나의 aiohttp 세션을 공유하는 AsyncWebClient 로 보내며, 요청은 크기가 정해진 대기열을 거쳐
+    worker_count 개의 worker 가 처리합니다 (대기열이 가득 차면 요청하는 쪽이 기다림).
+    429 는 Retry-After 만큼, 연결 오류 / 5xx 는 지수 증가하는 시간만큼 쉬었다가 다시 보냅니다.
+    """
+    def __init__(self, token=None, queue_size=100, worker_count=2, max_retry=5):
+        self.token = token
+        self.queue_size = queue_size
+        self.worker_count = worker_count
+        self.max_retry = max_retry
+        self.session = None
+        self.client = None
+        self.queue = None
+        self.workers = []
+        self.loop = None
+
+    def _start(self):
+        # 이벤트 루프마다 대기열 / worker 를 새로 만듦 (스케줄러에서 asyncio.run 을 여러 번 쓰는 경우)
+        loop = asyncio.get_running_loop()
+        if self.loop is loop:
+            return
+        self.loop = loop
+        self.session = aiohttp.ClientSession()
+        self.client = AsyncWebClient(
+            token=self.token or settings.SLACK_BOT_TOKEN,
+            session=self.session,
+            retry_handlers=[] # 재시도는 대기열에서 처리
+        )
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.workers = [asyncio.create_task(self._work()) for _ in range(self.worker_count)]
+
+    async def close(self):
+        if self.loop is not asyncio.get_running_loop():
+            return
+        await self.queue.join()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        await self.session.close()
+        self.loop = None
+
+    async def send(self, method, **kwargs):
+        """AsyncWebClient 의 method 를 대기열을 거쳐 호출하고 응답을 리턴합니다."""
+        self._start()
+        future = asyncio.get_running_loop().create_future()
+        QUEUE_DEPTH.observe(self.queue.qsize())
+        await self.queue.put((method, kwargs, future, time.perf_counter()))
+        return await future
+
+    async def post_message(self, **kwargs):
+        return await self.send('chat_postMessage', **kwargs)
+
+    async def upload_file(self, **kwargs):
+        return await self.send('files_upload_v2', **kwargs)
+
+    async def _work(self):
+        while True:
+            method, kwargs, future, enqueued_at = await self.queue.get()
+            status = 'ok'
+            try:
+                res = await self._call(method, kwargs)
+                if not future.done():
+                    future.set_result(res)
+            except Exception as e:
+                status = 'error'
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                DELIVERY_SECONDS.observe(time.perf_counter() - enqueued_at, method=method, status=status)
+                self.queue.task_done()
+
+    async def _call(self, method, kwargs):
+        for i in range(self.max_retry + 1):
+            try:
+                return await getattr(self.client, method)(**kwargs)
+            except SlackApiError as e:
+                status_code = e.response.status_code
+                if i == self.max_retry or (status_code != 429 and status_code < 500):
+                    raise
+                if status_code == 429:
+                    delay = int(e.response.headers.get('Retry-After', 1))
+                else:
+                    delay = 2 ** i
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if i == self.max_retry:
+                    raise
+                delay = 2 ** i
+            RETRY_TOTAL.inc(method=method)
+            print(f'slack {method} 재시도 {i+1}/{self.max_retry} - {delay}초 대기')
+            await asyncio.sleep(delay)
+
+
+sender = SlackSender(
+    queue_size=settings.SLACK_QUEUE_SIZE,
+    worker_count=settings.SLACK_WORKER_COUNT
+)
@@ -2,6 +2,7 @@ import asyncio
 import time
 from . import meta
 from . import clarity
+from . import access_log
 
 async def run(module,function,sleep):
     ref = None
@@ -9,6 +10,8 @@ async def run(module,function,sleep):
         ref = getattr(meta,function)
     elif module == 'clarity':
         ref = getattr(clarity,function)
+    elif module == 'access_log':
+        ref = getattr(access_log,function)
 
     loop_count = 0
     while True:
@@ -0,0 +1 @@
+from . import utm_rollup, cookie_backfill, identity_graph, sessionize, attribution
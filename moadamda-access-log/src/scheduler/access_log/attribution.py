@@ -0,0 +1,159 @@
+import time
+import numpy as np
+from datetime import datetime,timedelta
+from common.identity_graph import graph, make_node
+from conf.settings import settings
+from core.postgres import connection,transaction
+from .attribution_models import MODELS, compute_credits, aggregate_credits
+
+NO_CAMPAIGN = ('', '', '', '') # 기간 안에 utm 유입이 없는 주문
+
+
+async def run():
+    """최근 ATTRIBUTION_DAYS 일 주문의 기여도를 모델별로 계산해서 campaign_attribution 에 다시 씁니다.
+
+    주문 전 ATTRIBUTION_LOOKBACK_DAYS 일 안에 같은 방문자(identity graph 로 묶인 _mdUUID)가
+    utm 으로 들어온 세션(visit_session)을 touch 로 보고, 모든 주문의 touch 를 배열 하나로 만들어 한 번에 계산합니다.
+    주문 금액은 order_attribution_snapshot 에서 읽으며, 금액을 알 수 없는 주문은 0 원으로 넣지 않고 건너뜁니다.
+    """
+    end_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    start_date = end_date - timedelta(days=settings.ATTRIBUTION_DAYS + 1)
+    start_time = time.perf_counter()
+    async with connection() as conn:
+        await graph.refresh(conn)
+        orders = await load_orders(conn, start_date, end_date)
+        skipped_orders = [order['order_id'] for order in orders if order['revenue'] is None]
+        if skipped_orders:
+            print(f'기여도 계산 주문 금액 없는 주문 {len(skipped_orders)}개 제외 : {", ".join(skipped_orders[:20])}')
+        orders = [order for order in orders if order['revenue'] is not None]
+        touches = await load_touches(conn, orders)
+        records = compute_attribution(orders, touches)
+        async with transaction(conn):
+            await conn.execute(
+                """
+                    DELETE FROM campaign_attribution WHERE order_date >= $1 AND order_date < $2
+                """,start_date.date(),end_date.date()
+            )
+            await conn.copy_records_to_table(
+                'campaign_attribution',
+                records=records,
+                columns=[
+                    'order_date', 'model', 'utm_source', 'utm_medium', 'utm_campaign', 'utm_content',
+                    'conversions', 'revenue'
+                ]
+            )
+    print(f'기여도 계산 {start_date} ~ {end_date} : 주문 {len(orders)}개 (제외 {len(skipped_orders)}개), touch {len(touches)}개, {time.perf_counter() - start_time:.2f}초')
+
+
+async def load_orders(conn, start_date, end_date):
+    """기간 안의 주문 (order_id, md_uuid, 주문 시간, 주문 금액) 목록
+
+    주문 금액은 슬랙 알림 때 Cafe24 주문 정보로 저장한 order_attribution_snapshot 의 order_price 이며,
+    snapshot 이 없거나 금액을 읽을 수 없으면 None 입니다.
+    """
+    return await conn.fetch(
+        """
+            SELECT o.order_id, o.md_uuid, o.access_date,
+            CASE WHEN s.data->>'order_price' ~ '^[0-9,]+$'
+                THEN replace(s.data->>'order_price', ',', '')::double precision
+            END AS revenue
+            FROM (
+                SELECT DISTINCT ON (order_id) order_id, md_uuid, access_date
+                FROM (
+                    SELECT substring(url FROM 'order_id=([^&]+)') AS order_id, md_uuid, access_date
+                    FROM access_log
+                    WHERE url LIKE '%order_result%'
+                    AND access_date >= $1 AND access_date < $2
+                ) AS order_log
+                WHERE order_id IS NOT NULL
+                ORDER BY order_id, access_date
+            ) AS o
+            LEFT JOIN order_attribution_snapshot AS s
+            ON s.order_id = o.order_id
+            ORDER BY o.access_date
+        """,start_date,end_date
+    )
+
+
+async def load_touches(conn, orders):
+    """주문별 utm 유입 세션 (주문 번호, 주문 몇 시간 전, utm_source, utm_medium, utm_campaign, utm_content)"""
+    order_no_list = []
+    uuid_list = []
+    order_at_list = []
+    for order_no, order in enumerate(orders):
+        if not order['md_uuid']:
+            continue
+        for uuid in graph.get_members(make_node('uuid', order['md_uuid'])):
+            if uuid.startswith('uuid:'):
+                order_no_list.append(order_no)
+                uuid_list.append(uuid[len('uuid:'):])
+                order_at_list.append(order['access_date'])
+    if not order_no_list:
+        return []
+    return await conn.fetch(
+        """
+            SELECT
+                o.order_no,
+                extract(epoch FROM o.order_at - s.started_at) / 3600 AS hours,
+                s.utm_source,
+                coalesce(s.utm_medium, '') AS utm_medium,
+                coalesce(s.utm_campaign, '') AS utm_campaign,
+                replace(coalesce(s.utm_content, ''), '+', ' ') AS utm_content
+            FROM unnest($1::bigint[], $2::text[], $3::timestamp[]) AS o(order_no, md_uuid, order_at)
+            JOIN visit_session AS s
+            ON s.md_uuid = o.md_uuid
+            AND s.started_at <= o.order_at
+            AND s.started_at >= o.order_at - make_interval(days => $4)
+            WHERE s.utm_source IS NOT NULL
+        """,order_no_list,uuid_list,order_at_list,settings.ATTRIBUTION_LOOKBACK_DAYS
+    )
+
+
+def compute_attribution(orders, touches):
+    """주문과 touch 로 campaign_attribution row 목록을 만듭니다."""
+    if not orders:
+        return []
+    order_no = [row['order_no'] for row in touches]
+    hours = [float(row['hours']) for row in touches]
+    campaigns = [
+        (row['utm_source'], row['utm_medium'], row['utm_campaign'], row['utm_content']) for row in touches
+    ]
+    # touch 가 없는 주문도 전환 수에 들어가도록 utm 없는 touch 하나를 넣음
+    touched = set(order_no)
+    for no in range(len(orders)):
+        if no not in touched:
+            order_no.append(no)
+            hours.append(0.0)
+            campaigns.append(NO_CAMPAIGN)
+
+    order_no = np.asarray(order_no, dtype=np.int64)
+    hours = np.asarray(hours, dtype=np.float64)
+    # 주문 번호, 시간 순서 (주문에서 먼 touch 부터)
+    order = np.lexsort((-hours, order_no))
+    order_no = order_no[order]
+    hours = hours[order]
+
+    order_dates = [row['access_date'].date() for row in orders]
+    revenue = np.asarray([row['revenue'] for row in orders], dtype=np.float64)
+    # (주문 날짜, utm) 을 번호로 바꿔서 bincount 로 한 번에 합침
+    key_index = {}
+    key_list = []
+    touch_key = np.empty(len(order), dtype=np.int64)
+    for i, touch_no in enumerate(order):
+        key = (order_dates[order_no[i]], campaigns[touch_no])
+        if key not in key_index:
+            key_index[key] = len(key_list)
+            key_list.append(key)
+        touch_key[i] = key_index[key]
+
+    credits = compute_credits(order_no, hours, settings.ATTRIBUTION_HALF_LIFE_HOURS)
+    result = aggregate_credits(credits, touch_key, revenue[order_no], len(key_list))
+    records = []
+    for model in MODELS:
+        conversions, model_revenue = result[model]
+        for no in np.flatnonzero(conversions):
+            order_date, campaign = key_list[no]
+            records.append(
+                (order_date, model, *campaign, float(conversions[no]), float(model_revenue[no]))
+            )
+    return records
@@ -0,0 +1,57 @@
+import numpy as np
+
+MODELS = ['last_touch', 'first_touch', 'linear', 'time_decay']
+
+
+def compute_credits(order_no, touch_hours, half_life_hours):
+    """주문별 유입(touch)에 모델별 기여도를 한 번에 계산합니다.
+
+    touch 는 주문 번호, 시간 순서로 정렬되어 있어야 하고 주문마다 기여도 합은 1 입니다.
+        - last_touch / first_touch : 주문의 마지막 / 첫 touch 에 1
+        - linear : touch 수로 나눔
+        - time_decay : 주문 half_life_hours 시간 전 touch 는 주문 직전 touch 의 절반
+
+    :param order_no: touch 별 주문 번호 (0 부터)
+    :param touch_hours: touch 별 주문 몇 시간 전인지
+    :return: {model : touch 별 기여도}
+    """
+    order_no = np.asarray(order_no, dtype=np.int64)
+    touch_hours = np.asarray(touch_hours, dtype=np.float64)
+    touch_count = len(order_no)
+    if touch_count == 0:
+        return {model : np.zeros(0) for model in MODELS}
+    order_count = int(order_no.max()) + 1
+
+    # 주문이 바뀌는 위치로 첫 / 마지막 touch 를 찾음
+    is_first = np.ones(touch_count, dtype=bool)
+    is_first[1:] = order_no[1:] != order_no[:-1]
+    is_last = np.ones(touch_count, dtype=bool)
+    is_last[:-1] = is_first[1:]
+
+    per_order = np.bincount(order_no, minlength=order_count)
+    decay = np.exp2(-touch_hours / half_life_hours)
+    decay_sum = np.bincount(order_no, weights=decay, minlength=order_count)
+    return {
+        'last_touch' : is_last.astype(np.float64),
+        'first_touch' : is_first.astype(np.float64),
+        'linear' : 1.0 / per_order[order_no],
+        'time_decay' : decay / decay_sum[order_no],
+    }
+
+
+def aggregate_credits(credits, touch_campaign, touch_revenue, campaign_count):
+    """touch 별 기여도를 utm(campaign) 별 (전환 수, 매출) 로 합칩니다.
+
+    :param touch_campaign: touch 별 campaign 번호 (0 부터)
+    :param touch_revenue: touch 별 주문 금액
+    :return: {model : (campaign 별 전환 수, campaign 별 매출)}
+    """
+    touch_campaign = np.asarray(touch_campaign, dtype=np.int64)
+    touch_revenue = np.asarray(touch_revenue, dtype=np.float64)
+    return {
+        model : (
+            np.bincount(touch_campaign, weights=credit, minlength=campaign_count),
+            np.bincount(touch_campaign, weights=credit * touch_revenue, minlength=campaign_count),
+        )
+        for model, credit in credits.items()
+    }
@@ -0,0 +1,66 @@
+from core.postgres import connection,transaction
+
+JOB_NAME = 'access_log_cookie_columns'
+CHUNK_SIZE = 50000 # 한 트랜잭션에서 채울 access_log idx 범위
+
+
+async def run():
+    """식별값 컬럼(md_uuid, login_id, member_id, ga_id, clck)이 생기기 전 row 를 cookies 에서 채웁니다.
+
+    idx 순서로 CHUNK_SIZE 씩 처리하고 처리한 위치는 job_watermark 에 남기므로 중간에 끊겨도 이어서 실행됩니다.
+    끝까지 채우면 closed_until 에 완료 시간을 남깁니다. 이후 row 는 수집할 때 컬럼이 채워지므로
+    API 조회는 closed_until 이 생긴 뒤부터 컬럼을 씁니다.
+    """
+    async with connection() as conn:
+        last_idx = await conn.fetchval(
+            """SELECT last_idx FROM job_watermark WHERE name = $1""",JOB_NAME
+        ) or 0
+        end_idx = await conn.fetchval("""SELECT max(idx) FROM access_log""") or 0
+        while last_idx < end_idx:
+            chunk_end_idx = min(last_idx + CHUNK_SIZE, end_idx)
+            async with transaction(conn):
+                res = await conn.execute(
+                    """
+                        UPDATE access_log
+                        SET
+                            md_uuid = nullif(cookies->>'_mdUUID', ''),
+                            login_id = nullif(cookies->>'_LOGINID', ''),
+                            member_id = nullif(cookies->'login_provider_1'->>'member_id', ''),
+                            ga_id = nullif(cookies->>'_ga', ''),
+                            clck = nullif(cookies->>'_clck', '')
+                        WHERE idx > $1 AND idx <= $2
+                        AND md_uuid IS NULL
+                        AND jsonb_typeof(cookies) = 'object'
+                    """,last_idx,chunk_end_idx
+                )
+                await conn.execute(
+                    """
+                        INSERT INTO job_watermark (name, last_idx, updated_at)
+                        VALUES ($1, $2, now())
+                        ON CONFLICT(name)
+                        DO UPDATE SET last_idx = excluded.last_idx, updated_at = excluded.updated_at
+                    """,JOB_NAME,chunk_end_idx
+                )
+            print(f'access_log 쿠키 컬럼 {last_idx} ~ {chunk_end_idx} : {res}')
+            last_idx = chunk_end_idx
+        await conn.execute(
+            """
+                INSERT INTO job_watermark (name, last_idx, closed_until, updated_at)
+                VALUES ($1, $2, now(), now())
+                ON CONFLICT(name)
+                DO UPDATE SET closed_until = coalesce(job_watermark.closed_until, excluded.closed_until), updated_at = excluded.updated_at
+            """,JOB_NAME,last_idx
+        )
+
+
+
+async def get_backfilled_idx(conn):
+    """식별값 컬럼을 믿을 수 있는 마지막 access_log idx. 끝까지 채운 적이 있으면 None (제한 없음)"""
+    row = await conn.fetchrow(
+        """SELECT last_idx, closed_until FROM job_watermark WHERE name = $1""",JOB_NAME
+    )
+    if row is None:
+        return 0
+    if row['closed_until'] is not None:
+        return None
+    return row['last_idx']
@@ -0,0 +1,98 @@
+from datetime import timedelta
+from common.identity_graph import graph, make_node
+from conf.settings import settings
+from core.postgres import connection,transaction
+from .cookie_backfill import get_backfilled_idx
+
+JOB_NAME = 'identity_graph'
+CHUNK_SIZE = 50000 # 한 트랜잭션에서 처리할 access_log idx 범위
+SETTLE_SECONDS = 60 # 아직 커밋되지 않은 row 를 건너뛰지 않도록 이 시간 전에 들어온 row 까지만 처리
+
+
+async def run():
+    """access_log 의 식별값을 identity_node 에 같은 방문자로 묶습니다.
+
+    한 row 의 md_uuid 를 member(login_id / member_id), _ga, _clck 와 연결하고,
+    같은 ip + user_agent 로 IDENTITY_IPUA_WINDOW_MINUTES 안에 이어서 들어온 다른 md_uuid 끼리도 연결합니다.
+    ip + ua 연결은 공용 ip 에서 여러 사람이 묶이지 않도록 IDENTITY_MAX_IPUA_COMPONENT 보다 큰 집합은 만들지 않습니다.
+    md_uuid 컬럼이 채워진 row 만 읽으므로 cookie_backfill 이 채운 위치 뒤로는 넘어가지 않습니다.
+    """
+    window = timedelta(minutes=settings.IDENTITY_IPUA_WINDOW_MINUTES)
+    last_seen = {} # (ip, user_agent) : (uuid node, access_date)
+    async with connection() as conn:
+        try:
+            await graph.refresh(conn)
+            last_idx = await conn.fetchval(
+                """SELECT last_idx FROM job_watermark WHERE name = $1""",JOB_NAME
+            ) or 0
+            end_idx = await conn.fetchval(
+                """
+                    SELECT max(idx) FROM access_log
+                    WHERE access_date < now() - make_interval(secs => $1)
+                """,SETTLE_SECONDS
+            ) or 0
+            backfilled_idx = await get_backfilled_idx(conn)
+            if backfilled_idx is not None and backfilled_idx < end_idx:
+                print(f'identity graph cookie_backfill 이 채운 {backfilled_idx} 까지만 처리')
+                end_idx = backfilled_idx
+            while last_idx < end_idx:
+                chunk_end_idx = min(last_idx + CHUNK_SIZE, end_idx)
+                rows = await conn.fetch(
+                    """
+                        SELECT md_uuid, login_id, member_id, ga_id, clck, ip, user_agent, access_date
+                        FROM access_log
+                        WHERE idx > $1 AND idx <= $2 AND md_uuid IS NOT NULL
+                        ORDER BY idx
+                    """,last_idx,chunk_end_idx
+                )
+                link_count = 0
+                for row in rows:
+                    link_count += link_row(row, last_seen, window)
+                if rows:
+                    # idx 순서는 대략 시간 순서이므로 창을 벗어난 ip + ua 는 버림
+                    expire_date = rows[-1]['access_date'] - window
+                    last_seen = {
+                        key : value for key, value in last_seen.items() if value[1] >= expire_date
+                    }
+                async with transaction(conn):
+                    node_count = await graph.flush(conn)
+                    await conn.execute(
+                        """
+                            INSERT INTO job_watermark (name, last_idx, updated_at)
+                            VALUES ($1, $2, now())
+                            ON CONFLICT(name)
+                            DO UPDATE SET last_idx = excluded.last_idx, updated_at = excluded.updated_at
+                        """,JOB_NAME,chunk_end_idx
+                    )
+                print(f'identity graph {last_idx} ~ {chunk_end_idx} : 연결 {link_count}건, node {node_count}개 저장')
+                last_idx = chunk_end_idx
+        except:
+            # 저장되지 않은 union 이 메모리에 남지 않도록 다음 실행에서 처음부터 다시 읽음
+            graph.clear()
+            raise
+
+
+def link_row(row, last_seen, window):
+    """row 하나의 식별값을 연결하고 새로 합쳐진 수를 리턴합니다."""
+    uuid_node = make_node('uuid', row['md_uuid'])
+    link_count = 0
+    for node in [
+        make_node('member', row['login_id']),
+        make_node('member', row['member_id']),
+        make_node('ga', row['ga_id']),
+        make_node('clarity', row['clck']),
+    ]:
+        if node is not None and graph.union(uuid_node, node):
+            link_count += 1
+    if row['ip'] and row['user_agent']:
+        key = (row['ip'], row['user_agent'])
+        seen = last_seen.get(key)
+        if (
+            seen is not None
+            and seen[0] != uuid_node
+            and row['access_date'] - seen[1] <= window
+            and graph.union(uuid_node, seen[0], max_size=settings.IDENTITY_MAX_IPUA_COMPONENT)
+        ):
+            link_count += 1
+        last_seen[key] = (uuid_node, row['access_date'])
+    return link_count
@@ -0,0 +1,155 @@
+from datetime import timedelta
+from conf.settings import settings
+from core.postgres import connection,transaction
+from .cookie_backfill import get_backfilled_idx
+
+JOB_NAME = 'visit_session'
+CHUNK_SIZE = 50000 # 한 트랜잭션에서 처리할 access_log idx 범위
+SETTLE_SECONDS = 60 # 아직 커밋되지 않은 row 를 건너뛰지 않도록 이 시간 전에 들어온 row 까지만 처리
+
+SESSION_COLUMNS = [
+    'md_uuid', 'start_log_idx', 'end_log_idx', 'started_at', 'ended_at', 'page_count',
+    'entry_url', 'exit_url', 'utm_source', 'utm_medium', 'utm_campaign', 'utm_content', 'ip', 'device'
+]
+
+
+async def run():
+    """새로 들어온 access_log 를 _mdUUID 별 방문(visit_session)으로 묶습니다.
+
+    앞 페이지와 SESSION_GAP_MINUTES 넘게 떨어지거나 다른 utm 으로 들어오면 새 세션을 만들고,
+    아니면 그 방문자의 마지막 세션에 이어 붙입니다 (이전 실행에서 만든 세션 포함).
+    md_uuid 컬럼이 채워진 row 만 읽으므로 cookie_backfill 이 채운 위치 뒤로는 넘어가지 않습니다.
+    """
+    gap = timedelta(minutes=settings.SESSION_GAP_MINUTES)
+    async with connection() as conn:
+        last_idx = await conn.fetchval(
+            """SELECT last_idx FROM job_watermark WHERE name = $1""",JOB_NAME
+        ) or 0
+        end_idx = await conn.fetchval(
+            """
+                SELECT max(idx) FROM access_log
+                WHERE access_date < now() - make_interval(secs => $1)
+            """,SETTLE_SECONDS
+        ) or 0
+        backfilled_idx = await get_backfilled_idx(conn)
+        if backfilled_idx is not None and backfilled_idx < end_idx:
+            print(f'visit_session cookie_backfill 이 채운 {backfilled_idx} 까지만 처리')
+            end_idx = backfilled_idx
+        while last_idx < end_idx:
+            chunk_end_idx = min(last_idx + CHUNK_SIZE, end_idx)
+            rows = await conn.fetch(
+                """
+                    SELECT
+                        idx, md_uuid, url, access_date, end_date, ip, device,
+                        substring(url FROM 'utm_source=([^&]+)') AS utm_source,
+                        substring(url FROM 'utm_medium=([^&]+)') AS utm_medium,
+                        substring(url FROM 'utm_campaign=([^&]+)') AS utm_campaign,
+                        substring(url FROM 'utm_content=([^&]+)') AS utm_content
+                    FROM access_log
+                    WHERE idx > $1 AND idx <= $2 AND md_uuid IS NOT NULL
+                    AND url not like '%{{%'
+                    ORDER BY idx
+                """,last_idx,chunk_end_idx
+            )
+            open_sessions = {}
+            if rows:
+                open_rows = await conn.fetch(
+                    """
+                        SELECT DISTINCT ON (md_uuid) idx, md_uuid, start_log_idx, end_log_idx, started_at, ended_at,
+                        page_count, entry_url, exit_url, utm_source, utm_medium, utm_campaign, utm_content, ip, device
+                        FROM visit_session
+                        WHERE md_uuid = ANY($1::text[]) AND ended_at >= $2
+                        ORDER BY md_uuid, started_at DESC
+                    """,list({row['md_uuid'] for row in rows}),min(row['access_date'] for row in rows) - gap
+                )
+                open_sessions = {row['md_uuid'] : dict(row) for row in open_rows}
+            new_sessions, updated_sessions = build_sessions(rows, open_sessions, gap)
+            async with transaction(conn):
+                await conn.executemany(
+                    """
+                        UPDATE visit_session
+                        SET end_log_idx = $2, ended_at = $3, page_count = $4, exit_url = $5
+                        WHERE idx = $1
+                    """,[
+                        (session['idx'], session['end_log_idx'], session['ended_at'], session['page_count'], session['exit_url'])
+                        for session in updated_sessions
+                    ]
+                )
+                await conn.executemany(
+                    f"""
+                        INSERT INTO visit_session ({', '.join(SESSION_COLUMNS)})
+                        VALUES ({', '.join([f'${i+1}' for i in range(len(SESSION_COLUMNS))])})
+                        ON CONFLICT(start_log_idx)
+                        DO NOTHING
+                    """,[tuple([session[column] for column in SESSION_COLUMNS]) for session in new_sessions]
+                )
+                await conn.execute(
+                    """
+                        INSERT INTO job_watermark (name, last_idx, updated_at)
+                        VALUES ($1, $2, now())
+                        ON CONFLICT(name)
+                        DO UPDATE SET last_idx = excluded.last_idx, updated_at = excluded.updated_at
+                    """,JOB_NAME,chunk_end_idx
+                )
+            print(f'visit_session {last_idx} ~ {chunk_end_idx} : 새 세션 {len(new_sessions)}개, 이어 붙인 세션 {len(updated_sessions)}개')
+            last_idx = chunk_end_idx
+        # 마지막 페이지의 end_date 는 이탈할 때 채워지므로 최근 세션의 종료 시간을 다시 맞춤
+        await conn.execute(
+            """
+                UPDATE visit_session AS s
+                SET ended_at = a.end_date
+                FROM access_log AS a
+                WHERE a.idx = s.end_log_idx
+                AND s.ended_at >= now() - make_interval(mins => $1)
+                AND a.end_date > s.ended_at
+            """,settings.SESSION_GAP_MINUTES * 2
+        )
+
+
+def build_sessions(rows, open_sessions, gap):
+    """idx 순서의 row 를 세션으로 묶어 (새 세션 목록, 이어 붙인 기존 세션 목록) 을 리턴합니다.
+
+    :param open_sessions: {md_uuid : 이어 붙일 수 있는 visit_session row dict} (이 함수가 갱신함)
+    """
+    new_sessions = []
+    updated = {}
+    for row in rows:
+        session = open_sessions.get(row['md_uuid'])
+        if session is None or is_new_session(session, row, gap):
+            session = {
+                'md_uuid' : row['md_uuid'],
+                'start_log_idx' : row['idx'],
+                'end_log_idx' : row['idx'],
+                'started_at' : row['access_date'],
+                'ended_at' : row['end_date'] or row['access_date'],
+                'page_count' : 1,
+                'entry_url' : row['url'],
+                'exit_url' : row['url'],
+                'utm_source' : row['utm_source'],
+                'utm_medium' : row['utm_medium'],
+                'utm_campaign' : row['utm_campaign'],
+                'utm_content' : row['utm_content'],
+                'ip' : row['ip'],
+                'device' : row['device'],
+            }
+            new_sessions.append(session)
+            open_sessions[row['md_uuid']] = session
+            continue
+        session['end_log_idx'] = row['idx']
+        session['ended_at'] = max(session['ended_at'], row['end_date'] or row['access_date'])
+        session['page_count'] += 1
+        session['exit_url'] = row['url']
+        if 'idx' in session:
+            updated[session['idx']] = session
+    return new_sessions, list(updated.values())
+
+
+def is_new_session(session, row, gap):
+    if row['access_date'] - session['ended_at'] > gap:
+        return True
+    # 세션 중간에 다른 광고로 다시 들어오면 새 세션
+    return bool(row['utm_source']) and (
+        row['utm_source'], row['utm_medium'], row['utm_campaign'], row['utm_content']
+    ) != (
+        session['utm_source'], session['utm_medium'], session['utm_campaign'], session['utm_content']
+    )
@@ -0,0 +1,110 @@
+from core.postgres import connection,transaction
+
+JOB_NAME = 'utm_hourly_rollup'
+CHUNK_SIZE = 200000 # 한 트랜잭션에서 처리할 access_log idx 범위
+SETTLE_SECONDS = 60 # 아직 커밋되지 않은 row 를 건너뛰지 않도록 이 시간 전에 들어온 row 까지만 처리
+
+
+async def run():
+    """access_log 의 utm 유입을 utm_hourly_rollup 에 시간 단위로 누적합니다.
+
+    SETTLE_SECONDS 전 기준으로 닫힌 시간에 들어온 row 만 집계하고, 처리한 위치는 job_watermark 에 남깁니다.
+    닫힌 시간의 row 는 모두 커밋된 뒤이므로 idx 가 늦게 보여도 빠지지 않고,
+    watermark 는 아직 닫히지 않은 시간의 row 앞에서 멈춥니다.
+    같은 유입(fbclid, 없으면 ip + url)은 utm_traffic_seen 에 처음 들어온 한 번만 세므로
+    watermark 뒤쪽을 다시 읽어도 중복으로 더해지지 않습니다.
+    """
+    async with connection() as conn:
+        last_idx = await conn.fetchval(
+            """SELECT last_idx FROM job_watermark WHERE name = $1""",JOB_NAME
+        ) or 0
+        closed_until = await conn.fetchval(
+            """SELECT date_trunc('hour', now() - make_interval(secs => $1))::timestamp""",SETTLE_SECONDS
+        )
+        end_idx = await conn.fetchval(
+            """SELECT max(idx) FROM access_log WHERE access_date < $1""",closed_until
+        ) or 0
+        # 닫힌 시간 row 사이에 섞인 다음 시간 row 는 다음 실행에서 세야 하므로 그 앞까지만 watermark 를 올림
+        watermark_limit = await conn.fetchval(
+            """
+                SELECT min(idx) - 1 FROM access_log
+                WHERE idx > $1 AND idx <= $2 AND access_date >= $3
+            """,last_idx,end_idx,closed_until
+        )
+        if watermark_limit is None:
+            watermark_limit = end_idx
+        start_idx = last_idx
+        while start_idx < end_idx:
+            chunk_end_idx = min(start_idx + CHUNK_SIZE, end_idx)
+            async with transaction(conn):
+                count = await rollup_chunk(conn, start_idx, chunk_end_idx, closed_until)
+                last_idx = max(last_idx, min(chunk_end_idx, watermark_limit))
+                await conn.execute(
+                    """
+                        INSERT INTO job_watermark (name, last_idx, updated_at)
+                        VALUES ($1, $2, now())
+                        ON CONFLICT(name)
+                        DO UPDATE SET last_idx = excluded.last_idx, updated_at = excluded.updated_at
+                    """,JOB_NAME,last_idx
+                )
+            print(f'utm 시간별 집계 {start_idx} ~ {chunk_end_idx} : {count}건 추가')
+            start_idx = chunk_end_idx
+        # 모든 범위를 처리한 뒤에만 닫힌 시간을 올림 (/log 가 rollup 을 믿고 읽는 기준)
+        await conn.execute(
+            """
+                INSERT INTO job_watermark (name, last_idx, closed_until, updated_at)
+                VALUES ($1, $2, $3, now())
+                ON CONFLICT(name)
+                DO UPDATE SET closed_until = excluded.closed_until, updated_at = excluded.updated_at
+            """,JOB_NAME,last_idx,closed_until
+        )
+
+
+async def rollup_chunk(conn, start_idx, end_idx, closed_until):
+    """idx 범위 안의 처음 보는 유입만 utm_hourly_rollup 에 더하고 더한 건수를 리턴합니다."""
+    return await conn.fetchval(
+        """
+            WITH utm_log AS (
+                SELECT
+                    md5(coalesce(
+                        nullif(substring(url FROM 'fbclid=([^&]+)'), ''),
+                        coalesce(ip, '') || url
+                    )) AS dedup_key,
+                    coalesce(substring(url FROM 'utm_source=([^&]+)'), '') AS utm_source,
+                    coalesce(substring(url FROM 'utm_campaign=([^&]+)'), '') AS utm_campaign,
+                    coalesce(substring(url FROM 'utm_medium=([^&]+)'), '') AS utm_medium,
+                    replace(coalesce(substring(url FROM 'utm_content=([^&]+)'), ''), '+', ' ') AS utm_content,
+                    access_date
+                FROM access_log
+                WHERE idx > $1 AND idx <= $2 AND access_date < $3
+                and url like '%utm_source=%' and url not like '%{{%'
+            ),
+            first_log AS (
+                SELECT DISTINCT ON (dedup_key) *
+                FROM utm_log
+                ORDER BY dedup_key, access_date
+            ),
+            new_log AS (
+                INSERT INTO utm_traffic_seen (dedup_key, access_hour)
+                SELECT dedup_key, date_trunc('hour', access_date) FROM first_log
+                ON CONFLICT(dedup_key)
+                DO NOTHING
+                RETURNING dedup_key
+            ),
+            added AS (
+                INSERT INTO utm_hourly_rollup
+                (access_hour, utm_source, utm_campaign, utm_medium, utm_content, count)
+                SELECT
+                    date_trunc('hour', f.access_date),
+                    f.utm_source, f.utm_campaign, f.utm_medium, f.utm_content,
+                    count(*)
+                FROM first_log AS f
+                JOIN new_log AS n
+                ON n.dedup_key = f.dedup_key
+                GROUP BY 1, 2, 3, 4, 5
+                ON CONFLICT(access_hour, utm_source, utm_campaign, utm_medium, utm_content)
+                DO UPDATE SET count = utm_hourly_rollup.count + excluded.count
+            )
+            SELECT count(*) FROM new_log
+        """,start_idx,end_idx,closed_until
+    )
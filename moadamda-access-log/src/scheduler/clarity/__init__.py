@@ -1,2 +1,3 @@
 from . import init
-from . import add_runtime
\ No newline at end of file
+from . import add_runtime
+from . import import_legacy
\ No newline at end of file
@@ -0,0 +1,62 @@
+from datetime import datetime,timedelta
+from urllib.parse import urlparse, parse_qs, unquote_plus
+from common import utm_resolver
+
+
+async def make_ad_rows(conn, sessions):
+    """세션마다 utm_source 가 있는 첫 페이지로 clarity_ad_list row 를 만듭니다.
+
+    :param sessions: [(session_idx, page_list, 페이지별 (duration, active_duration, click_count)), ...]
+    """
+    rows = []
+    utm_list = []
+    for session_idx, page_list, pages in sessions:
+        for page, (duration, active_duration, click_count) in zip(page_list, pages):
+            if 'utm_source' not in page['url']:
+                continue
+            utm_id = utm_source = utm_medium = utm_campaign = utm_content = utm_term = ''
+            parsed_url = urlparse(page['url'])
+            query_params = parse_qs(parsed_url.query)
+            if 'utm_source' in query_params:
+                utm_source = query_params['utm_source'][0]
+            if 'utm_medium' in query_params:
+                utm_medium = query_params['utm_medium'][0]
+            if 'utm_campaign' in query_params:
+                utm_campaign = query_params['utm_campaign'][0]
+            if 'utm_content' in query_params:
+                utm_content = query_params['utm_content'][0]
+                if utm_content.startswith('%'):
+                    utm_content = unquote_plus(utm_content)
+                if utm_content.startswith('%'):
+                    utm_content = unquote_plus(utm_content)
+            if 'utm_term' in query_params:
+                utm_term = query_params['utm_term'][0]
+            if 'utm_id' in query_params:
+                utm_id = query_params['utm_id'][0]
+            utm_list.append((utm_source, utm_medium, utm_campaign, utm_content, utm_term, utm_id))
+            rows.append((
+                session_idx,
+                duration,
+                active_duration,
+                click_count,
+                datetime.strptime(page['timestamp'],'%Y-%m-%d %H:%M:%S') + timedelta(hours=9)
+            ))
+            break
+    utm_idx_list = await utm_resolver.resolver.resolve_many(conn, utm_list)
+    return [
+        (session_idx, utm_idx, *values)
+        for (session_idx, *values), utm_idx in zip(rows, utm_idx_list)
+    ]
+
+
+async def insert_ad_rows(conn, rows):
+    if not rows:
+        return
+    await conn.executemany(
+        """
+            INSERT INTO clarity_ad_list
+            (session_idx, ad_utm_idx, duration, active_duration, click_count, created_at)
+            VALUES
+            ($1,$2,$3,$4,$5,$6)
+        """,rows
+    )
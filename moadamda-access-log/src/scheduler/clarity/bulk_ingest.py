@@ -0,0 +1,147 @@
+import json
+from datetime import datetime
+from core.postgres import transaction
+
+STAGING_COLUMNS = [
+    'user_clarity_id', 'clarity_id', 'created_at', 'device_model', 'os_version',
+    'country', 'device', 'browser_name', 'data'
+]
+METRIC_COLUMNS = ['duration', 'active_duration', 'page_count', 'click_count']
+
+
+async def ingest_session_list(conn, session_list, page_lists=None, session_metrics=None):
+    """클래리티 세션 목록을 스테이징 테이블에 COPY 한 뒤 세 번의 쿼리로 저장합니다.
+
+    clarity_user_list / clarity_session_list / clarity_session_data 의 ON CONFLICT 동작은
+    한 건씩 넣던 때와 같습니다. 최근 7일 안에 이미 들어간 세션은 DB 에서 anti-join 으로 걸러내므로
+    사용자 갱신에만 쓰입니다.
+    page_lists / session_metrics 를 넘기면 impressions 와 체류시간 등도 같이 저장합니다.
+    이때 이미 있던 세션이라도 impressions 가 비어 있었으면 채우고 체류시간 등도 다시 씁니다.
+
+    :return: {이번에 clarity_session_data 를 새로 넣거나 impressions 를 채운 세션 clarity_id : clarity_session_list.idx}
+    """
+    if not session_list:
+        return {}
+    with_impressions = page_lists is not None
+    records = []
+    for i, row in enumerate(session_list): # 클래리티 return 할 때 9시간 더해서 줌
+        session_id = str(row['sessionId'])
+        record = (
+            str(row['userId']),
+            session_id,
+            datetime.fromtimestamp(row['sessionStart']/1000),
+            row['deviceModel'],
+            row['osVersion'],
+            row['country'],
+            row['device'],
+            row['browserName'],
+            json.dumps(row,ensure_ascii=False)
+        )
+        if with_impressions:
+            record += (*session_metrics[i], json.dumps(page_lists[i],ensure_ascii=False))
+        records.append(record)
+
+    columns = list(STAGING_COLUMNS)
+    session_columns = ['created_at', 'device_model', 'os_version', 'country', 'device', 'browser_name']
+    session_updates = ['created_at = excluded.created_at']
+    data_columns = ['data']
+    data_conflict = 'DO NOTHING'
+    if with_impressions:
+        columns += METRIC_COLUMNS + ['impressions']
+        session_columns += METRIC_COLUMNS
+        session_updates += [f'{column} = excluded.{column}' for column in METRIC_COLUMNS]
+        data_columns += ['impressions']
+        data_conflict = (
+            'DO UPDATE SET impressions = excluded.impressions '
+            'WHERE clarity_session_data.impressions IS NULL'
+        )
+
+    async with transaction(conn):
+        await conn.execute(
+            """
+                CREATE TEMP TABLE tmp_clarity_session (
+                    user_clarity_id text,
+                    clarity_id text,
+                    created_at timestamp,
+                    device_model text,
+                    os_version text,
+                    country text,
+                    device text,
+                    browser_name text,
+                    data json,
+                    duration bigint,
+                    active_duration bigint,
+                    page_count integer,
+                    click_count integer,
+                    impressions json
+                ) ON COMMIT DROP
+            """
+        )
+        await conn.copy_records_to_table(
+            'tmp_clarity_session', records=records, columns=columns
+        )
+        await conn.execute(
+            """
+                INSERT INTO clarity_user_list
+                (clarity_id, created_at, updated_at)
+                SELECT user_clarity_id, min(created_at), max(created_at)
+                FROM tmp_clarity_session
+                GROUP BY user_clarity_id
+                ON CONFLICT(clarity_id)
+                DO UPDATE SET updated_at = excluded.updated_at
+            """
+        )
+        await conn.execute(
+            f"""
+                INSERT INTO clarity_session_list
+                (user_idx, clarity_id, {', '.join(session_columns)})
+                SELECT DISTINCT ON (t.clarity_id)
+                    u.idx, t.clarity_id, {', '.join(['t.'+column for column in session_columns])}
+                FROM tmp_clarity_session AS t
+                JOIN clarity_user_list AS u
+                ON u.clarity_id = t.user_clarity_id
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM clarity_session_list AS already
+                    WHERE already.clarity_id = t.clarity_id
+                    AND already.created_at > now() - interval '7 day'
+                )
+                ORDER BY t.clarity_id, t.created_at
+                ON CONFLICT(clarity_id)
+                DO UPDATE SET {', '.join(session_updates)}
+            """
+        )
+        # DO UPDATE ... WHERE 는 실제로 바뀐 row 만 RETURNING 하므로 새로 넣거나 채운 세션만 돌아옴
+        rows = await conn.fetch(
+            f"""
+                WITH filled AS (
+                    INSERT INTO clarity_session_data (session_idx, {', '.join(data_columns)})
+                    SELECT DISTINCT ON (s.idx) s.idx, {', '.join(['t.'+column for column in data_columns])}
+                    FROM tmp_clarity_session AS t
+                    JOIN clarity_session_list AS s
+                    ON s.clarity_id = t.clarity_id
+                    ON CONFLICT(session_idx)
+                    {data_conflict}
+                    RETURNING session_idx
+                )
+                SELECT s.idx, s.clarity_id
+                FROM filled AS f
+                JOIN clarity_session_list AS s
+                ON s.idx = f.session_idx
+            """
+        )
+        if with_impressions and rows:
+            # 7일 anti-join 으로 걸러진 세션도 impressions 를 채웠으면 체류시간 등을 같이 맞춤
+            await conn.execute(
+                f"""
+                    UPDATE clarity_session_list AS s
+                    SET {', '.join([f'{column} = t.{column}' for column in METRIC_COLUMNS])}
+                    FROM (
+                        SELECT DISTINCT ON (clarity_id) clarity_id, {', '.join(METRIC_COLUMNS)}
+                        FROM tmp_clarity_session
+                        ORDER BY clarity_id, created_at
+                    ) AS t
+                    WHERE t.clarity_id = s.clarity_id
+                    AND s.idx = ANY($1::bigint[])
+                """,[row['idx'] for row in rows]
+            )
+    return {row['clarity_id'] : row['idx'] for row in rows}
@@ -0,0 +1,57 @@
+import glob
+import json
+import os
+from common.segment_store import SegmentStore
+from .init import LIST_STORE_PATH, SESSION_STORE_PATH
+
+LEGACY_LIST_PATH = './output/clarity/list'
+LEGACY_SESSION_PATH = './output/clarity/session'
+
+
+async def run():
+    """예전 output/clarity/{list,session} JSON spool 을 segment store 로 한 번만 옮깁니다.
+
+    list store 에 이미 있는 날짜는 건너뛰고, session store 에 없는 세션만 옮깁니다.
+    다 옮기면 list store meta 에 legacy_imported 를 남기므로 다시 실행해도 아무것도 하지 않습니다.
+    """
+    list_store = SegmentStore(LIST_STORE_PATH)
+    session_store = SegmentStore(SESSION_STORE_PATH)
+    meta = list_store.get_meta()
+    if meta.get('legacy_imported'):
+        print('clarity legacy spool 이미 옮김')
+        return
+
+    last_date = meta.get('last_date')
+    list_count = 0
+    with list_store.writer() as writer:
+        for filename in sorted(glob.glob(f'{LEGACY_LIST_PATH}/*.json')):
+            log_date = os.path.basename(filename).split('.')[0]
+            if last_date and log_date <= last_date:
+                continue
+            with open(filename,'rt') as f:
+                session_list = json.loads(f.read())
+            for row in session_list:
+                writer.append(row['sessionId'], row)
+            list_count += len(session_list)
+            last_date = log_date
+    if last_date:
+        meta['last_date'] = last_date
+    list_store.set_meta(meta)
+
+    session_count = 0
+    with session_store.writer() as writer:
+        for filename in glob.iglob(f'{LEGACY_SESSION_PATH}/*.json'):
+            session_id = os.path.basename(filename).split('.')[0]
+            if session_id in session_store:
+                continue
+            with open(filename,'rt') as f:
+                writer.append(session_id, json.loads(f.read()))
+            session_count += 1
+            if session_count % 10000 == 0:
+                writer.checkpoint()
+                print(f'{session_count} 완료')
+
+    list_store.set_meta({**list_store.get_meta(), 'legacy_imported' : True})
+    list_store.close()
+    session_store.close()
+    print(f'clarity legacy spool 세션 목록 {list_count}개 / 세션 상세 {session_count}개 옮김')
@@ -0,0 +1,52 @@
+PAGE_HIDDEN = 'Page hidden'
+PAGE_VISIBLE = 'Page visible'
+CLICK = 'Click'
+
+
+def compute_page_metrics(page):
+    """페이지 하나의 (체류시간, 활성 체류시간, 클릭 수)
+
+        - 활성 체류시간 = duration - (Page hidden ~ Page visible 구간)
+        - 마지막이 Page hidden 이면 페이지가 끝날 때까지를 숨김 구간으로 봅니다.
+        - 앞선 Page hidden 없이 Page visible 이 오면 0 부터 숨김 구간으로 봅니다.
+    """
+    duration = page['duration']
+    active_duration = duration
+    click_count = 0
+    hidden_start = 0
+    for event in page['timelineEvents']:
+        event_type = event['eventtype']
+        if event_type == PAGE_HIDDEN:
+            hidden_start = event['start']
+        elif event_type == PAGE_VISIBLE:
+            active_duration -= event['start'] - hidden_start
+            hidden_start = 0
+        elif event_type == CLICK:
+            click_count += 1
+    if hidden_start:
+        active_duration -= duration - hidden_start
+    return duration, active_duration, click_count
+
+
+def compute_metrics(session_page_lists):
+    """여러 세션의 impressions 로 페이지별 / 세션별 체류시간, 활성 체류시간, 클릭 수를 계산합니다.
+
+    이벤트 dict 를 한 번씩 읽는 시간이 대부분이라 배열로 옮기는 것보다 한 번에 도는 것이 빠릅니다.
+
+    :param session_page_lists: 세션별 page_list(impressions) 목록
+    :return: (page_metrics, session_metrics)
+        - page_metrics: 세션별 [(duration, active_duration, click_count), ...]
+        - session_metrics: 세션별 (duration, active_duration, page_count, click_count)
+    """
+    page_metrics = []
+    session_metrics = []
+    for page_list in session_page_lists:
+        pages = [compute_page_metrics(page) for page in page_list or []]
+        total_duration = total_active_duration = total_click_count = 0
+        for duration, active_duration, click_count in pages:
+            total_duration += duration
+            total_active_duration += active_duration
+            total_click_count += click_count
+        page_metrics.append(pages)
+        session_metrics.append((total_duration, total_active_duration, len(pages), total_click_count))
+    return page_metrics, session_metrics
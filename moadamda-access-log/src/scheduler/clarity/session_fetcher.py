@@ -0,0 +1,30 @@
+from datetime import datetime,timedelta
+from conf.settings import settings
+from common import pipeline
+
+BATCH_SIZE = 200
+
+
+async def fetch_session_info(clarity, sessions, on_batch, batch_size=BATCH_SIZE):
+    """세션 상세(impressions)를 CLARITY_WORKER_COUNT 개의 worker 로 나눠 가져옵니다.
+
+    sessions 는 (key, 세션 목록 row) 의 iterable 이고,
+    on_batch 는 [(key, row, page_list), ...] 를 받아 한 번에 저장합니다.
+    on_batch 가 끝난 batch 만 저장된 것이므로 중간에 멈춰도 다음 실행에서 이어서 처리됩니다.
+    """
+    async def fetch(session):
+        _, row = session
+        start_date = datetime.fromtimestamp(row['sessionStart']/1000)
+        end_date = start_date + timedelta(seconds=row['sessionDuration']+1)
+        return await clarity.get_session_info(row['userId'],row['sessionId'],start_date, end_date)
+
+    async def write(batch):
+        await on_batch([(key, row, page_list) for (key, row), page_list in batch])
+
+    await pipeline.run_pipeline(
+        sessions,
+        fetch,
+        settings.CLARITY_WORKER_COUNT,
+        on_batch=write,
+        batch_size=batch_size
+    )
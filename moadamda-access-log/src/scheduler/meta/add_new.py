@@ -2,7 +2,7 @@ from core.meta import Meta
 from core.postgres import connection,transaction
 from datetime import datetime,timedelta
 from urllib.parse import urlparse, parse_qs
-from common import utils
+from common import utm_resolver
 
 async def run():
     meta = Meta()
@@ -113,7 +113,7 @@ async def run():
                     WHERE idx = $7
                 """,utm_source,utm_medium,utm_campaign,utm_content,utm_term,utm_id,ad['idx']
             )
-            utm_idx = await utils.add_ad(
+            utm_idx = await utm_resolver.resolver.resolve(
                 conn,
                 utm_source,
                 utm_medium,
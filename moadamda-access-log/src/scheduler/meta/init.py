@@ -2,6 +2,7 @@ from core.meta import Meta
 from core.postgres import connection,transaction
 from datetime import datetime,timedelta
 from urllib.parse import urlparse, parse_qs
+from common import utm_resolver
 
 async def run():
     meta = Meta()
@@ -120,15 +121,7 @@ async def run():
             """
         )
 
-        utm_data = await conn.fetch(
-            """
-                SELECT idx, hash FROM ad_utm_info
-            """
-        )
-        utm_data = {
-            row['hash'] : row['idx']
-            for row in utm_data
-        }
+        utm_data = await utm_resolver.resolver.refresh(conn)
         meta_ad_data = await conn.fetch(
             """
                 SELECT md5(utm_source || utm_medium || utm_campaign || ad_name || utm_term) as hash, max(idx) as idx
@@ -1,21 +1,23 @@
-import pandas as pd
 import openpyxl
 from openpyxl.styles import Alignment
-import imgkit
-from PIL import Image
+from openpyxl.cell import WriteOnlyCell
 import io
+import csv
 import json
+import zlib
+import orjson
 from datetime import datetime, timedelta
 from conf.settings import settings
 from server.api.model import Model
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
-from core.postgres import connection
+from core.postgres import connection, export_connection
 import traceback
 import asyncio
 from core.cafe24 import Cafe24
 from core.ga4 import GA4
-from common import utils
+from core import slack
+from common import utils, purchase_image, traffic_counter, live_feed, topk
+from common.identity_graph import graph as identity_graph
+from common.pipeline import run_pipeline
 
 
 class Controller():
@@ -61,23 +63,29 @@ t_section', 'elements': [{'type': 'emoji', 'name': 'gift', 'unicode': '1f381'},
             url = '&'.join([row for row in url.split('&') if 'crema-product-reviews' not in row])
         unquote_url = utils.ununquote(url)
         unquote_referer = utils.ununquote(referer)
+        live_feed.feed.record_access(log_type, unquote_url)
+        # 쿠키는 한 번만 파싱해서 식별값 컬럼을 같이 저장
+        cookies_dict, identity = utils.parse_cookies(cookies)
         if log_type == 'enter':
             await self.model.add_access_log(
-                unquote_url,unquote_referer,user_agent,client_ip,cookies, device, navigation_type
+                unquote_url,unquote_referer,user_agent,client_ip,cookies, device, navigation_type, identity
             )
+            traffic_counter.counter.record(unquote_url, identity[0])
+            topk.tracker.record(unquote_url, unquote_referer)
         else:
             try:
-                cookies_dict = json.loads(cookies)
                 mduuid = cookies_dict['_mdUUID']
                 log_list = await self.model.get_access_log(referer, unquote_referer, mduuid)
                 for row in log_list:
                     if row and (row['url'] == url or row['url'] == unquote_url):
-                        await self.model.update_access_log(row['idx'],cookies)
+                        await self.model.update_access_log(row['idx'],cookies,identity)
                         return
                 else:
                     await self.model.add_access_log(
-                        unquote_url,unquote_referer,user_agent,client_ip,cookies, device, navigation_type
+                        unquote_url,unquote_referer,user_agent,client_ip,cookies, device, navigation_type, identity
                     )
+                    traffic_counter.counter.record(unquote_url, identity[0])
+                    topk.tracker.record(unquote_url, unquote_referer)
                     print(datetime.now())
                     print(url)
                     print(mduuid)
@@ -87,50 +95,100 @@ t_section', 'elements': [{'type': 'emoji', 'name': 'gift', 'unicode': '1f381'},
     async def add_error_log(
         self, url, message,source,lineno,colno,stack
     ):
+        live_feed.feed.record_error()
         await self.model.add_error_log(url, message, source, lineno, colno, stack)
 
     async def get_log(
-        self, start_date, end_date
+        self, start_date, end_date, sparse=False
     ):
+        """기간 내 utm 유입 수를 {날짜 : [0~23시 [utm 별 count, ...]]} 로 리턴합니다.
 
-        response = {}
-        fbclid_set = set()
+        :param sparse: True 면 각 시간에 유입이 있는 utm 만 넣고,
+            False 면 기존처럼 기간 내 모든 utm 을 count 0 으로 채워서 넣습니다.
+        """
         start_date = datetime.strptime(start_date,'%Y-%m-%d')
         end_date = datetime.strptime(end_date,'%Y-%m-%d')
+        # 닫힌 시간은 utm_hourly_rollup 에서, 그 뒤는 access_log 에서 읽음
+        closed_until = await self.model.get_utm_rollup_closed_until()
+        if closed_until is None or closed_until <= start_date:
+            count_list = await self.model.get_utm_hourly_count(start_date, end_date, closed_until)
+        else:
+            split_date = min(closed_until, end_date)
+            count_list = list(await self.model.get_utm_hourly_rollup(start_date, split_date))
+            if split_date < end_date:
+                count_list += await self.model.get_utm_hourly_count(split_date, end_date, closed_until)
+        return self._make_log_response(start_date, end_date, count_list, sparse)
+
+    def _make_log_response(self, start_date, end_date, count_list, sparse):
+        response = {}
         for n in range((end_date - start_date).days):
             current_date = start_date + timedelta(days=n)
             response[current_date.strftime('%Y-%m-%d')] = [{} for _ in range(24)]
-        log_list = await self.model.get_access_log_for_analysis(start_date, end_date)
-        key_set = set()
-        for row in log_list:
-            row = dict(row)
-            fbclid = row.pop('fbclid','')
-            if not fbclid:
-                fbclid = row['ip']+row['url']
-            if fbclid in fbclid_set:
+        utm_dict = {}
+        for row in count_list:
+            access_date = row['access_hour'].strftime('%Y-%m-%d')
+            if access_date not in response:
                 continue
-            fbclid_set.add(fbclid)
-            row['utm_content'] = (row.get('utm_content','') or '').replace('+',' ')
-            key = f'{row["utm_source"]}{row["utm_campaign"]}{row["utm_medium"]}{row["utm_content"]}'
-            access_date = row['access_date'].strftime('%Y-%m-%d')
-            access_hour = row['access_date'].hour
-            if key not in key_set:
-                for d,hour_list in response.items():
-                    for data in hour_list:
-                        data[key] = {
-                            'utm_source' : row['utm_source'],
-                            'utm_campaign' : row['utm_campaign'],
-                            'utm_medium' : row['utm_medium'],
-                            'utm_content' : row['utm_content'],
-                            'count' : 0
-                        }
-            key_set.add(key)
-            response[access_date][access_hour][key]['count'] += 1
+            key = (row['utm_source'], row['utm_campaign'], row['utm_medium'], row['utm_content'])
+            if key not in utm_dict:
+                utm_dict[key] = {
+                    'utm_source' : row['utm_source'],
+                    'utm_campaign' : row['utm_campaign'],
+                    'utm_medium' : row['utm_medium'],
+                    'utm_content' : row['utm_content']
+                }
+            response[access_date][row['access_hour'].hour][key] = row['count']
         for d,hour_list in response.items():
-            response[d] = [list(row.values()) for row in hour_list]
-            pass
+            if sparse:
+                response[d] = [
+                    [{**utm_dict[key], 'count' : count} for key, count in hour_counts.items()]
+                    for hour_counts in hour_list
+                ]
+            else:
+                response[d] = [
+                    [{**utm, 'count' : hour_counts.get(key, 0)} for key, utm in utm_dict.items()]
+                    for hour_counts in hour_list
+                ]
         return response
 
+    EXPORT_COLUMNS = [
+        'idx', 'ip', 'user_agent', 'url', 'referer_url', 'access_date', 'end_date',
+        'cookies', 'device', 'navigation_type'
+    ]
+    EXPORT_CHUNK_SIZE = 256 * 1024
+
+    async def export_access_log(self, start_date, end_date, output_format, filters):
+        """access_log 를 NDJSON 또는 CSV 로 만들어 gzip 으로 압축한 조각을 차례로 yield 합니다.
+
+        export 전용 풀의 연결에서 커서로 읽고 EXPORT_CHUNK_SIZE 만큼 모일 때마다 내보내므로
+        기간이 길어도 메모리 사용량은 일정합니다.
+        """
+        start_date = datetime.strptime(start_date,'%Y-%m-%d')
+        end_date = datetime.strptime(end_date,'%Y-%m-%d')
+        compressor = zlib.compressobj(wbits=31) # gzip 형식
+        buffer = io.StringIO()
+        csv_writer = None
+        if output_format == 'csv':
+            csv_writer = csv.writer(buffer)
+            csv_writer.writerow(self.EXPORT_COLUMNS)
+        async with export_connection() as conn:
+            async for row in Model(conn).iter_access_log(start_date, end_date, filters):
+                if csv_writer:
+                    csv_writer.writerow([row[column] for column in self.EXPORT_COLUMNS])
+                else:
+                    row = dict(row)
+                    if row['cookies'] is not None:
+                        row['cookies'] = orjson.Fragment(row['cookies'])
+                    buffer.write(orjson.dumps(row).decode())
+                    buffer.write('\n')
+                if buffer.tell() >= self.EXPORT_CHUNK_SIZE:
+                    chunk = compressor.compress(buffer.getvalue().encode())
+                    buffer.seek(0)
+                    buffer.truncate()
+                    if chunk:
+                        yield chunk
+        yield compressor.compress(buffer.getvalue().encode()) + compressor.flush()
+
     async def add_options(self):
         return
         UNIT_COUNT = 100
@@ -169,105 +227,127 @@ t_section', 'elements': [{'type': 'emoji', 'name': 'gift', 'unicode': '1f381'},
                     ]
                 )
                 pass
+    STATUS_HEADER = ['날짜','아이피','이름','구매 금액','환경','채널','캠페인','이전 구매 기록','동일 쿠키 유입경로','동일 아이피 유입경로','이동경로']
+    STATUS_COLUMN_WIDTHS = [19,15,10,10,10,10,20,100,100,100,100]
+    STATUS_WRAP_COLUMNS = 4 # 마지막 4개 컬럼(이력)은 왼쪽 위 정렬
+
     async def send_status(
-        self,
+        self, target_date=None
     ):
+        """target_date(없으면 어제) 하루의 구매 통계 엑셀을 만들어 슬랙으로 보냅니다."""
+        if target_date is None:
+            target_date = datetime.now() - timedelta(days=1)
+        await self._send_status_reports([target_date])
+
+    async def backfill_status(self, start_date, end_date):
+        """start_date 부터 end_date 전날까지 날짜별 구매 통계를 한 번에 만들어 보냅니다."""
+        start_date = datetime.strptime(start_date,'%Y-%m-%d')
+        end_date = datetime.strptime(end_date,'%Y-%m-%d')
+        await self._send_status_reports(
+            [start_date + timedelta(days=n) for n in range((end_date - start_date).days)]
+        )
 
-        workbook = openpyxl.Workbook()
-        sheet = workbook.active
-        sheet.append(['날짜','아이피','이름','구매 금액','환경','채널','캠페인','이전 구매 기록','동일 쿠키 유입경로','동일 아이피 유입경로','이동경로'])
+    async def _send_status_reports(self, date_list):
+        date_list = [datetime(row.year, row.month, row.day) for row in date_list]
+        order_items = []
         async with connection() as pg:
-            self.pg = pg
-            self.model = Model(pg)
-            self.cafe24 = Cafe24()
-            start_date = datetime.now() - timedelta(days=1)
-            end_date = datetime.now()
-            order_list = await self.model.get_order_success_list(
-                datetime(start_date.year, start_date.month, start_date.day),
-                datetime(end_date.year, end_date.month, end_date.day),
-            )
-            for url in order_list:
-                try:
-                    order_id = url['url'].split('order_id=')[1]
-                    (
-                        order_info,
-                        user_data,
-                        access_date,
-                        ip,
-                        device,
-                        name,
-                        order_price,
-                        order_history,
-                        ip_campaign_history,
-                        uuid_campaign_history,
-                        page_move_history
-                    ) = await self._get_order_info(order_id)
-                    max_date = ''
-                    max_data = ''
-                    if len(ip_campaign_history) > 1:
-                        max_date = ip_campaign_history[-1][0]
-                        max_data = ip_campaign_history[-1][1]
-                    if len(uuid_campaign_history) > 1:
-                        _max_date = uuid_campaign_history[-1][0]
-                        _max_data = uuid_campaign_history[-1][1]
-                        if not max_date or datetime.strptime(max_date,'%Y-%m-%d %H:%M:%S') < datetime.strptime(_max_date,'%Y-%m-%d %H:%M:%S'):
-                            max_date = _max_date
-                            max_data = _max_data
-                    utm_source = ''
-                    utm_campaign = ''
-                    if max_data:
-                        utms = max_data.split('/')
-                        utm_source = utms[0]
-                        utm_campaign = utms[1]
-                    sheet.append([
-                        access_date,ip,
-                        name,order_price,
-                        device,utm_source,utm_campaign,
-                        '\n'.join(['    '.join([str(col) for col in row]) for row in order_history[1:]]),
-                        '\n'.join(['    '.join([str(col) for col in row]) for row in uuid_campaign_history[1:]]),
-                        '\n'.join(['    '.join([str(col) for col in row]) for row in ip_campaign_history[1:]]),
-                        '\n'.join(['    '.join([str(col) for col in row]) for row in page_move_history[1:]])
-                    ])
-                except:
-                    pass
-
-        # 줄바꿈 설정
-        for col in ['H', 'I', 'J', 'K']:  # '동일 쿠키 유입경로', '동일 아이피 유입경로' 컬럼 인덱스
-            col_idx = openpyxl.utils.cell.column_index_from_string(col)
-            for row in range(2, len(order_list) + 1):
-                cell = sheet.cell(row=row, column=col_idx)
-                cell.alignment = Alignment(wrap_text=True)
-
-        # 컬럼 너비 자동 조정 (선택사항)
-        col_widthes = [19,15,10,10,10,10,20,100,100,100,100]
-        i = 0
-        for col in sheet.columns:
-            column = col[0].column_letter  # Get the column name
-            sheet.column_dimensions[column].width = col_widthes[i]
-            i += 1
-
-        # 모든 셀 상하, 좌우 가운데 정렬 설정
-        alignment_hor_center = Alignment(horizontal='center', vertical='top', wrap_text=True)
-        alignment_all_center = Alignment(horizontal='center', vertical='center', wrap_text=True)
-        i = 0
-        for row in sheet.iter_rows():
-            for cell in row:
-                if i == 0:
-                    cell.alignment = alignment_hor_center
-                else:
-                    if cell.column_letter in ['H', 'I', 'J', 'K']:
-                        cell.alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
-                    else:
-                        cell.alignment = alignment_all_center
-            i += 1
-        file_path = f'{start_date.strftime('%Y-%m-%d')}_구매통계.xlsx'
-        workbook.save(file_path)
-        client = WebClient(token=settings.SLACK_BOT_TOKEN)
-        image_res = client.files_upload_v2(
-            channel=settings.SLACK_STATUS_CHANNEL_ID,
-            file=file_path,
-            title=file_path
+            model = Model(pg)
+            for start_date in date_list:
+                order_list = await model.get_order_success_list(start_date, start_date + timedelta(days=1))
+                for url in order_list:
+                    if 'order_id=' in url['url']:
+                        order_items.append((start_date, url['url'].split('order_id=')[1]))
+
+        # 모든 날짜의 주문을 하나의 pipeline 에서 REPORT_WORKER_COUNT 개씩 동시에 조회
+        # (주문마다 연결을 따로 잡으므로 날짜 수와 관계없이 동시에 쓰는 연결 수가 일정함, 실패한 주문은 빠짐)
+        results = await run_pipeline(
+            order_items,
+            lambda item: self._get_status_row(item[1]),
+            settings.REPORT_WORKER_COUNT
         )
+        rows_by_date = {start_date : [] for start_date in date_list}
+        for (start_date, _), row in results:
+            rows_by_date[start_date].append(row)
+        for start_date, rows in rows_by_date.items():
+            file_path = f'{start_date.strftime('%Y-%m-%d')}_구매통계.xlsx'
+            content = self._make_status_workbook(rows)
+            image_res = await slack.sender.upload_file(
+                channel=settings.SLACK_STATUS_CHANNEL_ID,
+                content=content,
+                filename=file_path,
+                title=file_path
+            )
+
+    async def _get_status_row(self, order_id):
+        async with connection() as pg:
+            controller = Controller(pg)
+            (
+                order_info,
+                user_data,
+                access_date,
+                ip,
+                device,
+                name,
+                order_price,
+                order_history,
+                ip_campaign_history,
+                uuid_campaign_history,
+                page_move_history
+            ) = await controller._get_order_info(order_id)
+        max_date = ''
+        max_data = ''
+        if len(ip_campaign_history) > 1:
+            max_date = ip_campaign_history[-1][0]
+            max_data = ip_campaign_history[-1][1]
+        if len(uuid_campaign_history) > 1:
+            _max_date = uuid_campaign_history[-1][0]
+            _max_data = uuid_campaign_history[-1][1]
+            if not max_date or datetime.strptime(max_date,'%Y-%m-%d %H:%M:%S') < datetime.strptime(_max_date,'%Y-%m-%d %H:%M:%S'):
+                max_date = _max_date
+                max_data = _max_data
+        utm_source = ''
+        utm_campaign = ''
+        if max_data:
+            utms = max_data.split('/')
+            utm_source = utms[0]
+            utm_campaign = utms[1]
+        return [
+            access_date,ip,
+            name,order_price,
+            device,utm_source,utm_campaign,
+            '\n'.join(['    '.join([str(col) for col in row]) for row in order_history[1:]]),
+            '\n'.join(['    '.join([str(col) for col in row]) for row in uuid_campaign_history[1:]]),
+            '\n'.join(['    '.join([str(col) for col in row]) for row in ip_campaign_history[1:]]),
+            '\n'.join(['    '.join([str(col) for col in row]) for row in page_move_history[1:]])
+        ]
+
+    def _make_status_workbook(self, rows):
+        """구매 통계 엑셀을 write-only 모드로 쓰면서 셀 서식을 같이 지정하고 bytes 로 리턴합니다."""
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        for i, width in enumerate(self.STATUS_COLUMN_WIDTHS):
+            sheet.column_dimensions[openpyxl.utils.get_column_letter(i+1)].width = width
+
+        header_alignment = Alignment(horizontal='center', vertical='top', wrap_text=True)
+        center_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+        history_alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
+        history_start = len(self.STATUS_HEADER) - self.STATUS_WRAP_COLUMNS
+
+        def make_cell(value, alignment):
+            cell = WriteOnlyCell(sheet, value=value)
+            cell.alignment = alignment
+            return cell
+
+        sheet.append([make_cell(value, header_alignment) for value in self.STATUS_HEADER])
+        for row in rows:
+            sheet.append([
+                make_cell(value, history_alignment if i >= history_start else center_alignment)
+                for i, value in enumerate(row)
+            ])
+        output = io.BytesIO()
+        workbook.save(output)
+        return output.getvalue()
+
     async def process_slack_message(
         self,ts,text,channel
     ):
@@ -295,7 +375,10 @@ t_section', 'elements': [{'type': 'emoji', 'name': 'gift', 'unicode': '1f381'},
                 ip_campaign_history,
                 uuid_campaign_history,
                 page_move_history
-            ) = await self._get_order_info(order_id)
+            ) = await self._get_order_info(
+                order_id,
+                refresh='무통장 입금 결제 완료' in text # 입금 후에는 주문 정보가 바뀌므로 다시 계산
+            )
 
             if (
                 (
@@ -319,8 +402,7 @@ t_section', 'elements': [{'type': 'emoji', 'name': 'gift', 'unicode': '1f381'},
                 else:
                     print('_ga 값 없음')
             if '무통장 입금 결제 완료' in text:
-                client = WebClient(token=settings.SLACK_BOT_TOKEN)
-                chat_res = client.chat_postMessage(
+                chat_res = await slack.sender.post_message(
                     channel=channel,
                     thread_ts=ts,
                     text='무통장입금 GA 전송 완료'
@@ -331,7 +413,7 @@ t_section', 'elements': [{'type': 'emoji', 'name': 'gift', 'unicode': '1f381'},
                 clarity_id = clck.split('|')[0]
             else:
                 clarity_id = ''
-            await self.make_image(
+            image = await self.make_image(
                 access_date,
                 ip, device,
                 order_price,
@@ -350,24 +432,55 @@ t_section', 'elements': [{'type': 'emoji', 'name': 'gift', 'unicode': '1f381'},
                 page_move_history,
                 clarity_id
             )
-            try:
-                client = WebClient(token=settings.SLACK_BOT_TOKEN)
-                image_res = client.files_upload_v2(
-                    channel=channel,
-                    file='purchase_info.png',
-                    title='구매정보 분석',
-                    thread_ts=ts
-                )
-                chat_res = client.chat_postMessage(
-                    channel=channel,
-                    thread_ts=ts,
-                    text='분석완료',
-                    blocks=blocks
-                )
-            except SlackApiError as e:
-                traceback.print_exc()
+            # SlackApiError 는 잡지 않고 JobWorker 로 넘겨 실패 처리 / 재시도하게 함
+            image_res = await slack.sender.upload_file(
+                channel=channel,
+                content=image,
+                filename=f'purchase_info_{order_id}.png',
+                title='구매정보 분석',
+                thread_ts=ts
+            )
+            chat_res = await slack.sender.post_message(
+                channel=channel,
+                thread_ts=ts,
+                text='분석완료',
+                blocks=blocks
+            )
+
+    SNAPSHOT_FIELDS = [
+        'order_info', 'user_data', 'access_date', 'ip', 'device', 'name', 'order_price',
+        'order_history', 'ip_campaign_history', 'uuid_campaign_history', 'page_move_history'
+    ]
+
+    async def _get_order_info(self, order_id, refresh=False):
+        """주문의 유입 분석 결과를 리턴합니다.
+
+        order_attribution_snapshot 에 저장된 결과가 있으면 그대로 쓰고, 없거나 refresh 면 다시 계산해서 저장합니다.
+        """
+        if not refresh:
+            snapshot = await self.model.get_attribution_snapshot(order_id)
+            if snapshot:
+                return self._load_snapshot(snapshot)
+        res = await self._compute_order_info(order_id)
+        await self.model.put_attribution_snapshot(order_id, self._dump_snapshot(res))
+        return res
+
+    async def invalidate_order_info(self, order_id):
+        return await self.model.delete_attribution_snapshot(order_id)
 
-    async def _get_order_info(self, order_id):
+    def _dump_snapshot(self, res):
+        data = dict(zip(self.SNAPSHOT_FIELDS, res))
+        data['access_date'] = data['access_date'].isoformat()
+        data['user_data'] = {**data['user_data'], 'access_date' : data['user_data']['access_date'].isoformat()}
+        return json.dumps(data,ensure_ascii=False)
+
+    def _load_snapshot(self, snapshot):
+        data = json.loads(snapshot)
+        data['access_date'] = datetime.fromisoformat(data['access_date'])
+        data['user_data']['access_date'] = datetime.fromisoformat(data['user_data']['access_date'])
+        return tuple([data[field] for field in self.SNAPSHOT_FIELDS])
+
+    async def _compute_order_info(self, order_id):
         order_info = await self.cafe24.get_order_info(order_id)
         order_price = "{:,}".format(int(order_info['order']['initial_order_amount']['order_price_amount'].split('.')[0]))
         uuid = ''
@@ -392,6 +505,13 @@ t_section', 'elements': [{'type': 'emoji', 'name': 'gift', 'unicode': '1f381'},
                 user_data = await self.model.get_user_info_from_order_id(order_id)
             if not user_data and i == 2 and order_info['order']['member_id']:
                 user_data = await self.model.get_user_info_from_member_id(order_info['order']['member_id'])
+                if not user_data:
+                    # 회원 id 로 남은 기록이 없으면 같은 방문자로 묶인 다른 _mdUUID 의 기록을 찾음
+                    member_uuids = await identity_graph.resolve_members(
+                        self.pg, 'member', order_info['order']['member_id'], 'uuid'
+                    )
+                    if member_uuids:
+                        user_data = await self.model.get_user_info_from_uuids(member_uuids)
             if not user_data:
                 await asyncio.sleep(i+1)
                 continue
@@ -407,10 +527,31 @@ t_section', 'elements': [{'type': 'emoji', 'name': 'gift', 'unicode': '1f381'},
         device = user_data['device']
 
         order_history = await self._get_order_history(order_info['order']['member_id'],order_id)
-        ip_history = await self.model.get_access_log_from_ip(ip)
+        since = datetime.now() - timedelta(days=settings.VISITOR_TIMELINE_DAYS)
+        ip_history = await self.model.get_visitor_timeline(
+            ip=ip, since=since, limit=settings.VISITOR_TIMELINE_LIMIT
+        )
         ip_campaign_history = await self._get_campaign_history(ip_history)
-        uuid_history = await self.model.get_access_log_from_uuid(uuid)
-        uuid_campaign_history = await self._get_campaign_history(uuid_history)
+        uuid_history = await self.model.get_visitor_timeline(
+            uuid=uuid, since=since, limit=settings.VISITOR_TIMELINE_LIMIT
+        )
+        # 유입 경로는 같은 방문자로 묶인 다른 기기 / 브라우저의 _mdUUID 기록까지 포함
+        visitor_uuids = await identity_graph.resolve_members(self.pg, 'uuid', uuid, 'uuid') or [uuid]
+        if len(visitor_uuids) > 1:
+            visitor_history = await self.model.get_visitor_timeline(
+                uuid=visitor_uuids, since=since, limit=settings.VISITOR_TIMELINE_LIMIT
+            )
+        else:
+            visitor_history = uuid_history
+        # 세션으로 묶인 기간은 visit_session 의 유입 utm 을, 아직 묶이지 않은 최근 기록은 페이지 단위로 읽음
+        session_watermark = await self.model.get_session_watermark()
+        visitor_sessions = await self.model.get_visitor_sessions(
+            visitor_uuids, since=since, limit=settings.VISITOR_TIMELINE_LIMIT
+        )
+        uuid_campaign_history = self._get_session_campaign_history(visitor_sessions)
+        uuid_campaign_history += (await self._get_campaign_history(
+            [row for row in visitor_history if row['idx'] > session_watermark]
+        ))[1:]
         page_move_history = await self._get_page_move_history(uuid_history)
         return (
             order_info,
@@ -425,6 +566,86 @@ t_section', 'elements': [{'type': 'emoji', 'name': 'gift', 'unicode': '1f381'},
             uuid_campaign_history,
             page_move_history
         )
+    async def get_visitor_timeline(self, ip, uuid, days, limit, before_idx):
+        """방문자 타임라인 한 페이지와 다음(이전 기록) 페이지를 읽을 before_idx 를 리턴합니다."""
+        since = datetime.now() - timedelta(days=days) if days else None
+        rows = await self.model.get_visitor_timeline(
+            ip=ip, uuid=uuid, since=since, limit=limit, before_idx=before_idx
+        )
+        return {
+            'rows' : [dict(row) for row in rows],
+            'next_before_idx' : rows[0]['idx'] if len(rows) == limit else None
+        }
+
+    async def get_live_traffic(self, minutes):
+        """실시간 utm 별 유입 수와 고유 방문자(_mdUUID) 근사값을 리턴합니다.
+
+        :param minutes: 0 이면 현재 시간(hour), 아니면 현재 분을 포함한 최근 minutes 분
+        """
+        now = datetime.now()
+        if minutes:
+            granularity = 'minute'
+            end_date = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+            start_date = end_date - timedelta(minutes=minutes)
+        else:
+            granularity = 'hour'
+            start_date = now.replace(minute=0, second=0, microsecond=0)
+            end_date = start_date + timedelta(hours=1)
+        merged = await traffic_counter.counter.query(self.pg, granularity, start_date, end_date)
+        rows = []
+        total_count = 0
+        total_uniques = None
+        for utm, (count, uniques) in sorted(merged.items(), key=lambda item: -item[1][0]):
+            rows.append({
+                **{key : value or None for key, value in zip(traffic_counter.UTM_KEYS, utm)},
+                'count' : count,
+                'uniques' : uniques.count()
+            })
+            total_count += count
+            total_uniques = uniques.copy() if total_uniques is None else total_uniques.merge(uniques)
+        return {
+            'start_date' : start_date.strftime('%Y-%m-%d %H:%M:%S'),
+            'end_date' : end_date.strftime('%Y-%m-%d %H:%M:%S'),
+            'count' : total_count,
+            'uniques' : total_uniques.count() if total_uniques is not None else 0,
+            'rows' : rows
+        }
+
+    async def get_topk(self, dimension, windows, limit):
+        """최근 windows 개 구간(TOPK_WINDOW_MINUTES, 현재 구간 포함)에서 많이 들어온 값 상위 limit 개를 리턴합니다.
+
+        count 는 실제 횟수 이상이고, count - error 는 실제 횟수 이하입니다.
+        """
+        window_minutes = settings.TOPK_WINDOW_MINUTES
+        end_date = topk.tracker.window_start(datetime.now()) + timedelta(minutes=window_minutes)
+        start_date = end_date - timedelta(minutes=window_minutes * windows)
+        sketch = await topk.tracker.query(self.pg, dimension, start_date, end_date)
+        return {
+            'start_date' : start_date.strftime('%Y-%m-%d %H:%M:%S'),
+            'end_date' : end_date.strftime('%Y-%m-%d %H:%M:%S'),
+            'rows' : [
+                {'value' : value, 'count' : count, 'error' : error}
+                for value, count, error in sketch.top(limit)
+            ]
+        }
+
+    async def get_campaign_attribution(self, start_date, end_date, model):
+        """기간(end_date 전날까지) 주문의 utm 별 기여 전환 수 / 매출을 리턴합니다."""
+        rows = await self.model.get_campaign_attribution(
+            datetime.strptime(start_date,'%Y-%m-%d').date(),
+            datetime.strptime(end_date,'%Y-%m-%d').date(),
+            model
+        )
+        return [dict(row) for row in rows]
+
+    async def get_visitor_identity(self, kind, value):
+        """식별값이 속한 방문자(root)와 같은 방문자로 묶인 식별값 목록을 리턴합니다."""
+        root = await identity_graph.resolve(self.pg, kind, value)
+        return {
+            'visitor' : root,
+            'members' : identity_graph.get_members(root) if root else []
+        }
+
     async def _get_order_history(self, member_id, order_id):
         res = [['날짜','상품명','금액']]
         if not member_id:
@@ -479,6 +700,21 @@ t_section', 'elements': [{'type': 'emoji', 'name': 'gift', 'unicode': '1f381'},
                 ]
             )
         return response
+    def _get_session_campaign_history(self, sessions):
+        response = [['날짜','캠페인 명']]
+        for session in sessions:
+            if not session['utm_content']:
+                continue
+            source, campaign, content = [
+                utils.ununquote(session[key] or '') for key in ['utm_source','utm_campaign','utm_content']
+            ]
+            response.append(
+                [
+                    session['started_at'].strftime("%Y-%m-%d %H:%M:%S"),
+                    f'{source}/{campaign}/{content}'
+                ]
+            )
+        return response
     async def _get_campaign_history(self, history):
         already_link_set = set()
         response = [['날짜','캠페인 명']]
@@ -513,7 +749,8 @@ t_section', 'elements': [{'type': 'emoji', 'name': 'gift', 'unicode': '1f381'},
         uuid_history,
         page_move_history
     ):
-        data = {
+        """구매 정보 이미지를 만들어 PNG bytes 로 리턴합니다."""
+        sections = {
             "구매 정보": [
                 ["구매 날짜", access_date],
                 ["아이피", ip],
@@ -525,19 +762,7 @@ t_section', 'elements': [{'type': 'emoji', 'name': 'gift', 'unicode': '1f381'},
             "동일 아이피 유입 기록": ip_history,
             "페이지 이동 경로": page_move_history
         }
-        html = "<html><head><style>body {font-family: 'Nanum Gothic', 'Noto Sans CJK KR', sans-serif;} table {border-collapse: collapse; width: 100%; word-wrap: break-word;} th, td {border: 1px solid black; padding: 8px; text-align: left;} th {background-color: #f2f2f2;}</style></head><body>"
-
-        for title, rows in data.items():
-            df = pd.DataFrame(rows)
-            html += f"<h2>{title}</h2>"
-            html += df.to_html(index=False, header=False)
-
-        html += "</body></html>"
-
-        img = imgkit.from_string(html, False)
-        image = Image.open(io.BytesIO(img))
-
-        image.save("purchase_info.png")
+        return await purchase_image.render(sections)
 
     async def make_slack_block(
         self,
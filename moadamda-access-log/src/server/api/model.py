@@ -1,20 +1,46 @@
+import time
 from asyncpg import Connection
 from asyncpg.exceptions import UniqueViolationError
 
+IDENTITY_COLUMNS = {'md_uuid' : 'md_uuid', 'login_id' : 'login_id', 'member_id' : 'member_id'}
+# cookie_backfill 이 끝나기 전에는 기존 row 의 식별값 컬럼이 비어 있으므로 cookies 에서 찾음
+IDENTITY_COOKIE_EXPRESSIONS = {
+    'md_uuid' : "cookies->>'_mdUUID'",
+    'login_id' : "cookies->>'_LOGINID'",
+    'member_id' : "cookies->'login_provider_1'->>'member_id'",
+}
+BACKFILL_CHECK_SECONDS = 60 # cookie_backfill 완료 여부를 다시 확인하는 간격(초)
+backfill_state = {'done' : False, 'checked_at' : None}
+
 
 class Model():
     def __init__(self, pg: Connection):
         self.pg = pg
+    async def identity_columns(self):
+        """식별값으로 찾을 때 쓸 식. cookie_backfill 이 한 번 끝까지 돈 뒤에만 컬럼을 씁니다."""
+        if not backfill_state['done'] and (
+            backfill_state['checked_at'] is None
+            or time.monotonic() - backfill_state['checked_at'] >= BACKFILL_CHECK_SECONDS
+        ):
+            backfill_state['done'] = bool(await self.pg.fetchval(
+                """
+                    SELECT closed_until IS NOT NULL FROM job_watermark WHERE name = 'access_log_cookie_columns'
+                """
+            ))
+            backfill_state['checked_at'] = time.monotonic()
+        return IDENTITY_COLUMNS if backfill_state['done'] else IDENTITY_COOKIE_EXPRESSIONS
     async def add_access_log(
-        self,url,referer,user_agent,client_ip,cookies, device,navigation_type
+        self,url,referer,user_agent,client_ip,cookies, device,navigation_type, identity
     ):
+        """:param identity: utils.parse_cookies 의 (md_uuid, login_id, member_id, ga_id, clck)"""
         await self.pg.execute(
             """
                 INSERT INTO access_log
-                (ip,user_agent,url,referer_url,access_date,cookies, device, navigation_type)
+                (ip,user_agent,url,referer_url,access_date,cookies, device, navigation_type,
+                md_uuid, login_id, member_id, ga_id, clck)
                 VALUES
-                ($1,$2,$3,$4,now(),$5,$6,$7)
-            """,client_ip,user_agent,url,referer,cookies, device,navigation_type
+                ($1,$2,$3,$4,now(),$5,$6,$7,$8,$9,$10,$11,$12)
+            """,client_ip,user_agent,url,referer,cookies, device,navigation_type, *identity
         )
     async def get_access_log(
         self, referer_url, unquote_referer_url, mduuid
@@ -45,24 +71,26 @@ class Model():
         #             ORDER BY idx DESC LIMIT 1
         #         """,mduuid
         #     )
+        columns = await self.identity_columns()
         access_log = await self.pg.fetch(
-            """
+            f"""
                 SELECT * FROM access_log
-                WHERE cookies->>'_mdUUID' = $1
+                WHERE {columns['md_uuid']} = $1
                 ORDER BY idx DESC LIMIT 5
             """,mduuid
         )
         return access_log
 
     async def update_access_log(
-        self, log_idx, cookies
+        self, log_idx, cookies, identity
     ):
         await self.pg.execute(
             """
                 UPDATE access_log
-                SET end_date = now(), cookies = $1
+                SET end_date = now(), cookies = $1,
+                md_uuid = $3, login_id = $4, member_id = $5, ga_id = $6, clck = $7
                 WHERE idx = $2
-            """,cookies,log_idx
+            """,cookies,log_idx,*identity
         )
     async def get_access_log_for_analysis(self, start_date, end_date):
         return await self.pg.fetch(
@@ -81,6 +109,103 @@ class Model():
                 FROM access_log where url like '%utm_source=%' and url not like '%{{%' and access_date > $1 and access_date <= $2
             """,start_date, end_date
         )
+    async def get_utm_hourly_count(self, start_date, end_date, seen_until=None):
+        """utm 유입을 시간 단위로 집계합니다.
+
+        fbclid (없으면 ip + url) 가 같은 유입은 기간 전체에서 가장 먼저 들어온 한 건만 셉니다.
+        유입이 있는 (시간, utm) 조합만 리턴합니다.
+
+        :param seen_until: 주면 이 시간 전에 utm_hourly_rollup 에서 이미 센 유입은 뺍니다.
+        """
+        return await self.pg.fetch(
+            """
+                SELECT
+                    date_trunc('hour', access_date) AS access_hour,
+                    utm_source,
+                    utm_campaign,
+                    utm_medium,
+                    utm_content,
+                    count(*) AS count
+                FROM (
+                    SELECT DISTINCT ON (dedup_key)
+                        dedup_key, access_date, utm_source, utm_campaign, utm_medium, utm_content
+                    FROM (
+                        SELECT
+                            coalesce(
+                                nullif(substring(url FROM 'fbclid=([^&]+)'), ''),
+                                coalesce(ip, '') || url
+                            ) AS dedup_key,
+                            substring(url FROM 'utm_source=([^&]+)') AS utm_source,
+                            substring(url FROM 'utm_campaign=([^&]+)') AS utm_campaign,
+                            substring(url FROM 'utm_medium=([^&]+)') AS utm_medium,
+                            replace(coalesce(substring(url FROM 'utm_content=([^&]+)'), ''), '+', ' ') AS utm_content,
+                            access_date
+                        FROM access_log
+                        WHERE url like '%utm_source=%' and url not like '%{{%'
+                        and access_date >= $1 and access_date < $2
+                    ) AS utm_log
+                    ORDER BY dedup_key, access_date
+                ) AS first_log
+                WHERE $3::timestamp IS NULL OR NOT EXISTS (
+                    SELECT 1 FROM utm_traffic_seen AS seen
+                    WHERE seen.dedup_key = md5(first_log.dedup_key)
+                    AND seen.access_hour < $3
+                )
+                GROUP BY 1, 2, 3, 4, 5
+                ORDER BY 1
+            """,start_date, end_date, seen_until
+        )
+    async def get_utm_rollup_closed_until(self):
+        """utm_hourly_rollup 이 빠짐없이 집계된 시간 (이 시간 전까지)"""
+        return await self.pg.fetchval(
+            """
+                SELECT closed_until FROM job_watermark WHERE name = 'utm_hourly_rollup'
+            """
+        )
+    async def get_utm_hourly_rollup(self, start_date, end_date):
+        """utm_hourly_rollup 에서 get_utm_hourly_count 와 같은 형태로 읽습니다."""
+        return await self.pg.fetch(
+            """
+                SELECT
+                    access_hour,
+                    nullif(utm_source, '') AS utm_source,
+                    nullif(utm_campaign, '') AS utm_campaign,
+                    nullif(utm_medium, '') AS utm_medium,
+                    utm_content,
+                    count
+                FROM utm_hourly_rollup
+                WHERE access_hour >= $1 and access_hour < $2
+                ORDER BY access_hour
+            """,start_date, end_date
+        )
+    async def iter_access_log(self, start_date, end_date, filters, prefetch=2000):
+        """기간 내 access_log 를 서버 측 커서로 idx 순서대로 읽습니다.
+
+        읽는 동안 트랜잭션을 잡고 있으므로 export 전용 연결에서만 사용합니다.
+
+        :param filters: {utm_source / utm_medium / utm_campaign / utm_content / device / navigation_type : 값}
+        """
+        conditions = ['access_date >= $1', 'access_date < $2']
+        params = [start_date, end_date]
+        for key, value in filters.items():
+            if value is None:
+                continue
+            params.append(value)
+            if key.startswith('utm_'):
+                conditions.append(f"substring(url FROM '{key}=([^&]+)') = ${len(params)}")
+            else:
+                conditions.append(f'{key} = ${len(params)}')
+        query = f"""
+            SELECT
+                idx, ip, user_agent, url, referer_url, access_date, end_date,
+                cookies::text AS cookies, device, navigation_type
+            FROM access_log
+            WHERE {' AND '.join(conditions)}
+            ORDER BY idx
+        """
+        async with self.pg.transaction(readonly=True):
+            async for row in self.pg.cursor(query, *params, prefetch=prefetch):
+                yield row
     async def add_error_log(self, url, message, source, lineno, colno, stack):
         await self.pg.execute(
             """
@@ -93,21 +218,37 @@ class Model():
     async def get_user_info_from_uuid(
         self, uuid
     ):
+        columns = await self.identity_columns()
         row = await self.pg.fetchrow(
-            """
-                SELECT ip, cookies, cookies->>'_mdUUID' as uuid, device, access_date
+            f"""
+                SELECT ip, cookies, {columns['md_uuid']} as uuid, device, access_date
                 FROM access_log
-                WHERE cookies->>'_mdUUID' = $1
+                WHERE {columns['md_uuid']} = $1
                 ORDER BY idx DESC LIMIT 1
             """,uuid
         )
         return row
+    async def get_user_info_from_uuids(
+        self, uuids
+    ):
+        columns = await self.identity_columns()
+        row = await self.pg.fetchrow(
+            f"""
+                SELECT ip, cookies, {columns['md_uuid']} as uuid, device, access_date
+                FROM access_log
+                WHERE {columns['md_uuid']} = ANY($1::text[])
+                AND access_date > now() - interval '3 hour'
+                ORDER BY idx DESC LIMIT 1
+            """,uuids
+        )
+        return row
     async def get_user_info_from_order_id(
         self, order_id
     ):
+        columns = await self.identity_columns()
         row = await self.pg.fetchrow(
-            """
-                SELECT ip, cookies, cookies->>'_mdUUID' as uuid, device, access_date
+            f"""
+                SELECT ip, cookies, {columns['md_uuid']} as uuid, device, access_date
                 FROM access_log
                 WHERE url like $1 AND url like '%order_result%'
                 AND access_date > now() - interval '3 hour'
@@ -116,8 +257,8 @@ class Model():
         )
         if not row:
             row = await self.pg.fetchrow(
-            """
-                SELECT ip, cookies->>'_mdUUID' as uuid, device, access_date
+            f"""
+                SELECT ip, cookies, {columns['md_uuid']} as uuid, device, access_date
                 FROM access_log
                 WHERE url like $1
                 AND access_date > now() - interval '3 hour'
@@ -128,41 +269,97 @@ class Model():
     async def get_user_info_from_member_id(
         self, member_id
     ):
+        columns = await self.identity_columns()
         row = await self.pg.fetchrow(
-            """
-                SELECT ip, cookies, cookies->>'_mdUUID' as uuid, device, access_date
+            f"""
+                SELECT ip, cookies, {columns['md_uuid']} as uuid, device, access_date
                 FROM access_log
-                WHERE cookies->>'_LOGINID' = $1
+                WHERE {columns['login_id']} = $1
                 AND access_date > now() - interval '3 hour'
                 ORDER BY idx DESC LIMIT 1
             """,member_id
         )
         if not row:
             row = await self.pg.fetchrow(
-                """
-                    SELECT ip, cookies, cookies->>'_mdUUID' as uuid, device, access_date
+                f"""
+                    SELECT ip, cookies, {columns['md_uuid']} as uuid, device, access_date
                     FROM access_log
-                    WHERE cookies->'login_provider_1'->>'member_id' = $1
+                    WHERE {columns['member_id']} = $1
                     AND access_date > now() - interval '3 hour'
                     ORDER BY idx DESC LIMIT 1
                 """,member_id
             )
         return row
-    async def get_access_log_from_ip(self, ip):
-        return await self.pg.fetch(
+    async def get_visitor_timeline(
+        self, ip=None, uuid=None, since=None, limit=500, before_idx=None
+    ):
+        """ip 또는 _mdUUID 의 방문 기록 중 최근 limit 개를 idx 오름차순으로 리턴합니다.
+
+        (ip, idx) / (md_uuid, idx) 인덱스를 역순으로 읽으므로 기록이 많은 ip 도 limit 만큼만 읽습니다.
+        cookie_backfill 이 끝나기 전에는 (cookies->>'_mdUUID', idx) 인덱스를 씁니다.
+
+        :param uuid: _mdUUID 하나 또는 같은 방문자로 묶인 _mdUUID 목록
+        :param since: 이 시간 이후 기록만
+        :param before_idx: 이 idx 보다 앞의 기록만 (이전 페이지를 읽을 때 첫 row 의 idx 를 넘김)
+        """
+        if ip is not None:
+            condition = 'ip = $1'
+            value = ip
+        elif isinstance(uuid, list):
+            condition = f"{(await self.identity_columns())['md_uuid']} = ANY($1::text[])"
+            value = uuid
+        else:
+            condition = f"{(await self.identity_columns())['md_uuid']} = $1"
+            value = uuid
+        rows = await self.pg.fetch(
+            f"""
+                SELECT idx, access_date, end_date, url, navigation_type FROM access_log
+                WHERE {condition}
+                AND ($2::timestamp IS NULL OR access_date >= $2)
+                AND ($3::bigint IS NULL OR idx < $3)
+                ORDER BY idx DESC
+                LIMIT $4
+            """,value,since,before_idx,limit
+        )
+        return list(reversed(rows))
+    async def get_visitor_sessions(self, uuids, since=None, limit=500):
+        """_mdUUID 목록의 visit_session 중 최근 limit 개를 시작 시간 오름차순으로 리턴합니다."""
+        rows = await self.pg.fetch(
             """
-                SELECT access_date, end_date, url, navigation_type FROM access_log
-                WHERE ip = $1
-                ORDER BY idx ASC
-            """,ip
+                SELECT
+                    md_uuid, start_log_idx, end_log_idx, started_at, ended_at, page_count,
+                    entry_url, exit_url, utm_source, utm_medium, utm_campaign, utm_content
+                FROM visit_session
+                WHERE md_uuid = ANY($1::text[])
+                AND ($2::timestamp IS NULL OR started_at >= $2)
+                ORDER BY started_at DESC
+                LIMIT $3
+            """,uuids,since,limit
         )
-    async def get_access_log_from_uuid(self, uuid):
+        return list(reversed(rows))
+    async def get_session_watermark(self):
+        """visit_session 에 반영된 마지막 access_log idx"""
+        return await self.pg.fetchval(
+            """
+                SELECT last_idx FROM job_watermark WHERE name = 'visit_session'
+            """
+        ) or 0
+    async def get_campaign_attribution(self, start_date, end_date, model):
+        """campaign_attribution 을 기간 동안 utm 별로 합칩니다."""
         return await self.pg.fetch(
             """
-                SELECT access_date, end_date, url, navigation_type FROM access_log
-                WHERE cookies->>'_mdUUID' = $1
-                ORDER BY idx ASC
-            """,uuid
+                SELECT
+                    nullif(utm_source, '') AS utm_source,
+                    nullif(utm_medium, '') AS utm_medium,
+                    nullif(utm_campaign, '') AS utm_campaign,
+                    nullif(utm_content, '') AS utm_content,
+                    sum(conversions) AS conversions,
+                    sum(revenue) AS revenue
+                FROM campaign_attribution
+                WHERE order_date >= $1 AND order_date < $2 AND model = $3
+                GROUP BY 1, 2, 3, 4
+                ORDER BY revenue DESC, conversions DESC
+            """,start_date,end_date,model
         )
     async def get_order_success_list(self, start_date, end_date):
         return await self.pg.fetch(
@@ -174,4 +371,27 @@ class Model():
                 AND access_date < $2
             """,start_date,end_date
         )
-
+    async def get_attribution_snapshot(self, order_id):
+        return await self.pg.fetchval(
+            """
+                SELECT data FROM order_attribution_snapshot WHERE order_id = $1
+            """,order_id
+        )
+    async def put_attribution_snapshot(self, order_id, data):
+        await self.pg.execute(
+            """
+                INSERT INTO order_attribution_snapshot
+                (order_id, data, created_at, updated_at)
+                VALUES
+                ($1, $2, now(), now())
+                ON CONFLICT(order_id)
+                DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+            """,order_id,data
+        )
+    async def delete_attribution_snapshot(self, order_id):
+        res = await self.pg.execute(
+            """
+                DELETE FROM order_attribution_snapshot WHERE order_id = $1
+            """,order_id
+        )
+        return res != 'DELETE 0'
@@ -4,12 +4,17 @@ import asyncio
 from datetime import datetime
 from typing import Any, Optional, Union
 
-from fastapi import APIRouter, Body, Depends, Form, Header, Query, Request, BackgroundTasks
+from fastapi import APIRouter, Body, Depends, Form, Header, Path, Query, Request, BackgroundTasks
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 
+from common import live_feed, metrics, topk
+from common.response_cache import ResponseCache
+from conf.settings import settings
+from core import job_queue
 from core.postgres import return_connection as pg_connection, connection
 from server.api.controller import Controller
+from server.error_handler import AppError, AppErrorCode
 
 
 async def get_controller(
@@ -18,6 +23,8 @@ async def get_controller(
     return Controller(pg)
 
 router = APIRouter()
+SLACK_ORDER_QUEUE = 'slack_order'
+log_cache = ResponseCache(settings.LOG_CACHE_MAX_ENTRIES)
 
 @router.post('/access')
 async def add_access_log(
@@ -56,13 +63,128 @@ async def test(controller: Controller = Depends(get_controller)):
 async def get_log(
     start_date: str,
     end_date: str,
+    sparse: bool = Query(False),
+):
+    # 지난 날짜만 포함된 기간은 계속 캐시하고, 오늘이 포함되면 LOG_CACHE_TTL 동안만 캐시
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    if datetime.strptime(end_date,'%Y-%m-%d') <= today:
+        ttl = None
+    else:
+        ttl = settings.LOG_CACHE_TTL
+
+    async def compute():
+        async with connection() as conn:
+            return await Controller(conn).get_log(start_date, end_date, sparse)
+
+    body = await log_cache.get_or_compute((start_date, end_date, sparse), compute, ttl)
+    return Response(content=body, media_type='application/json')
+
+@router.get('/export/access_log/{start_date}/{end_date}')
+async def export_access_log(
+    start_date: str,
+    end_date: str,
+    output_format: str = Query('ndjson', alias='format', pattern='^(ndjson|csv)$'),
+    utm_source: Optional[str] = Query(None),
+    utm_medium: Optional[str] = Query(None),
+    utm_campaign: Optional[str] = Query(None),
+    utm_content: Optional[str] = Query(None),
+    device: Optional[str] = Query(None),
+    navigation_type: Optional[str] = Query(None),
+):
+    datetime.strptime(start_date,'%Y-%m-%d')
+    datetime.strptime(end_date,'%Y-%m-%d')
+    filters = {
+        'utm_source' : utm_source,
+        'utm_medium' : utm_medium,
+        'utm_campaign' : utm_campaign,
+        'utm_content' : utm_content,
+        'device' : device,
+        'navigation_type' : navigation_type
+    }
+    controller = Controller(None)
+    filename = f'access_log_{start_date}_{end_date}.{output_format}.gz'
+    return StreamingResponse(
+        controller.export_access_log(start_date, end_date, output_format, filters),
+        media_type='application/gzip',
+        headers={'Content-Disposition' : f'attachment; filename="{filename}"'}
+    )
+
+@router.get('/traffic/live')
+async def get_live_traffic(
+    minutes: int = Query(0, ge=0, le=120),
+    controller: Controller = Depends(get_controller)
+):
+    return await controller.get_live_traffic(minutes)
+
+@router.get('/topk/{dimension}')
+async def get_topk(
+    dimension: str = Path(..., pattern=f'^({"|".join(topk.DIMENSIONS)})$'),
+    windows: int = Query(1, ge=1, le=168),
+    limit: int = Query(20, ge=1, le=200),
     controller: Controller = Depends(get_controller)
 ):
-    return await controller.get_log(start_date, end_date)
+    return await controller.get_topk(dimension, windows, limit)
+
+@router.get('/live')
+async def get_live_feed(request: Request):
+    return StreamingResponse(
+        live_feed.feed.stream(request),
+        media_type='text/event-stream',
+        headers={'Cache-Control' : 'no-cache', 'X-Accel-Buffering' : 'no'}
+    )
+
+@router.get('/metrics')
+async def get_metrics():
+    return PlainTextResponse(metrics.render())
 
 @router.get('/status')
-async def testt(controller: Controller = Depends(get_controller)):
-    await controller.send_status()
+async def testt(
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None),
+):
+    controller = Controller(None)
+    if start_date and end_date:
+        await controller.backfill_status(start_date, end_date)
+    else:
+        await controller.send_status()
+
+@router.get('/visitor/timeline')
+async def get_visitor_timeline(
+    ip: Optional[str] = Query(None),
+    uuid: Optional[str] = Query(None),
+    days: int = Query(90, ge=0),
+    limit: int = Query(200, ge=1, le=1000),
+    before_idx: Optional[int] = Query(None),
+    controller: Controller = Depends(get_controller)
+):
+    if not ip and not uuid:
+        raise AppError(AppErrorCode.PARAMETER_REQUIRED, description='ip 또는 uuid 가 필요합니다.')
+    return await controller.get_visitor_timeline(ip, uuid, days, limit, before_idx)
+
+@router.get('/visitor/identity')
+async def get_visitor_identity(
+    kind: str = Query(..., pattern='^(uuid|member|ga|clarity)$'),
+    value: str = Query(...),
+    controller: Controller = Depends(get_controller)
+):
+    return await controller.get_visitor_identity(kind, value)
+
+@router.get('/attribution/campaign/{start_date}/{end_date}')
+async def get_campaign_attribution(
+    start_date: str,
+    end_date: str,
+    model: str = Query('last_touch', pattern='^(last_touch|first_touch|linear|time_decay)$'),
+    controller: Controller = Depends(get_controller)
+):
+    return await controller.get_campaign_attribution(start_date, end_date, model)
+
+@router.delete('/attribution/{order_id}')
+async def invalidate_attribution(
+    order_id: str,
+    controller: Controller = Depends(get_controller)
+):
+    deleted = await controller.invalidate_order_info(order_id)
+    return JSONResponse(content={"deleted": deleted})
 
 @router.get('/add_options')
 async def add_options(controller: Controller = Depends(get_controller)):
@@ -83,10 +205,26 @@ async def slack_events(
     except:
         pass
     print(data)
+    # 같은 메시지(ts)는 슬랙이 재전송해도 한 번만 처리되도록 대기열에 넣음
+    async with connection() as conn:
+        await job_queue.enqueue(
+            conn,
+            SLACK_ORDER_QUEUE,
+            data['event']['ts'],
+            {
+                'ts' : data['event']['ts'],
+                'text' : data['event']['text'],
+                'channel' : data['event']['channel']
+            }
+        )
+    return JSONResponse(content={"status": "ok"})
+
+
+async def process_slack_order(payload):
+    """slack_order 대기열 작업 처리"""
     controller = Controller(None)
-    asyncio.create_task(controller.process_slack_message(
-        data['event']['ts'],
-        data['event']['text'],
-        data['event']['channel']
-    ))
-    return JSONResponse(content={"status": "ok"})
\ No newline at end of file
+    await controller.process_slack_message(
+        payload['ts'],
+        payload['text'],
+        payload['channel']
+    )
\ No newline at end of file
@@ -9,9 +9,12 @@ import uvicorn
 from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
-from core import postgres
+from common import live_feed, topk, traffic_counter
+from core import job_queue, postgres, slack
+from conf.settings import settings
 from core.cafe24 import Cafe24
-from server.api.router import router as api_router
+from core.ga4 import GA4Dispatcher
+from server.api.router import router as api_router, SLACK_ORDER_QUEUE, process_slack_order
 from server.error_handler import AppError, AppErrorHandler
 
 logger = logging.getLogger(__name__)
@@ -75,10 +78,26 @@ async def _init():
     await postgres.init_pool()
     asyncio.create_task(token_refresh_task())
     logger.info("Cafe24 토큰 자동 갱신 백그라운드 태스크 시작")
+    worker = job_queue.JobWorker(
+        SLACK_ORDER_QUEUE, process_slack_order, settings.SLACK_JOB_CONCURRENCY
+    )
+    app.state.job_workers = [
+        asyncio.create_task(worker.run()),
+        asyncio.create_task(GA4Dispatcher().run()),
+        asyncio.create_task(traffic_counter.counter.run()),
+        asyncio.create_task(live_feed.feed.run()),
+        asyncio.create_task(topk.tracker.run()),
+    ]
+    logger.info("슬랙 주문 알림 / GA4 전송 대기열 / 실시간 유입 카운터 / 실시간 피드 / 상위 url worker 시작")
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    for task in app.state.job_workers:
+        task.cancel()
+    # 실시간 유입 카운터의 마지막 flush 등 worker 정리가 끝난 뒤 연결을 닫음
+    await asyncio.gather(*app.state.job_workers, return_exceptions=True)
+    await slack.sender.close()
     await postgres.release_pool()
 
 def run_debug():
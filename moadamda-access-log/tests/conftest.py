@@ -0,0 +1,13 @@
+import os
+import sys
+from pathlib import Path
+
+# src 의 모듈을 import 할 수 있도록 경로와 settings 필수 환경 변수를 채움 (DB 에는 연결하지 않음)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+for name in [
+    'LOG_FILE_PATH', 'POSTGRES_PASSWORD', 'POSTGRES_USER', 'POSTGRES_DB', 'POSTGRES_HOSTNAME',
+    'SLACK_BOT_TOKEN', 'CAFE24_AUTH_KEY', 'SLACK_STATUS_CHANNEL_ID', 'SESSION_OPTION_NAME',
+    'GA4_MEASUREMENT_ID', 'GA4_API_SECRET', 'CLARITY_COOKIE', 'CLARITY_CSRF', 'CLARITY_ID',
+    'META_APP_ID', 'META_APP_SECRET', 'META_ACCESS_TOKEN', 'META_AD_ACCOUNT_ID',
+]:
+    os.environ.setdefault(name, 'test')
@@ -0,0 +1,91 @@
+import importlib.util
+import random
+from pathlib import Path
+
+# scheduler 패키지를 import 하면 settings(환경 변수)가 필요하므로 모듈 파일만 불러옴
+MODULE_PATH = Path(__file__).resolve().parents[1] / 'src' / 'scheduler' / 'clarity' / 'impression_metrics.py'
+spec = importlib.util.spec_from_file_location('impression_metrics', MODULE_PATH)
+impression_metrics = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(impression_metrics)
+
+EVENT_TYPES = ['Page hidden', 'Page visible', 'Click', 'Scroll', 'Resize']
+EVENT_WEIGHTS = [1, 1, 6, 10, 2]
+
+
+def reference_page_metrics(page):
+    """기존 페이지 단위 계산 (검증 기준)"""
+    duration = page['duration']
+    active_duration = page['duration']
+    click_count = 0
+    hidden_start = 0
+    for event in page['timelineEvents']:
+        if event['eventtype'] == 'Page hidden':
+            hidden_start = event['start']
+        elif event['eventtype'] == 'Page visible':
+            active_duration -= event['start'] - hidden_start
+            hidden_start = 0
+        elif event['eventtype'] == 'Click':
+            click_count += 1
+    if hidden_start:
+        active_duration -= duration - hidden_start
+    return duration, active_duration, click_count
+
+
+def make_page(duration, events):
+    return {'duration' : duration, 'timelineEvents' : [{'start' : start, 'eventtype' : event_type} for start, event_type in events]}
+
+
+def make_sessions(session_count, seed):
+    rand = random.Random(seed)
+    sessions = []
+    for _ in range(session_count):
+        page_list = []
+        for _ in range(rand.randint(0, 8)):
+            duration = rand.randint(0, 600000)
+            starts = sorted(rand.randint(0, duration) for _ in range(rand.randint(0, 40)))
+            page_list.append(make_page(duration, zip(starts, rand.choices(EVENT_TYPES, EVENT_WEIGHTS, k=len(starts)))))
+        sessions.append(page_list)
+    return sessions
+
+
+def test_hidden_until_end():
+    page = make_page(1000, [(100, 'Click'), (400, 'Page hidden')])
+    assert impression_metrics.compute_page_metrics(page) == (1000, 400, 1)
+
+
+def test_hidden_then_visible():
+    page = make_page(1000, [(200, 'Page hidden'), (500, 'Page visible'), (600, 'Click'), (700, 'Click')])
+    assert impression_metrics.compute_page_metrics(page) == (1000, 700, 2)
+
+
+def test_visible_without_hidden():
+    page = make_page(1000, [(300, 'Page visible'), (400, 'Scroll')])
+    assert impression_metrics.compute_page_metrics(page) == (1000, 700, 0)
+
+
+def test_empty_sessions():
+    page_metrics, session_metrics = impression_metrics.compute_metrics([[], None])
+    assert page_metrics == [[], []]
+    assert session_metrics == [(0, 0, 0, 0), (0, 0, 0, 0)]
+
+
+def test_session_totals():
+    page_list = [
+        make_page(1000, [(400, 'Page hidden')]),
+        make_page(500, [(100, 'Click'), (200, 'Click')]),
+    ]
+    page_metrics, session_metrics = impression_metrics.compute_metrics([page_list])
+    assert page_metrics == [[(1000, 400, 0), (500, 500, 2)]]
+    assert session_metrics == [(1500, 900, 2, 2)]
+
+
+def test_matches_reference():
+    sessions = make_sessions(2000, seed=0)
+    page_metrics, session_metrics = impression_metrics.compute_metrics(sessions)
+    expected_pages = [[reference_page_metrics(page) for page in page_list] for page_list in sessions]
+    expected_sessions = [
+        (sum(row[0] for row in pages), sum(row[1] for row in pages), len(pages), sum(row[2] for row in pages))
+        for pages in expected_pages
+    ]
+    assert page_metrics == expected_pages
+    assert session_metrics == expected_sessions
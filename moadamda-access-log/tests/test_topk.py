@@ -0,0 +1,58 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from common import topk
+from conf.settings import settings
+
+
+class FakeConnection:
+    """topk_snapshot 만 흉내 내는 연결"""
+    def __init__(self):
+        self.rows = {} # (dimension, window_start, worker_id) : data
+
+    async def executemany(self, query, args):
+        for dimension, window_start, worker_id, data in args:
+            self.rows[(dimension, window_start, worker_id)] = data
+
+    async def execute(self, query, *args):
+        pass
+
+    async def fetch(self, query, dimension, start_date, end_date):
+        return [
+            {'worker_id' : worker_id, 'window_start' : window_start, 'data' : data}
+            for (row_dimension, window_start, worker_id), data in self.rows.items()
+            if row_dimension == dimension and start_date <= window_start < end_date
+        ]
+
+
+def counts(sketch):
+    return {item : count for item, count, _ in sketch.top(10)}
+
+
+def test_query_includes_own_flushed_windows():
+    window = timedelta(minutes=settings.TOPK_WINDOW_MINUTES)
+    now = datetime.now()
+    old_date = now - window * (topk.MEMORY_WINDOWS + 2)
+    conn = FakeConnection()
+    tracker = topk.TopKTracker()
+    other = topk.TopKTracker()
+    other.worker_id = 'other:1'
+
+    for _ in range(3):
+        tracker.record('https://moadamda.com/old', None, now=old_date)
+    other.record('https://moadamda.com/old', None, now=old_date)
+    asyncio.run(tracker.flush(conn))
+    asyncio.run(other.flush(conn))
+    # 지난 구간은 메모리에서 정리되고 topk_snapshot 에만 남음
+    assert all(window_start >= tracker.window_start(old_date) + window for _, window_start in tracker.sketches)
+
+    tracker.record('https://moadamda.com/old', None, now=now)
+    tracker.record('https://moadamda.com/now', None, now=now)
+    asyncio.run(tracker.flush(conn))
+    # flush 전 값은 메모리 스케치로만 있음
+    tracker.record('https://moadamda.com/now', None, now=now)
+
+    start_date = tracker.window_start(old_date)
+    end_date = tracker.window_start(now) + window
+    merged = asyncio.run(tracker.query(conn, 'url', start_date, end_date))
+    assert counts(merged) == {'https://moadamda.com/old' : 5, 'https://moadamda.com/now' : 2}